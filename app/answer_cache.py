@@ -0,0 +1,145 @@
+# app/answer_cache.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import copy
+import re
+import threading
+import time
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    # Case, extra spaces and trailing punctuation don't change the question
+    q = " ".join(query.lower().split())
+    return re.sub(r"[\s?!.]+$", "", q)
+
+
+class AnswerCache:
+    """
+    Two-layer cache in front of RagPipeline.answer, scoped per namespace:
+      1. exact match on the normalized query
+      2. near-duplicates: cosine similarity over cached query embeddings >= `similarity`
+    Entries expire after `ttl_s` and the least recently used are evicted beyond `max_items`.
+    Process-local; ingest into a namespace must call invalidate(namespace). Ingest in another
+    process (scripts/bulk_ingest.py, other workers) cannot, so those answers stay until `ttl_s`.
+
+    Each namespace has a generation that invalidate() bumps. Callers read it with generation()
+    before retrieving and hand it to store(), which drops an answer computed before the last
+    invalidation (a query that retrieved just before an ingest finished).
+    """
+
+    def __init__(self, max_items: int = 512, ttl_s: float = 3600.0, similarity: float = 0.95):
+        self.max_items = max_items
+        self.ttl_s = ttl_s
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        # (namespace, normalized query) -> {"result", "vec", "created", "cost_s"}
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        # namespace -> (keys, stacked unit query vectors); rebuilt lazily after changes
+        self._matrices: Dict[str, Tuple[list, np.ndarray]] = {}
+        self._generations: Dict[str, int] = {}
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def lookup(
+        self,
+        namespace: str,
+        query: str,
+        query_vec_fn: Optional[Callable[[], Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return {"result", "kind": "exact"|"semantic", "similarity", "cost_s"} or None.
+        `query_vec_fn` is only called (to embed the query) when the exact layer misses.
+        """
+        key = (namespace, normalize_query(query))
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters["exact_hits"] += 1
+                return self._hit(entry, "exact", 1.0)
+            has_candidates = any(ns == namespace for ns, _ in self._entries)
+
+        if query_vec_fn is None or not has_candidates:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+
+        q = _unit(query_vec_fn())
+        with self._lock:
+            keys, M = self._matrix(namespace)
+            if keys:
+                sims = M @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.similarity and keys[best] in self._entries:
+                    self._entries.move_to_end(keys[best])
+                    self.counters["semantic_hits"] += 1
+                    return self._hit(self._entries[keys[best]], "semantic", float(sims[best]))
+            self.counters["misses"] += 1
+        return None
+
+    def generation(self, namespace: str) -> int:
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def store(self, namespace: str, query: str, result: Dict[str, Any], query_vec=None, cost_s: float = 0.0,
+              generation: int | None = None) -> bool:
+        """Cache `result`; False (not stored) when `namespace` was invalidated since `generation` was read."""
+        key = (namespace, normalize_query(query))
+        with self._lock:
+            if generation is not None and generation != self._generations.get(namespace, 0):
+                return False
+            self._entries[key] = {
+                "result": copy.deepcopy(result),
+                "vec": _unit(query_vec) if query_vec is not None else None,
+                "created": time.time(),
+                "cost_s": cost_s,
+            }
+            self._entries.move_to_end(key)
+            self._matrices.pop(namespace, None)
+            while len(self._entries) > self.max_items:
+                (ns, _), _ = self._entries.popitem(last=False)
+                self._matrices.pop(ns, None)
+            return True
+
+    def invalidate(self, namespace: str) -> int:
+        """Drop every entry for `namespace` and start a new generation; returns how many were removed."""
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            stale = [k for k in self._entries if k[0] == namespace]
+            for k in stale:
+                del self._entries[k]
+            self._matrices.pop(namespace, None)
+            return len(stale)
+
+    # -------- internals (call with lock held) --------
+    def _hit(self, entry: Dict[str, Any], kind: str, similarity: float) -> Dict[str, Any]:
+        return {
+            "result": copy.deepcopy(entry["result"]),
+            "kind": kind,
+            "similarity": similarity,
+            "cost_s": entry["cost_s"],
+        }
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl_s
+        stale = [k for k, e in self._entries.items() if e["created"] < cutoff]
+        for k in stale:
+            del self._entries[k]
+            self._matrices.pop(k[0], None)
+
+    def _matrix(self, namespace: str) -> Tuple[list, np.ndarray]:
+        cached = self._matrices.get(namespace)
+        if cached is None:
+            keys = [k for k, e in self._entries.items() if k[0] == namespace and e["vec"] is not None]
+            M = np.stack([self._entries[k]["vec"] for k in keys]) if keys else np.zeros((0, 1), dtype=np.float32)
+            cached = self._matrices[namespace] = (keys, M)
+        return cached
+
+
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32).reshape(-1)
+    return v / (np.linalg.norm(v) + 1e-12)
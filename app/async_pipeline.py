@@ -0,0 +1,132 @@
+# app/async_pipeline.py
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict
+import asyncio
+import time
+import weakref
+
+from app.config import settings
+from app.pipeline import RagPipeline
+from app.resilience import Deadline
+from app.tracing import span, timed
+
+
+class AsyncRagPipeline:
+    """
+    asyncio front-end for RagPipeline. It runs the same stages and returns the same
+    results and metrics, but many queries can be in flight at once:
+      - blocking provider calls (vector store, rerank, LLM) run in a thread pool, each
+        service behind its own semaphore (settings.async_max_*)
+      - CPU work (query embedding, MMR, prompt building, cache lookups) runs in a small
+        dedicated pool
+    One instance may be used from several event loops (e.g. successive asyncio.run calls):
+    the semaphores are created per loop, so each loop gets the full limits.
+    """
+
+    def __init__(
+        self,
+        pipeline: RagPipeline | None = None,
+        max_vector_queries: int | None = None,
+        max_reranks: int | None = None,
+        max_llm_calls: int | None = None,
+        embed_workers: int | None = None,
+    ):
+        self.sync = pipeline or RagPipeline()
+        n_vector = max_vector_queries or settings.async_max_vector_queries
+        n_rerank = max_reranks or settings.async_max_reranks
+        n_llm = max_llm_calls or settings.async_max_llm_calls
+        self._limits = {"vector": n_vector, "rerank": n_rerank, "llm": n_llm}
+        self._sems: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()  # loop -> {service: Semaphore}
+        self._io_pool = ThreadPoolExecutor(max_workers=n_vector + n_rerank + n_llm, thread_name_prefix="rag-io")
+        self._cpu_pool = ThreadPoolExecutor(
+            max_workers=embed_workers or settings.async_embed_workers, thread_name_prefix="rag-cpu"
+        )
+
+    def _sem(self, service: str) -> asyncio.Semaphore:
+        # asyncio primitives bind to the loop that first waits on them, so build one set per loop
+        loop = asyncio.get_running_loop()
+        sems = self._sems.get(loop)
+        if sems is None:
+            sems = self._sems[loop] = {name: asyncio.Semaphore(n) for name, n in self._limits.items()}
+        return sems[service]
+
+    async def _io(self, service: str, fn, *args, **kwargs):
+        async with self._sem(service):
+            return await asyncio.get_running_loop().run_in_executor(self._io_pool, partial(fn, *args, **kwargs))
+
+    async def _cpu(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._cpu_pool, partial(fn, *args, **kwargs))
+
+    async def retrieve_and_rerank(self, query: str, qvec=None, deadline: Deadline | None = None,
+                                  namespace: str | None = None) -> Dict[str, Any]:
+        """
+        Async twin of RagPipeline.retrieve_and_rerank (same return shape); `qvec` skips the query
+        embed, `deadline` (default: a fresh settings.request_deadline_s) caps the rerank budget.
+        """
+        if deadline is None:
+            deadline = Deadline.start(settings.request_deadline_s)
+        sync = self.sync
+        retriever = sync.retriever
+        timings = {"embed_s": 0.0, "retrieve_s": 0.0, "mmr_s": 0.0, "rerank_s": 0.0}
+        try:
+            if sync._takes_query_vectors():
+                # Embed on the CPU pool so the vector-query slot is only held for the network call
+                if qvec is None:
+                    with timed("query_embed", timings, "embed_s", queries=1):
+                        qvec = (await self._cpu(retriever.embed_array, [query]))[0]
+                # _search_by_vector adds the BM25 side when the retriever has one
+                with timed("vector_query", timings, "retrieve_s", top_k=settings.initial_recall_k) as sp:
+                    hits = await self._io("vector", sync._search_by_vector, query, qvec, namespace)
+                    sp.set(hits=len(hits))
+            else:
+                with timed("vector_query", timings, "retrieve_s", top_k=settings.initial_recall_k):
+                    hits = await self._io("vector", sync._dense_retrieve, query, namespace)
+
+            if not hits:
+                return {"hits": [], "timings": timings, "rerank_used": False}
+
+            diversified = await self._cpu(sync._diversify, hits, timings, namespace)
+            if not diversified:
+                return {"hits": [], "timings": timings, "rerank_used": False}
+            try:
+                reranked = await self._io("rerank", sync._rerank, query, diversified, timings, deadline)
+                return {"hits": reranked, "timings": timings, "rerank_used": True}
+            except Exception as e:
+                return sync._rerank_fallback(diversified, timings, e)
+
+        except Exception as e:
+            # Any unexpected failure -> safe empty result
+            print(f"[ERROR] retrieve_and_rerank crashed: {e}")
+            return {"hits": [], "timings": timings, "rerank_used": False}
+
+    async def answer(self, query: str, namespace: str | None = None) -> Dict[str, Any]:
+        """Async twin of RagPipeline.answer (answer cache included)."""
+        sync = self.sync
+        deadline = Deadline.start(settings.request_deadline_s)
+        with span("answer") as sp:
+            cached, qvec, gen = await self._cpu(sync._cache_lookup, query, namespace=namespace)
+            if cached is not None:
+                sp.set(cache_hit=cached["metrics"]["cache_hit"])
+                return cached
+
+            t1 = time.time()
+            rr = await self.retrieve_and_rerank(query, qvec[0] if qvec else None, deadline, namespace)
+            prep = await self._cpu(sync._build_prompt, query, rr)
+            if prep["messages"] is None:
+                out = prep["result"]
+            else:
+                llm_res = await self._io("llm", sync._generate, prep["messages"], deadline)
+                out = sync._finish(prep, llm_res)
+            await self._cpu(sync._cache_store, query, out, qvec, time.time() - t1, namespace, gen)
+            return out
+
+    async def ingest_document(self, text: str, source: str, title: str = "", section: str = "", namespace: str | None = None):
+        """Chunk, embed and upsert off the event loop (holds one vector-store slot)."""
+        return await self._io("vector", self.sync.ingest_document, text, source, title, section, namespace)
+
+    def close(self) -> None:
+        self._io_pool.shutdown(wait=False)
+        self._cpu_pool.shutdown(wait=False)
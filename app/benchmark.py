@@ -0,0 +1,234 @@
+# app/benchmark.py
+"""
+Offline end-to-end benchmark of RagPipeline (scripts/bench_pipeline.py is the CLI).
+
+The vector store, reranker and LLM are the latency/failure-injecting fakes from app.fakes,
+so ingest and query workloads run through the real chunking, MMR, rerank-cache, prompt
+and citation code with no network. run_benchmark returns a JSON-serialisable baseline:
+per-stage p50/p95/p99, queries/s, ingest chunks/s, error counts and peak RSS; compare()
+lists the regressions of one baseline against another.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+from typing import Any, Dict, List, Tuple
+import io
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from app.chunk_manifest import ChunkManifest
+from app.fakes import FakeLLM, FakeReranker, FakeRetriever, Latency
+from app.pipeline import RagPipeline
+
+BASELINE_VERSION = 1
+STAGES = ("embed_s", "retrieve_s", "mmr_s", "rerank_s", "context_s", "llm_latency_s", "total_s")
+
+_PARTS = ("pump impeller seal bearing valve gasket motor sensor filter nozzle hose clamp relay fuse "
+          "thermostat compressor belt pulley shaft housing").split()
+_VERBS = "check replace inspect tighten clean reset calibrate lubricate drain flush".split()
+_FILLER = ("the unit may show this when operating under load during startup after maintenance so "
+           "always follow the safety notes before you open the panel and record the reading").split()
+
+
+def synthetic_corpus(n_docs: int, paragraphs: Tuple[int, int] = (4, 12), seed: int = 0) -> List[Dict[str, Any]]:
+    """Manual-style documents [{"source", "title", "text", "topics"}]; every paragraph names one error code."""
+    rng = random.Random(seed)
+    docs = []
+    for d in range(n_docs):
+        topics = rng.sample(_PARTS, 3)
+        paras = []
+        for p in range(rng.randint(*paragraphs)):
+            part = rng.choice(topics)
+            paras.append(
+                f"Error E{d * 100 + p} on the {part}: {rng.choice(_VERBS)} the {part} and {rng.choice(_VERBS)} "
+                f"the {rng.choice(_PARTS)}. " + " ".join(rng.choices(_FILLER, k=rng.randint(30, 120))) + "."
+            )
+        docs.append({"source": f"manual-{d:05d}", "title": f"{topics[0].title()} service manual",
+                     "text": "\n\n".join(paras), "topics": topics})
+    return docs
+
+
+def synthetic_queries(corpus: List[Dict[str, Any]], n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        doc = rng.choice(corpus)
+        part = rng.choice(doc["topics"])
+        out.append(f"how do I {rng.choice(_VERBS)} the {part} ({i})" if i % 2 else f"what does error on the {part} mean ({i})")
+    return out
+
+
+def build_pipeline(services: Dict[str, Dict[str, float]], caches: bool = False, seed: int = 0) -> RagPipeline:
+    """
+    RagPipeline over the fakes. `services` maps "vector" / "rerank" / "llm" to
+    {"p50_ms", "p99_ms", "failure_rate"}; missing entries mean no latency and no failures.
+    "rerank" / "llm" may also set "retries" and "hedge_ms" (default: settings.call_retries
+    and settings.*_hedge_s); deadlines and breakers follow settings. The chunk manifest (when
+    CHUNK_MANIFEST=1) is an in-memory one: the fake store starts empty on every run, and the
+    real manifest must not learn about fake sources.
+    """
+    def _kw(name: str, offset: int) -> Dict[str, Any]:
+        cfg = services.get(name, {})
+        p50 = cfg.get("p50_ms", 0.0) / 1000
+        p99 = cfg.get("p99_ms", 0.0) / 1000 or None
+        return {"latency_s": Latency(p50, p99, seed=seed + offset),
+                "failure_rate": cfg.get("failure_rate", 0.0), "seed": seed + 100 + offset}
+
+    pipe = RagPipeline(retriever=FakeRetriever(**_kw("vector", 1)), llm=FakeLLM(**_kw("llm", 2)),
+                       reranker=FakeReranker(**_kw("rerank", 3)))
+    pipe._chunk_manifest = ChunkManifest(":memory:")
+    for name in ("rerank", "llm"):
+        cfg, policy = services.get(name, {}), getattr(pipe, f"{name}_policy")
+        policy.retries = cfg.get("retries", policy.retries)
+        policy.hedge_after_s = cfg["hedge_ms"] / 1000 if "hedge_ms" in cfg else policy.hedge_after_s
+    if not caches:
+        # every query must do the full round trip
+        pipe.answer_cache = None
+        pipe.rerank_cache = None
+    return pipe
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Milliseconds: p50/p95/p99/mean of `values` given in seconds."""
+    if not values:
+        return {"n": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    ms = np.asarray(values, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"n": len(ms), "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3), "mean_ms": round(float(ms.mean()), 3)}
+
+
+def run_ingest(pipe: RagPipeline, corpus: List[Dict[str, Any]]) -> Dict[str, Any]:
+    chunks = errors = 0
+    doc_s = []
+    t0 = time.perf_counter()
+    for doc in corpus:
+        t1 = time.perf_counter()
+        try:
+            chunks += pipe.ingest_document(doc["text"], source=doc["source"], title=doc["title"])["chunks"]
+        except Exception:
+            errors += 1
+        doc_s.append(time.perf_counter() - t1)
+    elapsed = time.perf_counter() - t0
+    return {"docs": len(corpus), "chunks": chunks, "errors": errors, "seconds": round(elapsed, 4),
+            "chunks_per_s": round(chunks / elapsed, 2) if elapsed > 0 else None,
+            "doc_latency": percentiles(doc_s)}
+
+
+def run_queries(pipe: RagPipeline, queries: List[str], concurrency: int = 1) -> Dict[str, Any]:
+    """answer() for every query, `concurrency` at a time; stage latencies come from the answer metrics."""
+
+    def _one(q: str):
+        t = time.perf_counter()
+        try:
+            out = pipe.answer(q)
+        except Exception as e:
+            return None, e
+        out["metrics"]["total_s"] = time.perf_counter() - t
+        return out, None
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="bench") as pool:
+        results = list(pool.map(_one, queries))
+    elapsed = time.perf_counter() - t0
+
+    answered = [out for out, err in results if err is None]
+    stages = {s: percentiles([o["metrics"][s] for o in answered if o["metrics"].get(s) is not None]) for s in STAGES}
+    return {
+        "queries": len(queries),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "qps": round(len(queries) / elapsed, 3) if elapsed > 0 else None,
+        "errors": len(results) - len(answered),
+        # answered, but retrieval failed or found nothing / the reranker failed and dense order was used
+        "empty": sum(1 for o in answered if not o["contexts"]),
+        "rerank_fallbacks": sum(1 for o in answered if o["contexts"] and not o["metrics"]["rerank_used"]),
+        # why: "error", "deadline" (rerank budget ran out) or "circuit_open"
+        "rerank_fallback_reasons": dict(Counter(o["metrics"].get("rerank_fallback") for o in answered
+                                                if o["contexts"] and not o["metrics"]["rerank_used"])),
+        "stages": stages,
+    }
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB on Linux
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, check=True).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmark(
+    docs: int = 200,
+    queries: int = 200,
+    concurrency: int = 8,
+    services: Dict[str, Dict[str, float]] | None = None,
+    caches: bool = False,
+    seed: int = 0,
+    quiet: bool = True,
+) -> Dict[str, Any]:
+    """Ingest a synthetic corpus, then answer synthetic queries; returns the JSON baseline."""
+    services = services or {}
+    corpus = synthetic_corpus(docs, seed=seed)
+    qs = synthetic_queries(corpus, queries, seed=seed + 1)
+    pipe = build_pipeline(services, caches=caches, seed=seed)
+    # The pipeline prints a warning per injected failure; keep them out of the report
+    with redirect_stdout(io.StringIO()) if quiet else nullcontext():
+        ingest = run_ingest(pipe, corpus)
+        query = run_queries(pipe, qs, concurrency)
+    return {
+        "version": BASELINE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"docs": docs, "queries": queries, "concurrency": concurrency, "services": services,
+                   "caches": caches, "seed": seed},
+        "ingest": ingest,
+        "query": query,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.10,
+            min_delta_ms: float = 1.0) -> List[str]:
+    """
+    Regressions of `current` against `baseline`, one line each: throughput down or a stage
+    percentile up by more than `tolerance` (latency changes under `min_delta_ms` are noise).
+    """
+    out = []
+    if baseline.get("config") != current.get("config"):
+        out.append("config differs from the baseline; numbers are not comparable")
+
+    for section, key in (("query", "qps"), ("ingest", "chunks_per_s")):
+        old, new = baseline[section].get(key), current[section].get(key)
+        if old and new is not None and new < old * (1 - tolerance):
+            out.append(f"{section}.{key}: {old} -> {new} ({new / old - 1:+.1%})")
+
+    for stage in STAGES:
+        old_p = baseline["query"]["stages"].get(stage, {})
+        new_p = current["query"]["stages"].get(stage, {})
+        for pct in ("p50_ms", "p95_ms", "p99_ms"):
+            old, new = old_p.get(pct), new_p.get(pct)
+            if old is None or new is None:
+                continue
+            if new - old > min_delta_ms and new > old * (1 + tolerance):
+                out.append(f"query.{stage}.{pct}: {old} -> {new} ({new / old - 1:+.1%})" if old else
+                           f"query.{stage}.{pct}: {old} -> {new}")
+    return out
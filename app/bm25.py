@@ -0,0 +1,337 @@
+# app/bm25.py
+"""
+Local BM25 index kept next to the vector store, for hybrid (sparse + dense) retrieval.
+
+Postings are compact NumPy arrays in CSR form (per-term offsets into int32 doc slots and
+uint16 term frequencies). Documents added since the last merge sit in a small per-term
+delta that queries read alongside the base arrays; it is folded in once it grows past a
+fraction of the base. Overwritten or deleted documents are tombstoned; the next merge
+drops their postings and renumbers the live slots 0..n-1, so re-ingesting the same
+documents does not grow the index or its snapshot.
+
+On disk a namespace is a snapshot (`bm25.npz`) plus an append-only SQLite log of
+upserts/deletes since that snapshot, so each upsert batch costs one small transaction
+and other processes catch up by replaying the log.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+# Part numbers and error codes ("PN-4471-B", "E42", "v2.1") stay whole; their pieces are indexed too
+_TOKEN = re.compile(r"[0-9a-z]+(?:[-_./][0-9a-z]+)*")
+_SPLIT = re.compile(r"[-_./]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have if in into is it its of on or that the their "
+    "then there these this to was were what when where which while who will with".split()
+)
+
+
+def bm25_terms(text: str) -> Dict[str, int]:
+    """Term frequencies of `text`: lowercased word/number tokens, compounds plus their parts, no stopwords."""
+    tf: Dict[str, int] = {}
+    for tok in _TOKEN.findall(text.lower()):
+        parts = _SPLIT.split(tok)
+        for term in ([tok] + parts) if len(parts) > 1 else parts:
+            if term not in STOPWORDS:
+                tf[term] = tf.get(term, 0) + 1
+    return tf
+
+
+class BM25Index:
+    """In-memory BM25 over string ids (Okapi weighting, `k1`, `b`)."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.vocab: Dict[str, int] = {}
+        self.ids: List[str | None] = []  # slot -> id (None once removed)
+        self.slot_of: Dict[str, int] = {}
+        self.doc_len = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.total_len = 0
+        # base postings (CSR over term ids) + delta lists for recent documents
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._docs = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        self._delta: Dict[int, Tuple[List[int], List[int]]] = {}
+        self._delta_n = 0
+        self._removed = 0
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    # -------- Writes --------
+    def add(self, doc_id: str, terms: Dict[str, int]) -> None:
+        if doc_id in self.slot_of:
+            self.remove(doc_id)
+        slot = len(self.ids)
+        self.ids.append(doc_id)
+        self.slot_of[doc_id] = slot
+        if slot >= len(self.doc_len):
+            cap = max(1024, 2 * len(self.doc_len))
+            self.doc_len = np.concatenate([self.doc_len, np.zeros(cap - len(self.doc_len), dtype=np.int32)])
+            self.alive = np.concatenate([self.alive, np.zeros(cap - len(self.alive), dtype=bool)])
+        length = sum(terms.values())
+        self.doc_len[slot] = length
+        self.alive[slot] = True
+        self.total_len += length
+        for term, tf in terms.items():
+            tid = self.vocab.setdefault(term, len(self.vocab))
+            docs, tfs = self._delta.setdefault(tid, ([], []))
+            docs.append(slot)
+            tfs.append(min(tf, 65535))
+        self._delta_n += len(terms)
+
+    def remove(self, doc_id: str) -> bool:
+        slot = self.slot_of.pop(doc_id, None)
+        if slot is None:
+            return False
+        self.ids[slot] = None
+        self.alive[slot] = False
+        self.total_len -= int(self.doc_len[slot])
+        self._removed += 1
+        return True
+
+    def maybe_merge(self) -> None:
+        """Fold the delta into the base once it is large relative to it (amortized O(postings))."""
+        if self._delta_n > max(20_000, len(self._docs) // 4) or self._removed > max(1000, len(self) // 4):
+            self.merge()
+
+    def merge(self) -> None:
+        """Fold the delta into the base and compact the slots: dead ones are dropped, live ones renumbered."""
+        n_terms = len(self.vocab)
+        base_tids = np.repeat(np.arange(len(self._offsets) - 1, dtype=np.int32), np.diff(self._offsets))
+        d_tids, d_docs, d_tfs = [], [], []
+        for tid, (docs, tfs) in self._delta.items():
+            d_tids.append(np.full(len(docs), tid, dtype=np.int32))
+            d_docs.append(np.asarray(docs, dtype=np.int32))
+            d_tfs.append(np.asarray(tfs, dtype=np.uint16))
+        tids = np.concatenate([base_tids] + d_tids)
+        docs = np.concatenate([self._docs] + d_docs)
+        tfs = np.concatenate([self._tfs] + d_tfs)
+        keep = self.alive[docs]
+        tids, docs, tfs = tids[keep], docs[keep], tfs[keep]
+        live = np.flatnonzero(self.alive[:len(self.ids)])
+        remap = np.full(len(self.ids), -1, dtype=np.int32)
+        remap[live] = np.arange(len(live), dtype=np.int32)
+        docs = remap[docs]  # monotone, so slots stay ascending within a term
+        self.ids = [self.ids[s] for s in live]
+        self.slot_of = {doc_id: s for s, doc_id in enumerate(self.ids)}
+        self.doc_len = self.doc_len[live]
+        self.alive = np.ones(len(live), dtype=bool)
+        order = np.argsort(tids, kind="stable")  # stable: doc slots stay ascending within a term
+        self._docs, self._tfs = docs[order], tfs[order]
+        self._offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tids, minlength=n_terms), out=self._offsets[1:])
+        self._delta.clear()
+        self._delta_n = 0
+        self._removed = 0
+
+    # -------- Reads --------
+    def _postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        # terms first seen after the last merge have no base range yet
+        lo, hi = (self._offsets[tid], self._offsets[tid + 1]) if tid + 1 < len(self._offsets) else (0, 0)
+        docs, tfs = self._docs[lo:hi], self._tfs[lo:hi]
+        if tid in self._delta:
+            d_docs, d_tfs = self._delta[tid]
+            docs = np.concatenate([docs, np.asarray(d_docs, dtype=np.int32)])
+            tfs = np.concatenate([tfs, np.asarray(d_tfs, dtype=np.uint16)])
+        keep = self.alive[docs]
+        return docs[keep], tfs[keep]
+
+    def search(self, terms: Iterable[str], top_k: int) -> List[Tuple[str, float]]:
+        """Top-k (id, BM25 score). Only the postings of the query terms are touched."""
+        n = len(self)
+        if n == 0 or top_k <= 0:
+            return []
+        avgdl = self.total_len / n if self.total_len else 1.0
+        all_docs, all_w = [], []
+        for term in dict.fromkeys(terms):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            docs, tfs = self._postings(tid)
+            if not len(docs):
+                continue
+            idf = math.log(1.0 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            tf = tfs.astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[docs] / avgdl)
+            all_docs.append(docs)
+            all_w.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        if not all_docs:
+            return []
+        slots, inv = np.unique(np.concatenate(all_docs), return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(all_w))
+        k = min(top_k, len(slots))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[int(slots[i])], float(scores[i])) for i in top]
+
+    # -------- Snapshot arrays --------
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        self.merge()
+        n = len(self.ids)
+        return {
+            "offsets": self._offsets,
+            "docs": self._docs,
+            "tfs": self._tfs,
+            "doc_len": self.doc_len[:n],
+            "alive": self.alive[:n],
+            "ids": np.array([i if i is not None else "" for i in self.ids], dtype=str),
+            "vocab": np.array(sorted(self.vocab, key=self.vocab.__getitem__), dtype=str),
+        }
+
+    @classmethod
+    def from_arrays(cls, data, k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        idx = cls(k1, b)
+        idx._offsets = data["offsets"].astype(np.int64)
+        idx._docs = data["docs"].astype(np.int32)
+        idx._tfs = data["tfs"].astype(np.uint16)
+        idx.doc_len = data["doc_len"].astype(np.int32)
+        idx.alive = data["alive"].astype(bool)
+        idx.ids = [str(i) if a else None for i, a in zip(data["ids"], idx.alive)]
+        idx.slot_of = {i: s for s, i in enumerate(idx.ids) if i is not None}
+        idx.vocab = {str(t): tid for tid, t in enumerate(data["vocab"])}
+        idx.total_len = int(idx.doc_len[idx.alive].sum())
+        return idx
+
+
+class BM25Store:
+    """
+    One namespace of BM25 on disk: `bm25.npz` snapshot + `bm25_log.sqlite` (seq, id, terms JSON;
+    NULL terms = delete). The log is compacted into a new snapshot once it outgrows the index;
+    meta.compacted_seq records the last seq folded into the snapshot, so every reader reloads it.
+    """
+
+    COMPACT_MIN_ENTRIES = 10_000  # log entries kept before compaction is considered
+
+    def __init__(self, root: str | Path, k1: float = 1.2, b: float = 0.75):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.snap_path = self.root / "bm25.npz"
+        self.k1, self.b = k1, b
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.root / "bm25_log.sqlite", timeout=30, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS log (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, terms TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.index = BM25Index(k1, b)
+        self._seq = 0  # last log entry applied to self.index
+        self._load_snapshot()
+
+    # -------- Sync with disk --------
+    def _load_snapshot(self) -> None:
+        if self.snap_path.exists():
+            with np.load(self.snap_path) as data:
+                self.index = BM25Index.from_arrays(data, self.k1, self.b)
+                self._seq = int(data["seq"])
+        else:
+            self.index = BM25Index(self.k1, self.b)
+            self._seq = 0
+
+    def _apply(self, rows) -> None:
+        for seq, doc_id, terms in rows:
+            if terms is None:
+                self.index.remove(doc_id)
+            else:
+                self.index.add(doc_id, json.loads(terms))
+            self._seq = seq
+        self.index.maybe_merge()
+
+    def _refresh(self) -> None:
+        """Replay log entries written since our last look (possibly by another process)."""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'compacted_seq'").fetchone()
+        if row is not None and row[0] > self._seq:
+            self._load_snapshot()  # another process compacted past us (the log may now be empty)
+        self._apply(self.db.execute("SELECT seq, id, terms FROM log WHERE seq > ? ORDER BY seq", (self._seq,)))
+
+    def _compact(self) -> None:
+        tmp = self.snap_path.with_name(f"bm25.{os.getpid()}.tmp.npz")
+        np.savez(tmp, seq=np.int64(self._seq), **self.index.to_arrays())
+        os.replace(tmp, self.snap_path)
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('compacted_seq', ?)", (self._seq,))
+        self.db.execute("DELETE FROM log WHERE seq <= ?", (self._seq,))
+
+    # -------- Writes --------
+    def _log(self, entries: List[Tuple[str, str | None]]) -> None:
+        if not entries:
+            return
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                self.db.executemany("INSERT INTO log (id, terms) VALUES (?, ?)", entries)
+                self._apply(self.db.execute("SELECT seq, id, terms FROM log WHERE seq > ? ORDER BY seq", (self._seq,)))
+                pending = self.db.execute("SELECT COUNT(*) FROM log").fetchone()[0]
+                if pending > max(self.COMPACT_MIN_ENTRIES, len(self.index) // 2):
+                    self._compact()
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                self._load_snapshot()  # drop anything applied from the rolled-back batch
+                raise
+
+    def upsert(self, docs: Iterable[Tuple[str, str]]) -> None:
+        """(id, text) pairs; an existing id is re-indexed."""
+        self._log([(doc_id, json.dumps(bm25_terms(text))) for doc_id, text in docs])
+
+    def delete(self, ids: Iterable[str]) -> None:
+        self._log([(doc_id, None) for doc_id in ids])
+
+    # -------- Reads --------
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        terms = list(bm25_terms(query))
+        with self._lock:
+            self._refresh()
+            return self.index.search(terms, top_k)
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self.index)
+
+    def close(self) -> None:
+        self.db.close()
+
+
+# -------- Fusion --------
+def fuse(
+    dense: List[Dict[str, Any]],
+    sparse: List[Tuple[str, float]],
+    top_k: int,
+    method: str = "rrf",
+    rrf_k: int = 60,
+    sparse_weight: float = 1.0,
+) -> List[Tuple[str, float]]:
+    """
+    Merge a dense hit list ({"id", "score"} dicts, best first) with sparse (id, score)
+    pairs into the top-k (id, fused score).
+      rrf:      sum of weight / (rrf_k + rank)  (rank from 1; dense weight 1)
+      weighted: (1 - w) * dense min-max score + w * sparse min-max score, w = sparse_weight / (1 + sparse_weight)
+    """
+    fused: Dict[str, float] = {}
+    if method == "weighted":
+        w = sparse_weight / (1.0 + sparse_weight)
+        for weight, pairs in ((1.0 - w, [(h["id"], h["score"]) for h in dense]), (w, sparse)):
+            if not pairs:
+                continue
+            lo, hi = min(s for _, s in pairs), max(s for _, s in pairs)
+            for doc_id, s in pairs:
+                fused[doc_id] = fused.get(doc_id, 0.0) + weight * ((s - lo) / (hi - lo) if hi > lo else 1.0)
+    else:
+        for rank, h in enumerate(dense, start=1):
+            fused[h["id"]] = fused.get(h["id"], 0.0) + 1.0 / (rrf_k + rank)
+        for rank, (doc_id, _) in enumerate(sparse, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + sparse_weight / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
@@ -0,0 +1,315 @@
+# app/bulk_ingest.py
+"""
+Resumable bulk ingestion of a directory tree (PDF, text, Markdown).
+
+Files are hashed and extracted in a process pool; chunks from many files are
+packed into shared embedding batches and upserted through the retriever. A SQLite
+manifest records each file once all of its chunks are upserted, so an interrupted
+run resumes where it stopped and unchanged files (same size + mtime, or same
+content hash) are skipped.
+"""
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+import hashlib
+import sqlite3
+import time
+
+from app.chunk_manifest import ChunkManifest, SourceDiff, store_fingerprint
+from app.config import settings
+from app.ingest import _page_text, process_pool
+from app.retriever_pine import build_vectors
+
+TEXT_SUFFIXES = (".txt", ".md", ".markdown", ".rst")
+DEFAULT_SUFFIXES = (".pdf",) + TEXT_SUFFIXES
+
+
+# -------- Manifest --------
+class IngestManifest:
+    """Per (namespace, path): size, mtime_ns, content hash, status ("done"/"error"), chunk count, error."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " namespace TEXT NOT NULL, path TEXT NOT NULL, size INTEGER, mtime_ns INTEGER, hash TEXT,"
+            " status TEXT NOT NULL, chunks INTEGER, error TEXT, updated REAL NOT NULL,"
+            " PRIMARY KEY (namespace, path))"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS stores (namespace TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)")
+
+    def check(self, namespace: str, fingerprint: str) -> bool:
+        """Forget `namespace`'s files unless they were ingested into `fingerprint`'s store; True if dropped."""
+        self.db.execute("BEGIN IMMEDIATE")
+        row = self.db.execute("SELECT fingerprint FROM stores WHERE namespace = ?", (namespace,)).fetchone()
+        stale = row is None or row[0] != fingerprint
+        if stale:
+            self.db.execute("DELETE FROM files WHERE namespace = ?", (namespace,))
+            self.db.execute("INSERT OR REPLACE INTO stores (namespace, fingerprint) VALUES (?, ?)",
+                            (namespace, fingerprint))
+        self.db.execute("COMMIT")
+        return stale
+
+    def get(self, namespace: str, path: str) -> Dict[str, Any] | None:
+        row = self.db.execute(
+            "SELECT size, mtime_ns, hash, status, chunks, error FROM files WHERE namespace = ? AND path = ?",
+            (namespace, path),
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("size", "mtime_ns", "hash", "status", "chunks", "error"), row))
+
+    def record(self, namespace: str, rows: List[Tuple[str, int, int, str | None, str, int, str | None]]) -> None:
+        """rows: (path, size, mtime_ns, hash, status, chunks, error), written in one transaction."""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.executemany(
+            "INSERT OR REPLACE INTO files (namespace, path, size, mtime_ns, hash, status, chunks, error, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(namespace, *r, now) for r in rows],
+        )
+        self.db.execute("COMMIT")
+
+    def close(self) -> None:
+        self.db.close()
+
+
+# -------- Discovery + extraction (worker processes) --------
+def discover(root: str | Path, suffixes=DEFAULT_SUFFIXES) -> Iterator[Path]:
+    """Files under `root` with a known suffix, in a stable order; hidden directories are skipped."""
+    root = Path(root)
+    for path in sorted(root.rglob("*")):
+        rel = path.relative_to(root)
+        if any(part.startswith(".") for part in rel.parts):
+            continue
+        if path.is_file() and path.suffix.lower() in suffixes:
+            yield path
+
+
+def file_hash(path: str | Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def extract_file(path: str, known_hash: str | None = None) -> Dict[str, Any]:
+    """
+    Runs in a worker process. Returns {"hash", "pages": [(page, text)] | None, "error"};
+    pages is None when the content hash equals `known_hash` (unchanged, nothing to do).
+    """
+    try:
+        digest = file_hash(path)
+        if digest == known_hash:
+            return {"hash": digest, "pages": None, "error": None}
+        if path.lower().endswith(".pdf"):
+            import PyPDF2  # type: ignore
+            reader = PyPDF2.PdfReader(path)
+            pages = [(i + 1, _page_text(p)) for i, p in enumerate(reader.pages)]
+        else:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages = [(None, f.read())]
+        return {"hash": digest, "pages": pages, "error": None}
+    except Exception as e:
+        return {"hash": None, "pages": None, "error": f"{type(e).__name__}: {e}"}
+
+
+class _InlineExecutor:
+    """workers=1: run extraction in-process (no pickling, easier debugging)."""
+
+    def submit(self, fn, *args) -> Future:
+        fut: Future = Future()
+        fut.set_result(fn(*args))
+        return fut
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# -------- Bulk ingest --------
+def bulk_ingest(
+    root: str | Path,
+    retriever,
+    manifest: IngestManifest,
+    chunker,
+    namespace: str | None = None,
+    workers: int | None = None,
+    batch_chunks: int | None = None,
+    suffixes=DEFAULT_SUFFIXES,
+    on_progress: Callable[[Dict[str, Any]], None] | None = None,
+    chunk_manifest: ChunkManifest | None = None,
+) -> Dict[str, Any]:
+    """
+    Ingest every matching file under `root`. A file is marked done in the manifest only
+    after all of its chunks are upserted; failures are recorded and retried next run.
+    With a `chunk_manifest`, a changed file only re-sends its added/changed chunks and its
+    stale ids are deleted (totals under "chunk_diff").
+    Returns a summary: counts per outcome, chunks, pages, bytes, elapsed, rates, errors.
+    """
+    root = Path(root)
+    namespace = namespace or settings.pinecone_namespace
+    workers = workers or settings.ingest_pdf_workers
+    batch_chunks = batch_chunks or settings.ingest_batch_chunks
+    t0 = time.time()
+    summary: Dict[str, Any] = {"files": 0, "skipped": 0, "unchanged": 0, "ingested": 0, "empty": 0, "failed": 0,
+                               "chunks": 0, "pages": 0, "bytes": 0, "embed_s": 0.0, "upsert_s": 0.0, "errors": []}
+    # Both manifests only describe the store they were filled against (see store_fingerprint)
+    fingerprint = store_fingerprint(retriever, namespace)
+    manifest.check(namespace, fingerprint)
+    if chunk_manifest is not None:
+        chunk_manifest.check(namespace, fingerprint)
+        summary["chunk_diff"] = {"added": 0, "changed": 0, "unchanged": 0, "deleted": 0}
+
+    buffer: List[Tuple[str, Dict[str, Any]]] = []  # (rel path, chunk)
+    open_files: Dict[str, Dict[str, Any]] = {}  # rel path -> {"left", "row", "diff"}
+
+    def _fail(rel: str, row: Tuple, error: str) -> None:
+        summary["failed"] += 1
+        summary["errors"].append({"path": rel, "error": error})
+        manifest.record(namespace, [(rel, row[0], row[1], None, "error", 0, error)])
+
+    def _finish(rel: str, row: Tuple, diff: SourceDiff | None) -> Tuple | None:
+        """Manifest row for a file whose chunks are all upserted (None if deleting stale ids failed)."""
+        size, mtime_ns, digest, n_chunks = row
+        if diff is not None:
+            try:
+                counts = diff.finish(retriever)
+            except Exception as e:
+                _fail(rel, row, f"{type(e).__name__}: {e}")
+                return None
+            for k, v in counts.items():
+                summary["chunk_diff"][k] += v
+        return (rel, size, mtime_ns, digest, "done", n_chunks, None)
+
+    def _flush(n: int | None = None) -> None:
+        """Embed + upsert the first `n` buffered chunks (all if None); mark files whose last chunk went out."""
+        nonlocal buffer
+        n = len(buffer) if n is None else n
+        batch, buffer = buffer[:n], buffer[n:]
+        if not batch:
+            return
+        chunks = [c for _, c in batch]
+        try:
+            te = time.time()
+            values = retriever.embed_array([c["text"] for c in chunks])
+            tu = time.time()
+            retriever.upsert_vectors(build_vectors(chunks, values), namespace)
+            summary["embed_s"] += tu - te
+            summary["upsert_s"] += time.time() - tu
+        except Exception as e:
+            # every file with a chunk in this batch failed; drop the rest of their chunks too
+            for rel in dict.fromkeys(r for r, _ in batch):
+                state = open_files.pop(rel, None)
+                if state is not None:
+                    _fail(rel, state["row"], f"{type(e).__name__}: {e}")
+            buffer = [(r, c) for r, c in buffer if r in open_files]
+            return
+        done = []
+        for rel, _ in batch:
+            state = open_files[rel]
+            state["left"] -= 1
+            if state["left"] == 0:
+                del open_files[rel]
+                row = _finish(rel, state["row"], state["diff"])
+                if row is not None:
+                    done.append(row)
+        summary["chunks"] += len(chunks)
+        if done:
+            manifest.record(namespace, done)
+            summary["ingested"] += len(done)
+        if on_progress:
+            on_progress({"stage": "batch", "chunks": summary["chunks"], "files_done": summary["ingested"]})
+
+    def _handle(path: Path, rel: str, stat, fut: Future) -> None:
+        result = fut.result()
+        if result["error"]:
+            _fail(rel, (stat.st_size, stat.st_mtime_ns), result["error"])
+            return
+        if result["pages"] is None:  # same content, new mtime
+            summary["unchanged"] += 1
+            prev = manifest.get(namespace, rel) or {}
+            manifest.record(namespace, [(rel, stat.st_size, stat.st_mtime_ns, result["hash"], "done",
+                                         prev.get("chunks") or 0, None)])
+            return
+        meta = {"source": rel, "title": path.stem, "section": ""}
+        diff = SourceDiff(chunk_manifest, namespace, rel) if chunk_manifest is not None else None
+        chunks = chunker.chunks(result["pages"], meta)
+        chunks = list(diff.filter(chunks) if diff is not None else chunks)
+        n_chunks = len(diff.new) if diff is not None else len(chunks)
+        summary["pages"] += len(result["pages"])
+        summary["bytes"] += stat.st_size
+        row = (stat.st_size, stat.st_mtime_ns, result["hash"], n_chunks)
+        if not chunks:
+            # no text at all, or every chunk unchanged: only stale ids (if any) to delete
+            done = _finish(rel, row, diff)
+            if done is not None:
+                summary["ingested" if n_chunks else "empty"] += 1
+                manifest.record(namespace, [done])
+            return
+        open_files[rel] = {"left": len(chunks), "row": row, "diff": diff}
+        buffer.extend((rel, c) for c in chunks)
+        while len(buffer) >= batch_chunks:
+            _flush(batch_chunks)
+
+    executor = _InlineExecutor() if workers <= 1 else process_pool(workers)
+    in_flight: deque = deque()
+    with executor as pool:
+        try:
+            for path in discover(root, suffixes):
+                rel = path.relative_to(root).as_posix()
+                stat = path.stat()
+                summary["files"] += 1
+                prev = manifest.get(namespace, rel)
+                if prev and prev["status"] == "done" and (prev["size"], prev["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                    summary["skipped"] += 1
+                    continue
+                known = prev["hash"] if prev and prev["status"] == "done" else None
+                in_flight.append((path, rel, stat, pool.submit(extract_file, str(path), known)))
+                # bounded look-ahead: extraction runs ahead of embedding by at most 2 * workers files
+                while len(in_flight) > 2 * workers:
+                    _handle(*in_flight.popleft())
+            while in_flight:
+                _handle(*in_flight.popleft())
+            _flush()
+        finally:
+            # interrupted: don't wait for extraction nobody will consume
+            for *_, fut in in_flight:
+                fut.cancel()
+
+    elapsed = time.time() - t0
+    summary["elapsed_s"] = elapsed
+    summary["files_per_s"] = (summary["ingested"] + summary["empty"]) / elapsed if elapsed > 0 else 0.0
+    summary["chunks_per_s"] = summary["chunks"] / elapsed if elapsed > 0 else 0.0
+    summary["mb_per_s"] = summary["bytes"] / 2**20 / elapsed if elapsed > 0 else 0.0
+    return summary
+
+
+def format_summary(summary: Dict[str, Any], max_errors: int = 20) -> str:
+    lines = [
+        f"files: {summary['files']}  ingested: {summary['ingested']}  skipped: {summary['skipped']}"
+        f"  unchanged: {summary['unchanged']}  empty: {summary['empty']}  failed: {summary['failed']}",
+        f"chunks: {summary['chunks']}  pages: {summary['pages']}  input: {summary['bytes'] / 2**20:.1f} MB",
+        f"time: {summary['elapsed_s']:.1f}s (embed {summary['embed_s']:.1f}s, upsert {summary['upsert_s']:.1f}s)"
+        f"  throughput: {summary['files_per_s']:.1f} files/s, {summary['chunks_per_s']:.1f} chunks/s,"
+        f" {summary['mb_per_s']:.2f} MB/s",
+    ]
+    if "chunk_diff" in summary:
+        lines.append("chunk diff: " + "  ".join(f"{k}: {v}" for k, v in summary["chunk_diff"].items()))
+    errors = summary["errors"]
+    if errors:
+        lines.append(f"errors ({len(errors)}):")
+        lines += [f"  {e['path']}: {e['error']}" for e in errors[:max_errors]]
+        if len(errors) > max_errors:
+            lines.append(f"  … {len(errors) - max_errors} more (see the manifest)")
+    return "\n".join(lines)
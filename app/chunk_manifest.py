@@ -0,0 +1,153 @@
+# app/chunk_manifest.py
+"""
+Chunk-level diffs for re-ingestion.
+
+Vector ids are `source:position`, so a re-ingest overwrites every chunk and, when the
+new version is shorter, leaves the old tail behind. The manifest keeps a content hash
+per (namespace, source, position); a SourceDiff compares a new chunking against it so
+only added/changed chunks are embedded and upserted and positions that no longer exist
+are deleted from the index.
+
+The hashes only describe one vector store filled by one embedding model: each namespace
+records a store fingerprint (backend + index or store identity + model), and a different
+fingerprint (another index or backend, a wiped local store, a new model) empties the
+namespace's manifest so everything is upserted again.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+import hashlib
+import json
+import sqlite3
+import threading
+
+from app.retriever_pine import embedding_model_key, vector_id
+
+# Metadata that changes what a chunk looks like in results. Character offsets are left
+# out on purpose: an edit on page 3 shifts them for every later chunk, which would turn
+# an otherwise unchanged tail into a full re-upsert.
+_HASHED_META = ("title", "section", "page", "page_end")
+
+
+def chunk_hash(chunk: Dict[str, Any]) -> str:
+    md = chunk.get("metadata", {})
+    h = hashlib.blake2b(digest_size=16)
+    h.update(chunk["text"].encode("utf-8"))
+    h.update(b"\0")
+    h.update(json.dumps({k: md.get(k) for k in _HASHED_META}, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def store_fingerprint(retriever, namespace: str) -> str:
+    """The store and embedding model that `namespace`'s chunks are upserted into by `retriever`."""
+    # A retriever that can't name its store (test doubles) is only told apart by the model
+    store = retriever.store_id(namespace) if hasattr(retriever, "store_id") else ""
+    return f"{store}|{embedding_model_key()}"
+
+
+class ChunkManifest:
+    """Per (namespace, source): the content hash of the chunk stored at each position."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " namespace TEXT NOT NULL, source TEXT NOT NULL, position INTEGER NOT NULL, hash TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, source, position))"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS stores (namespace TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)")
+
+    def check(self, namespace: str, fingerprint: str) -> bool:
+        """Forget `namespace`'s hashes unless they were recorded for `fingerprint`; True if they were dropped."""
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT fingerprint FROM stores WHERE namespace = ?", (namespace,)).fetchone()
+                stale = row is None or row[0] != fingerprint
+                if stale:
+                    self.db.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+                    self.db.execute("INSERT OR REPLACE INTO stores (namespace, fingerprint) VALUES (?, ?)",
+                                    (namespace, fingerprint))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return stale
+
+    def load(self, namespace: str, source: str) -> Dict[int, str]:
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT position, hash FROM chunks WHERE namespace = ? AND source = ?", (namespace, source)
+            ).fetchall()
+        return dict(rows)
+
+    def replace(self, namespace: str, source: str, hashes: Dict[int, str]) -> None:
+        """Swap the stored hashes of one source for `hashes`, in one transaction."""
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute("DELETE FROM chunks WHERE namespace = ? AND source = ?", (namespace, source))
+                self.db.executemany(
+                    "INSERT INTO chunks (namespace, source, position, hash) VALUES (?, ?, ?, ?)",
+                    [(namespace, source, p, h) for p, h in hashes.items()],
+                )
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class SourceDiff:
+    """
+    One re-ingest of one source. Pass the new chunks through filter() (only added and
+    changed ones come out), upsert those, then call finish() to delete stale ids and
+    record the new hashes. Until finish() succeeds the manifest is untouched, so a failed
+    run simply re-sends the same chunks next time.
+    """
+
+    def __init__(self, manifest: ChunkManifest, namespace: str, source: str):
+        self.manifest = manifest
+        self.namespace = namespace
+        self.source = source
+        self.old = manifest.load(namespace, source)
+        self.new: Dict[int, str] = {}
+        self.counts = {"added": 0, "changed": 0, "unchanged": 0, "deleted": 0}
+
+    def keep(self, chunk: Dict[str, Any]) -> bool:
+        """Record the chunk's hash; True if it must be (re-)embedded and upserted."""
+        position = chunk["metadata"]["position"]
+        digest = chunk_hash(chunk)
+        self.new[position] = digest
+        prev = self.old.get(position)
+        if prev is None:
+            self.counts["added"] += 1
+        elif prev != digest:
+            self.counts["changed"] += 1
+        else:
+            self.counts["unchanged"] += 1
+            return False
+        return True
+
+    def filter(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        return (c for c in chunks if self.keep(c))
+
+    def stale_ids(self) -> List[str]:
+        return [vector_id(self.source, p) for p in sorted(self.old) if p not in self.new]
+
+    def finish(self, retriever) -> Dict[str, int]:
+        """Delete ids that no longer exist, then store the new hashes. Returns the counts."""
+        stale = self.stale_ids()
+        if stale:
+            retriever.delete_ids(stale, self.namespace)
+        self.counts["deleted"] = len(stale)
+        self.manifest.replace(self.namespace, self.source, self.new)
+        return dict(self.counts)
@@ -0,0 +1,246 @@
+# app/chunking.py
+"""
+Streaming, tokenizer-sized chunker.
+
+Text is fed in blocks (split at whitespace, so no token straddles two blocks) and
+tokenized a batch of blocks at a time with the embedding model's fast tokenizer,
+keeping only token character offsets. Chunk boundaries are chosen on those offsets
+and each chunk's text is a single slice of its block(s): no word lists, no joins.
+Chunks optionally end on a sentence boundary and record start/end character offsets.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+import re
+
+import numpy as np
+
+from app.config import settings
+
+PAGE_SEP = "\n\n"  # offsets treat pages as joined with this separator
+
+# sentence end: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+_SENT_END = re.compile(r"[.!?][\"'”’)\]]*(?=\s)")
+
+
+def _char_class(ch: str) -> int:
+    # 0 = whitespace, 1 = word character (\w), 2 = anything else (a one-char token)
+    if ch.isspace():
+        return 0
+    return 1 if ch.isalnum() or ch == "_" else 2
+
+
+_ASCII_CLASS = np.array([_char_class(chr(i)) for i in range(128)], dtype=np.uint8)
+
+
+class RegexTokenizer:
+    r"""
+    Dependency-free stand-in for a fast tokenizer: runs of word characters and single
+    punctuation marks (the regex \w+|[^\w\s]), i.e. BERT pre-tokenization without
+    WordPiece splits, so it slightly undercounts. Spans are found with NumPy over the
+    code points, not a per-match Python loop.
+    """
+
+    model_max_length = 512
+
+    @staticmethod
+    def spans(text: str) -> np.ndarray:
+        cp = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        cls = _ASCII_CLASS[np.minimum(cp, 127)]
+        high = cp > 127
+        if high.any():
+            uniq, inv = np.unique(cp[high], return_inverse=True)
+            cls[high] = np.array([_char_class(chr(c)) for c in uniq], dtype=np.uint8)[inv]
+        word = cls == 1
+        punct = cls == 2
+        starts = np.flatnonzero((word & ~np.r_[False, word[:-1]]) | punct)
+        ends = np.flatnonzero((word & ~np.r_[word[1:], False]) | punct) + 1
+        return np.stack([starts, ends], axis=1)
+
+    def __call__(self, texts: List[str], **_: Any) -> Dict[str, List[np.ndarray]]:
+        return {"offset_mapping": [self.spans(t) for t in texts]}
+
+
+def _blocks(text: str, block_chars: int) -> Iterator[Tuple[int, str]]:
+    """(offset, block) pieces of `text`, each ending at whitespace when possible."""
+    pos, n = 0, len(text)
+    while pos < n:
+        end = min(n, pos + block_chars)
+        if end < n:
+            # last whitespace in the final 10% of the block, else hard cut
+            cut = max(text.rfind(" ", end - block_chars // 10, end), text.rfind("\n", end - block_chars // 10, end))
+            if cut > pos:
+                end = cut + 1
+        yield pos, text[pos:end]
+        pos = end
+
+
+class StreamingChunker:
+    """
+    Token windows of at most `max_tokens` tokens with `overlap_tokens` overlap.
+    `tokenizer` is a (fast) Hugging Face tokenizer or anything with the same
+    __call__(texts, return_offsets_mapping=True) -> {"offset_mapping"} contract.
+    """
+
+    def __init__(
+        self,
+        tokenizer=None,
+        max_tokens: int = 254,
+        overlap_tokens: int = 30,
+        snap_sentences: bool = True,
+        block_chars: int = 1 << 16,
+        batch_blocks: int = 8,
+    ):
+        self.tokenizer = tokenizer or RegexTokenizer()
+        self.max_tokens = max(8, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.snap_sentences = snap_sentences
+        self.block_chars = block_chars
+        self.batch_blocks = batch_blocks
+
+    # -------- Tokenization --------
+    def _token_spans(self, pages: Iterable[Tuple[int | None, str]]):
+        """
+        Yields ("block", (abs_start, text, page)) then ("spans", (k, 2) int64 absolute offsets)
+        for batches of blocks, so blocks are registered before their tokens arrive.
+        """
+        pending: List[Tuple[int, str]] = []
+        offset = 0
+
+        def _flush():
+            enc = self.tokenizer(
+                [b for _, b in pending],
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+            )
+            for (start, _), offs in zip(pending, enc["offset_mapping"]):
+                spans = np.asarray(offs, dtype=np.int64).reshape(-1, 2)
+                yield "spans", spans + start
+            pending.clear()
+
+        first = True
+        for page, text in pages:
+            if not first:
+                offset += len(PAGE_SEP)
+            first = False
+            for rel, block in _blocks(text, self.block_chars):
+                yield "block", (offset + rel, block, page)
+                pending.append((offset + rel, block))
+                if len(pending) >= self.batch_blocks:
+                    yield from _flush()
+            offset += len(text)
+        if pending:
+            yield from _flush()
+
+    # -------- Chunking --------
+    def _snap(self, spans: np.ndarray, end: int, text_at) -> int:
+        """Largest token count <= end whose last token closes a sentence (keeps at least half the window)."""
+        lo = max(1, end // 2)
+        start_char, end_char = int(spans[lo - 1, 1]), int(spans[end - 1, 1])
+        region = text_at(start_char, end_char + 1)  # +1 so "." before the next whitespace is visible
+        last = None
+        for m in _SENT_END.finditer(region):
+            last = m
+        if last is None:
+            return end
+        boundary = start_char + last.end()
+        snapped = int(np.searchsorted(spans[:end, 1], boundary, side="right"))
+        return snapped if snapped >= lo else end
+
+    def chunks(
+        self,
+        pages: Iterable[Tuple[int | None, str]],
+        meta: Dict[str, Any] | None = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Chunk (page number, text) pairs (page may be None). Yields {"text", "metadata"} with
+        position, char_count, token_count, start_char, end_char and, for paged input, page/page_end.
+        """
+        meta = meta or {}
+        blocks: List[Tuple[int, str, int | None]] = []  # live blocks: (abs_start, text, page)
+        block_starts: List[int] = []
+        spans = np.zeros((0, 2), dtype=np.int64)  # tokens not yet behind the window start
+        fresh = 0  # trailing tokens not yet emitted in any chunk
+        position = 0
+
+        def text_at(a: int, b: int) -> str:
+            i = max(0, bisect_right(block_starts, a) - 1)
+            bstart, btext, _ = blocks[i]
+            if b <= bstart + len(btext):
+                return btext[a - bstart:b - bstart]  # the common case: one slice
+            parts, prev_end = [], None
+            while i < len(blocks) and blocks[i][0] < b:
+                bstart, btext, _ = blocks[i]
+                if parts and bstart > prev_end:
+                    parts.append(PAGE_SEP)
+                parts.append(btext[max(0, a - bstart):b - bstart])
+                prev_end = bstart + len(btext)
+                i += 1
+            return "".join(parts)
+
+        def page_at(a: int):
+            return blocks[max(0, bisect_right(block_starts, a) - 1)][2]
+
+        def emit(n_tok: int):
+            a, b = int(spans[0, 0]), int(spans[n_tok - 1, 1])
+            chunk_text = text_at(a, b)
+            md = {**meta, "position": position, "char_count": len(chunk_text), "token_count": n_tok,
+                  "start_char": a, "end_char": b}
+            page = page_at(a)
+            if page is not None:
+                md["page"], md["page_end"] = page, page_at(b - 1)
+            return {"text": chunk_text, "metadata": md}
+
+        def drop_blocks():
+            # forget blocks that end before the first live token
+            keep_from = int(spans[0, 0])
+            while len(blocks) > 1 and blocks[1][0] <= keep_from:
+                blocks.pop(0)
+                block_starts.pop(0)
+
+        for kind, payload in self._token_spans(pages):
+            if kind == "block":
+                blocks.append(payload)
+                block_starts.append(payload[0])
+                continue
+            if not len(payload):
+                continue
+            spans = np.concatenate([spans, payload]) if len(spans) else payload
+            fresh += len(payload)
+            while len(spans) >= self.max_tokens + 1:  # one token of lookahead past the window
+                end = self._snap(spans, self.max_tokens, text_at) if self.snap_sentences else self.max_tokens
+                yield emit(end)
+                position += 1
+                nxt = max(1, end - self.overlap_tokens)
+                fresh = len(spans) - end
+                spans = spans[nxt:]
+                drop_blocks()
+        if fresh > 0:
+            yield emit(len(spans))  # the loop above leaves at most one window
+
+def make_chunker(tokenizer=None, model_max_tokens: int | None = None) -> StreamingChunker:
+    """
+    Chunker sized by settings.chunk_size_tokens, capped to what the embedding model
+    actually reads (its max sequence length minus [CLS]/[SEP]); tokens past that limit
+    would be truncated away at embedding time. Slow (non-Rust) tokenizers have no
+    offsets, so they fall back to RegexTokenizer.
+    """
+    if tokenizer is not None and not getattr(tokenizer, "is_fast", False):
+        tokenizer = None
+    max_tokens = settings.chunk_size_tokens
+    if model_max_tokens:
+        max_tokens = min(max_tokens, model_max_tokens - 2)
+    return StreamingChunker(
+        tokenizer,
+        max_tokens=max_tokens,
+        overlap_tokens=int(max_tokens * settings.chunk_overlap),
+        snap_sentences=settings.chunk_snap_sentences,
+    )
+
+
+def chunk_text(text: str, chunker: StreamingChunker | None = None, meta: Dict[str, Any] | None = None) -> Iterator[Dict[str, Any]]:
+    """Chunks of a single in-memory text (see StreamingChunker.chunks)."""
+    return (chunker or make_chunker()).chunks([(None, text)], meta)
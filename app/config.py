@@ -2,10 +2,11 @@
 from dataclasses import dataclass
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Optional: load config/.env if you ever add one
-load_dotenv(dotenv_path=Path("config/.env"))
+# Optional: load config/.env if you ever add one (python-dotenv is only imported when it exists)
+if Path("config/.env").exists():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=Path("config/.env"))
 
 # ---- secrets loader (supports flat and nested tables) ----
 def _flatten(d, parent_key=""):
@@ -52,25 +53,129 @@ class Settings:
     pinecone_cloud: str = os.getenv("PINECONE_CLOUD", "aws")
     pinecone_region: str = os.getenv("PINECONE_REGION", "us-east-1")
     pinecone_namespace: str = os.getenv("PINECONE_NAMESPACE", "default")
+    # Skip list_indexes/describe_index on start-up if the index was verified this recently (0 = always check)
+    pinecone_index_check_ttl_s: float = float(os.getenv("PINECONE_INDEX_CHECK_TTL_S", "86400"))
+    pinecone_index_check_cache: str = os.getenv("PINECONE_INDEX_CHECK_CACHE", ".cache/pinecone_index.json")
+
+    # Vector store backend: "pinecone" (default) or "local" (memory-mapped, in-process)
+    vector_backend: str = os.getenv("VECTOR_BACKEND", "pinecone")
+    local_store_dir: str = os.getenv("LOCAL_STORE_DIR", ".cache/vectors")
+    local_ivf_min_vectors: int = int(os.getenv("LOCAL_IVF_MIN_VECTORS", "50000"))
+    local_ivf_nprobe: int = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+    # Writes are assigned to the existing IVF centroids; k-means reruns once that many rows
+    # (as a share of the rows it was fitted on) were placed that way
+    local_ivf_rebuild_drift: float = float(os.getenv("LOCAL_IVF_REBUILD_DRIFT", "0.2"))
 
     # Embeddings
     embedding_model_name: str = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
     embedding_dim: int = int(os.getenv("EMBEDDING_DIM", "384"))
+    embed_batch_size: int = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    # Embedding backend: "torch" (sentence-transformers) or "onnx" (exported, int8-quantized, ONNX Runtime on CPU)
+    embedding_backend: str = os.getenv("EMBEDDING_BACKEND", "torch")
+    onnx_cache_dir: str = os.getenv("ONNX_CACHE_DIR", ".cache/onnx")
+    onnx_quantize: bool = os.getenv("ONNX_QUANTIZE", "1") == "1"
+    onnx_threads: int = int(os.getenv("ONNX_THREADS", str(os.cpu_count() or 1)))
+    onnx_max_batch_tokens: int = int(os.getenv("ONNX_MAX_BATCH_TOKENS", "8192"))  # padded tokens per batch
+
+    # Persistent embedding cache (shared by all worker processes on the host)
+    embedding_cache_enabled: bool = os.getenv("EMBEDDING_CACHE", "1") == "1"
+    embedding_cache_dir: str = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+    embedding_cache_max_entries: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+    embedding_cache_memory_items: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "2048"))
+
+    # Chunk text kept locally (keyed by vector id) instead of in Pinecone metadata; opt-in because
+    # ingest and query must then share the file
+    doc_store_enabled: bool = os.getenv("DOC_STORE", "0") == "1"
+    doc_store_path: str = os.getenv("DOC_STORE_PATH", ".cache/docstore.sqlite")
+
+    # Bulk upsert (Pinecone rejects requests over ~2 MB)
+    upsert_batch_size: int = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+    upsert_max_bytes: int = int(os.getenv("UPSERT_MAX_BYTES", "1800000"))
+    upsert_workers: int = int(os.getenv("UPSERT_WORKERS", "4"))
+
+    # Streaming ingestion: PDF extraction processes, chunks per embed/upsert batch, queue depth between stages
+    ingest_pdf_workers: int = int(os.getenv("INGEST_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+    ingest_batch_chunks: int = int(os.getenv("INGEST_BATCH_CHUNKS", "64"))
+    ingest_queue_depth: int = int(os.getenv("INGEST_QUEUE_DEPTH", "4"))
 
     # Reranker (accept COHERE_API_KEY or CO_API_KEY)
     cohere_api_key: str = os.getenv("COHERE_API_KEY") or os.getenv("CO_API_KEY", "")
     cohere_model: str = os.getenv("COHERE_RERANK_MODEL", "rerank-english-v3.0")
     rerank_top_k: int = int(os.getenv("RERANK_TOP_K", "5"))
+
+    # Reranker backend: "cohere" (hosted) or "local" (CPU cross-encoder)
+    reranker_backend: str = os.getenv("RERANKER_BACKEND", "cohere")
+    local_rerank_model: str = os.getenv("LOCAL_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    local_rerank_max_length: int = int(os.getenv("LOCAL_RERANK_MAX_LENGTH", "256"))
+    local_rerank_batch_size: int = int(os.getenv("LOCAL_RERANK_BATCH_SIZE", "16"))
+    local_rerank_quantize: bool = os.getenv("LOCAL_RERANK_QUANTIZE", "0") == "1"
     initial_recall_k: int = int(os.getenv("INITIAL_RECALL_K", "25"))
 
+    # Rerank score cache (per query + chunk)
+    rerank_cache_enabled: bool = os.getenv("RERANK_CACHE", "1") == "1"
+    rerank_cache_max_items: int = int(os.getenv("RERANK_CACHE_MAX_ITEMS", "20000"))
+    rerank_cache_ttl_s: float = float(os.getenv("RERANK_CACHE_TTL_S", "3600"))
+
     # LLM (Groq)
     groq_api_key: str = os.getenv("GROQ_API_KEY", "")
     groq_model: str = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
 
+    # Answer cache (exact + near-duplicate queries), per process: only ingests in the same process clear it,
+    # so after scripts/bulk_ingest.py (or another worker's ingest) answers can be up to the TTL stale
+    answer_cache_enabled: bool = os.getenv("ANSWER_CACHE", "1") == "1"
+    answer_cache_max_items: int = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "512"))
+    answer_cache_ttl_s: float = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+    answer_cache_similarity: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+    # AsyncRagPipeline: in-flight limits per service, threads for CPU embedding/MMR
+    async_max_vector_queries: int = int(os.getenv("ASYNC_MAX_VECTOR_QUERIES", "16"))
+    async_max_reranks: int = int(os.getenv("ASYNC_MAX_RERANKS", "8"))
+    async_max_llm_calls: int = int(os.getenv("ASYNC_MAX_LLM_CALLS", "8"))
+    async_embed_workers: int = int(os.getenv("ASYNC_EMBED_WORKERS", "2"))
+    # RagPipeline.answer_batch: LLM calls per minute across the batch (0 = no limit) and burst size;
+    # in-flight limits per service reuse the ASYNC_MAX_* values
+    batch_llm_max_rpm: float = float(os.getenv("BATCH_LLM_MAX_RPM", "0"))
+    batch_llm_burst: int = int(os.getenv("BATCH_LLM_BURST", "4"))
+
+    # Deadlines: end-to-end per request (0 = none), split into stage budgets that also set the SDK
+    # client timeouts; a rerank that runs out of budget falls back to MMR order
+    request_deadline_s: float = float(os.getenv("REQUEST_DEADLINE_S", "20"))
+    rerank_budget_s: float = float(os.getenv("RERANK_BUDGET_S", "2.5"))
+    llm_budget_s: float = float(os.getenv("LLM_BUDGET_S", "15"))
+    # Provider calls: retries with jittered exponential backoff, hedging (duplicate request after
+    # this many seconds, 0 = off), circuit breaker per provider (consecutive failures, seconds open)
+    call_retries: int = int(os.getenv("CALL_RETRIES", "1"))
+    retry_backoff_s: float = float(os.getenv("RETRY_BACKOFF_S", "0.2"))
+    rerank_hedge_s: float = float(os.getenv("RERANK_HEDGE_S", "0.8"))
+    llm_hedge_s: float = float(os.getenv("LLM_HEDGE_S", "0"))  # off: a hedged completion is paid twice
+    breaker_failures: int = int(os.getenv("BREAKER_FAILURES", "5"))
+    breaker_reset_s: float = float(os.getenv("BREAKER_RESET_S", "30"))
+
+    # Tracing: per-stage spans (off = near-zero overhead), OpenTelemetry bridge, Prometheus /metrics port (0 = off)
+    tracing_enabled: bool = os.getenv("TRACING", "0") == "1"
+    tracing_otel: bool = os.getenv("TRACING_OTEL", "0") == "1"
+    metrics_port: int = int(os.getenv("METRICS_PORT", "0"))
+
     # Chunking / retrieval
     chunk_size_tokens: int = int(os.getenv("CHUNK_SIZE_TOKENS", "1000"))
     chunk_overlap: float = float(os.getenv("CHUNK_OVERLAP", "0.12"))
+    chunk_snap_sentences: bool = os.getenv("CHUNK_SNAP_SENTENCES", "1") == "1"
+    # Re-ingest only changed chunks (content hash per source + position), delete stale ones
+    chunk_manifest_enabled: bool = os.getenv("CHUNK_MANIFEST", "1") == "1"
+    chunk_manifest_path: str = os.getenv("CHUNK_MANIFEST_PATH", ".cache/chunk_manifest.sqlite")
+    # Hybrid retrieval: a local BM25 index kept in step with upserts, fused with the dense hits
+    hybrid_search_enabled: bool = os.getenv("HYBRID_SEARCH", "1") == "1"
+    bm25_dir: str = os.getenv("BM25_DIR", ".cache/bm25")  # Pinecone backend; the local store keeps it per namespace dir
+    hybrid_fusion: str = os.getenv("HYBRID_FUSION", "rrf")  # "rrf" or "weighted"
+    hybrid_rrf_k: int = int(os.getenv("HYBRID_RRF_K", "60"))
+    hybrid_sparse_weight: float = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
     max_context_docs: int = int(os.getenv("MAX_CONTEXT_DOCS", "6"))
+    # Context packing (opt-in): prompt token budget (0 = off, send whole chunks), tokenizer that counts
+    # it (set it to the LLM's; "" = the embedding model's, an approximation), and the LLM's prompt
+    # throughput used to estimate latency saved
+    context_token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+    context_tokenizer: str = os.getenv("CONTEXT_TOKENIZER", "")
+    llm_prompt_tokens_per_s: float = float(os.getenv("LLM_PROMPT_TOKENS_PER_S", "2500"))
     min_score: float = float(os.getenv("MIN_SCORE", "0.25"))
 
 # >>> IMPORTANT: expose a module-level settings object <<<
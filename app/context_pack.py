@@ -0,0 +1,130 @@
+# app/context_pack.py
+"""
+Token-budgeted context packing (extractive compression) before the LLM call.
+
+When the reranked chunks would push the prompt past settings.context_token_budget,
+ContextPacker keeps only their most relevant sentences. A sentence's score mixes its
+chunk's relevance (rerank score, else the cosine of the stored chunk vector with the
+query vector, else rank) with how much of the query's vocabulary it covers (IDF-weighted
+over the candidate sentences). Nothing is re-embedded, so packing costs a tokenizer pass.
+Kept sentences stay in document order under their chunk, so every [n] citation still
+points at the chunk it came from; chunks with no kept sentence are dropped before the
+citations are numbered.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+import math
+import re
+
+import numpy as np
+
+from app.bm25 import bm25_terms
+from app.utils import format_context_block
+
+# Share of a sentence's score that comes from its chunk's relevance (the rest: query-term coverage)
+CHUNK_WEIGHT = 0.3
+GAP = " … "  # joins kept sentences that were not adjacent in the chunk
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[A-Z0-9])|\n\s*\n")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def count_tokens(tokenizer, texts: List[str]) -> List[int]:
+    """Token counts of `texts` in one tokenizer call (Hugging Face tokenizer or chunking.RegexTokenizer)."""
+    if not texts:
+        return []
+    if hasattr(tokenizer, "spans"):
+        return [len(tokenizer.spans(t)) for t in texts]
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def _chunk_relevance(contexts: List[Dict[str, Any]]) -> np.ndarray:
+    """Per-chunk relevance in [0, 1] from the signals the retrieval stages already produced."""
+    if all(c.get("rerank_score") is not None for c in contexts):
+        raw = np.array([c["rerank_score"] for c in contexts], dtype=np.float32)
+    elif all(c.get("values") and c.get("query_values") is not None for c in contexts):
+        E = np.asarray([c["values"] for c in contexts], dtype=np.float32)
+        q = np.asarray(contexts[0]["query_values"], dtype=np.float32)
+        raw = (E @ q) / (np.linalg.norm(E, axis=1) * np.linalg.norm(q) + 1e-12)
+    else:
+        raw = 1.0 / (1.0 + np.arange(len(contexts), dtype=np.float32))
+    lo, hi = float(raw.min()), float(raw.max())
+    return (raw - lo) / (hi - lo) if hi > lo else np.ones(len(contexts), dtype=np.float32)
+
+
+class ContextPacker:
+    """Fits the prompt's context blocks into `budget_tokens` prompt tokens, counted with `tokenizer`."""
+
+    def __init__(self, tokenizer, budget_tokens: int):
+        self.tokenizer = tokenizer
+        self.budget_tokens = budget_tokens
+
+    def pack(self, query: str, contexts: List[Dict[str, Any]], fixed_prompt: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        (contexts to send, stats). `fixed_prompt` is everything in the prompt except the
+        context blocks (system prompt, question, instructions). Compressed chunks get a
+        "prompt_text" with their kept sentences; "text" stays whole for display.
+        stats: context_tokens_before / context_tokens_after, sentences_total / sentences_kept.
+        """
+        blocks = [format_context_block(c, i) for i, c in enumerate(contexts, start=1)]
+        fixed, *block_tokens = count_tokens(self.tokenizer, [fixed_prompt] + blocks)
+        before = sum(block_tokens)
+        budget = self.budget_tokens - fixed
+        stats = {"context_tokens_before": before, "context_tokens_after": before,
+                 "sentences_total": None, "sentences_kept": None}
+        if before <= budget or not contexts:
+            return contexts, stats
+
+        # Candidate sentences: (context index, position in chunk, text)
+        sents = [(ci, si, s) for ci, c in enumerate(contexts) for si, s in enumerate(split_sentences(c["text"]))]
+        texts = [s for _, _, s in sents]
+        empty_blocks = [format_context_block({**c, "prompt_text": " "}, i) for i, c in enumerate(contexts, start=1)]
+        counts = count_tokens(self.tokenizer, texts + empty_blocks)
+        sent_tokens, overhead = counts[:len(texts)], counts[len(texts):]
+
+        scores = self._scores(query, contexts, sents)
+        order = sorted(range(len(sents)), key=lambda k: (-scores[k], sents[k][0], sents[k][1]))
+        kept: Dict[int, List[int]] = {}
+        used = 0
+        for k in order:
+            ci = sents[k][0]
+            cost = sent_tokens[k] + (0 if ci in kept else overhead[ci])
+            if used + cost <= budget or not kept:  # the best sentence is always sent
+                kept.setdefault(ci, []).append(k)
+                used += cost
+
+        packed = []
+        for ci, c in enumerate(contexts):
+            if ci not in kept:
+                continue
+            ks = sorted(kept[ci], key=lambda k: sents[k][1])
+            parts = [sents[ks[0]][2]]
+            for prev, k in zip(ks, ks[1:]):
+                parts.append((" " if sents[k][1] == sents[prev][1] + 1 else GAP) + sents[k][2])
+            packed.append({**c, "prompt_text": "".join(parts)})
+
+        after = count_tokens(self.tokenizer, [format_context_block(c, i) for i, c in enumerate(packed, start=1)])
+        stats.update(context_tokens_after=sum(after), sentences_total=len(sents),
+                     sentences_kept=sum(len(v) for v in kept.values()))
+        return packed, stats
+
+    @staticmethod
+    def _scores(query: str, contexts: List[Dict[str, Any]], sents: List[Tuple[int, int, str]]) -> List[float]:
+        chunk = _chunk_relevance(contexts)
+        q_terms = set(bm25_terms(query))
+        sent_terms = [set(bm25_terms(s)) & q_terms for _, _, s in sents]
+        n = len(sents)
+        # BM25-style IDF over the candidate sentences: rare query terms count more; terms that
+        # no sentence contains are left out so they don't dilute everyone's coverage
+        df = {}
+        for ts in sent_terms:
+            for t in ts:
+                df[t] = df.get(t, 0) + 1
+        idf = {t: math.log(1.0 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+        total = sum(idf.values()) or 1.0
+        return [CHUNK_WEIGHT * float(chunk[ci]) + (1 - CHUNK_WEIGHT) * sum(idf[t] for t in ts) / total
+                for (ci, _, _), ts in zip(sents, sent_terms)]
@@ -0,0 +1,71 @@
+# app/doc_store.py
+"""
+Local chunk-text store keyed by (namespace, vector id).
+
+With it the vector index only carries ids, vectors and small citation metadata: queries
+stop downloading the text of every match, chunk size is no longer bounded by the
+index's metadata limit, and the text of the few chunks that survive MMR is read here
+in one bulk lookup. Ingest and query must share the same file (same host or volume).
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import sqlite3
+import threading
+
+
+class DocStore:
+    """SQLite (WAL) table docs(namespace, id, text); safe to share between threads and processes."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " namespace TEXT NOT NULL, id TEXT NOT NULL, text TEXT NOT NULL, PRIMARY KEY (namespace, id))"
+            " WITHOUT ROWID"
+        )
+
+    def put_many(self, namespace: str, items: Iterable[Tuple[str, str]]) -> None:
+        """(id, text) pairs in one transaction; existing ids are overwritten."""
+        rows = [(namespace, vid, text) for vid, text in items]
+        if not rows:
+            return
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO docs (namespace, id, text) VALUES (?, ?, ?)", rows)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def get_many(self, namespace: str, ids: List[str]) -> Dict[str, str]:
+        """id -> text for the ids that are stored."""
+        out: Dict[str, str] = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                part = ids[start:start + 500]
+                marks = ",".join("?" * len(part))
+                out.update(self.db.execute(
+                    f"SELECT id, text FROM docs WHERE namespace = ? AND id IN ({marks})", [namespace, *part]
+                ).fetchall())
+        return out
+
+    def delete(self, namespace: str, ids: List[str]) -> None:
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.executemany("DELETE FROM docs WHERE namespace = ? AND id = ?", [(namespace, i) for i in ids])
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        self.db.close()
@@ -0,0 +1,206 @@
+# app/embedding_cache.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Tuple
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace/Unicode differences don't change MiniLM tokens, so they shouldn't miss the cache
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model name, normalized text hash).
+
+    - vectors: fixed-capacity float32 memmap (`vectors.f32`, one row per slot)
+    - key index: SQLite in WAL mode (key -> slot, crc, last_used), safe across processes
+    - in-process LRU front for hot keys
+    - size-based eviction: once `max_entries` slots are used, least-recently-used slots are reused
+    - switching model name or dim wipes the index automatically
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        model_name: str,
+        dim: int,
+        max_entries: int = 50_000,
+        memory_items: int = 2048,
+    ):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.memory_items = memory_items
+        self.root = Path(cache_dir)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._db = sqlite3.connect(self.root / "index.sqlite", timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, slot INTEGER NOT NULL, crc INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_slot ON entries(slot)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+        self._check_model()
+
+        # Sparse file sized for full capacity; every process maps the same pages (MAP_SHARED)
+        vec_path = self.root / "vectors.f32"
+        size = self.max_entries * self.dim * 4
+        with open(vec_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._vectors = np.memmap(vec_path, dtype=np.float32, mode="r+", shape=(self.max_entries, self.dim))
+
+    # -------- Invalidation --------
+    def _check_model(self) -> None:
+        fingerprint = f"{self.model_name}|{self.dim}|{self.max_entries}"
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute("SELECT v FROM meta WHERE k = 'model'").fetchone()
+            if row is None or row[0] != fingerprint:
+                # Different model (or layout) -> every stored vector is stale
+                self._db.execute("DELETE FROM entries")
+                self._db.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('model', ?)", (fingerprint,))
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def key(self, text: str) -> str:
+        h = hashlib.sha256()
+        h.update(self.model_name.encode())
+        h.update(b"\0")
+        h.update(normalize_text(text).encode())
+        return h.hexdigest()
+
+    # -------- Lookup --------
+    def get_many(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """Return ({position: vector} for cached texts, [positions that missed])."""
+        keys = [self.key(t) for t in texts]
+        found: Dict[int, np.ndarray] = {}
+        pending: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, k in enumerate(keys):
+                vec = self._memory.get(k)
+                if vec is not None:
+                    self._memory.move_to_end(k)
+                    found[i] = vec
+                    self.counters["memory_hits"] += 1
+                else:
+                    pending.setdefault(k, []).append(i)
+
+            if pending:
+                hits = []
+                pending_keys = list(pending)
+                for start in range(0, len(pending_keys), 500):
+                    part = pending_keys[start:start + 500]
+                    marks = ",".join("?" * len(part))
+                    rows = self._db.execute(
+                        f"SELECT key, slot, crc FROM entries WHERE key IN ({marks})", part
+                    ).fetchall()
+                    for k, slot, crc in rows:
+                        vec = np.array(self._vectors[slot])
+                        # crc guards against a slot being recycled by another process mid-read
+                        if zlib.crc32(vec.tobytes()) != crc:
+                            continue
+                        self._remember(k, vec)
+                        for i in pending.pop(k):
+                            found[i] = vec
+                        hits.append(k)
+                self.counters["disk_hits"] += len(hits)
+                if hits:
+                    now = time.time()
+                    try:
+                        self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k in hits])
+                    except sqlite3.OperationalError:
+                        pass  # LRU bookkeeping is best-effort under contention
+
+            missing = sorted(i for idxs in pending.values() for i in idxs)
+            self.counters["misses"] += len(missing)
+        return found, missing
+
+    # -------- Store --------
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        unique: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        for t, v in zip(texts, vectors):
+            unique[self.key(t)] = v
+
+        with self._lock:
+            for k, v in unique.items():
+                self._remember(k, v)
+
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                marks = ",".join("?" * len(unique))
+                known = {r[0] for r in self._db.execute(f"SELECT key FROM entries WHERE key IN ({marks})", list(unique))}
+                new_keys = [k for k in unique if k not in known]
+                slots = self._allocate(len(new_keys))
+                now = time.time()
+                rows = []
+                for k, slot in zip(new_keys, slots):
+                    vec = unique[k]
+                    self._vectors[slot] = vec
+                    rows.append((k, slot, zlib.crc32(vec.tobytes()), now))
+                if rows:
+                    # No msync here: other processes read the same shared mapping, the kernel writes
+                    # it back, and a row torn by a crash fails its crc check on lookup
+                    self._db.executemany("INSERT OR REPLACE INTO entries (key, slot, crc, last_used) VALUES (?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _allocate(self, n: int) -> List[int]:
+        # Called inside a write transaction: fresh slots first, then recycle LRU slots
+        if n == 0:
+            return []
+        n = min(n, self.max_entries)
+        next_free = self._db.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()[0]
+        fresh = list(range(next_free, min(self.max_entries, next_free + n)))
+        need = n - len(fresh)
+        if need <= 0:
+            return fresh
+        victims = self._db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (need,)).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+        self.counters["evictions"] += len(victims)
+        return fresh + [s for _, s in victims]
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # -------- Stats --------
+    def stats(self) -> Dict[str, float]:
+        c = dict(self.counters)
+        lookups = c["memory_hits"] + c["disk_hits"] + c["misses"]
+        c["hit_rate"] = (c["memory_hits"] + c["disk_hits"]) / lookups if lookups else 0.0
+        c["entries"] = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return c
+
+    def close(self) -> None:
+        self._vectors.flush()
+        self._db.close()
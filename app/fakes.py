@@ -0,0 +1,231 @@
+# app/fakes.py
+"""
+Offline stand-ins for the vector store, reranker and LLM with injected latency and failures.
+Used by load tests and benchmarks to exercise RagPipeline without network access.
+
+Every `latency_s` accepts a fixed number of seconds or a Latency (a seeded distribution);
+`failure_rate` is the probability that a call raises FakeServiceError.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Tuple
+import hashlib
+import math
+import random
+import threading
+import time
+
+import numpy as np
+
+from app.retriever_pine import build_vectors
+
+
+def hash_embed(texts: List[str], dim: int = 384) -> np.ndarray:
+    """Deterministic bag-of-words embedding (unit length); similar texts get similar vectors."""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, t in enumerate(texts):
+        for w in t.lower().split():
+            w = w.strip(".,;:?!()[]\"'")
+            if w:
+                out[i, int.from_bytes(hashlib.blake2b(w.encode(), digest_size=4).digest(), "little") % dim] += 1.0
+    return out / (np.linalg.norm(out, axis=1, keepdims=True) + 1e-12)
+
+
+class FakeServiceError(RuntimeError):
+    """Injected provider failure (timeout, 5xx, rate limit) raised by the fakes."""
+
+
+class Latency:
+    """
+    Per-call delay: lognormal with median `p50_s` and 99th percentile `p99_s` (the long right
+    tail of a network service), or fixed at `p50_s` when `p99_s` is not above it. Seeded, thread-safe.
+    """
+
+    def __init__(self, p50_s: float, p99_s: float | None = None, seed: int | None = 0):
+        self.p50_s = p50_s
+        self.p99_s = p99_s
+        # p99 sits 2.326 standard deviations above the median in log space
+        self._sigma = math.log(p99_s / p50_s) / 2.326 if p99_s and p50_s > 0 and p99_s > p50_s else 0.0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self._sigma == 0.0:
+            return self.p50_s
+        with self._lock:
+            return self._rng.lognormvariate(math.log(self.p50_s), self._sigma)
+
+
+def _seconds(latency) -> float:
+    return latency.sample() if isinstance(latency, Latency) else float(latency)
+
+
+class _Faults:
+    """Raises FakeServiceError on a seeded `failure_rate` share of calls."""
+
+    def __init__(self, service: str, failure_rate: float, seed: int | None):
+        self.service = service
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def maybe_fail(self) -> None:
+        if self.failure_rate <= 0.0:
+            return
+        with self._lock:
+            failed = self._rng.random() < self.failure_rate
+        if failed:
+            raise FakeServiceError(f"injected {self.service} failure")
+
+
+class FakeRetriever:
+    """In-memory exact search behind a per-call latency (queries and upserts)."""
+
+    supports_values = True
+
+    def __init__(self, latency_s: float | Latency = 0.0, dim: int = 384, failure_rate: float = 0.0,
+                 seed: int | None = 0):
+        self.latency_s = latency_s
+        self.dim = dim
+        self._faults = _Faults("vector store", failure_rate, seed)
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._meta: List[Dict[str, Any]] = []
+        self._V = np.zeros((0, dim), dtype=np.float32)
+
+    def embed_array(self, texts: List[str], batch_size: int | None = None) -> np.ndarray:
+        return hash_embed(texts, self.dim)
+
+    def embed(self, texts: List[str], batch_size: int | None = None) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def upsert_chunks(self, chunks: List[Dict[str, Any]], namespace: str | None = None) -> Dict[str, Any]:
+        t0 = time.time()
+        vectors = build_vectors(chunks, self.embed_array([c["text"] for c in chunks]))
+        self.upsert_vectors(vectors, namespace)
+        elapsed = time.time() - t0
+        return {"chunks": len(vectors), "batches": [], "embed_s": 0.0, "upsert_s": elapsed,
+                "chunks_per_s": len(vectors) / elapsed if elapsed > 0 else 0.0}
+
+    def upsert_vectors(self, vectors: List[Dict[str, Any]], namespace: str | None = None) -> List[Dict[str, Any]]:
+        t0 = time.time()
+        time.sleep(_seconds(self.latency_s))
+        self._faults.maybe_fail()
+        with self._lock:
+            index = {vid: i for i, vid in enumerate(self._ids)}
+            rows = []
+            for v in vectors:
+                if v["id"] in index:
+                    self._meta[index[v["id"]]] = v["metadata"]
+                    self._V[index[v["id"]]] = v["values"]
+                else:
+                    index[v["id"]] = len(self._ids)
+                    self._ids.append(v["id"])
+                    self._meta.append(v["metadata"])
+                    rows.append(v["values"])
+            if rows:
+                self._V = np.vstack([self._V, np.asarray(rows, dtype=np.float32)])
+        return [{"count": len(vectors), "bytes": 0, "upsert_s": time.time() - t0}] if vectors else []
+
+    def delete_ids(self, ids: List[str], namespace: str | None = None) -> int:
+        drop = set(ids)
+        with self._lock:
+            keep = [i for i, vid in enumerate(self._ids) if vid not in drop]
+            removed = len(self._ids) - len(keep)
+            self._ids = [self._ids[i] for i in keep]
+            self._meta = [self._meta[i] for i in keep]
+            self._V = self._V[keep]
+        return removed
+
+    def retrieve(self, query: str, top_k: int | None = None, namespace: str | None = None,
+                 min_score: float = 0.25, include_values: bool = False):
+        return self.retrieve_by_vector(self.embed_array([query])[0], top_k, namespace, min_score, include_values)
+
+    def retrieve_by_vector(self, qvec, top_k: int | None = None, namespace: str | None = None,
+                           min_score: float = 0.25, include_values: bool = False):
+        time.sleep(_seconds(self.latency_s))
+        self._faults.maybe_fail()
+        q = np.asarray(qvec, dtype=np.float32)
+        with self._lock:
+            V, ids, meta = self._V, list(self._ids), list(self._meta)
+        if not ids:
+            return []
+        scores = V @ q
+        top = np.argsort(-scores)[: top_k or 25]
+        qlist = q.tolist()
+        hits = []
+        for i in top:
+            if scores[i] >= min_score:
+                hit = {"id": ids[i], "score": float(scores[i]), "text": meta[i].get("text", ""), "metadata": meta[i]}
+                if include_values:
+                    hit["values"] = V[i].tolist()
+                    hit["query_values"] = qlist
+                hits.append(hit)
+        return hits
+
+
+class FakeReranker:
+    """Word-overlap scorer behind a per-call latency."""
+
+    backend = "fake"
+    model = "fake-rerank"
+
+    def __init__(self, latency_s: float | Latency = 0.0, failure_rate: float = 0.0, seed: int | None = 0):
+        self.latency_s = latency_s
+        self._faults = _Faults("rerank", failure_rate, seed)
+
+    def rerank(self, query: str, documents: List[str], top_n: int) -> List[Tuple[int, float]]:
+        time.sleep(_seconds(self.latency_s))
+        self._faults.maybe_fail()
+        q = set(query.lower().split())
+        scores = [len(q & set(d.lower().split())) / (len(q) or 1) for d in documents]
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return [(i, scores[i]) for i in order]
+
+
+class FakeLLM:
+    """Echoes the first context line with a citation; sleeps `latency_s` per call."""
+
+    backend = "fake"
+    model = "fake-llm"
+
+    def __init__(self, latency_s: float | Latency = 0.0, ttft_s: float = 0.0, tokens: int = 20,
+                 failure_rate: float = 0.0, seed: int | None = 0):
+        self.latency_s = latency_s
+        self.ttft_s = ttft_s
+        self.tokens = tokens
+        self._faults = _Faults("LLM", failure_rate, seed)
+
+    def _text(self, messages: List[Dict[str, str]]) -> str:
+        prompt = messages[-1]["content"]
+        first = prompt.split("Context:\n", 1)[-1].split("\n", 1)[0]
+        return f"{first[:200]} [1]"
+
+    def _usage(self, messages) -> Dict[str, int]:
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": self.tokens,
+                "total_tokens": prompt_tokens + self.tokens}
+
+    def generate_with_meta(self, messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 600):
+        t0 = time.time()
+        time.sleep(_seconds(self.latency_s))
+        self._faults.maybe_fail()
+        latency = time.time() - t0
+        return {"text": self._text(messages), "latency_s": latency, "ttft_s": latency,
+                "usage": self._usage(messages), "model": self.model, "id": None}
+
+    def stream_with_meta(self, messages: List[Dict[str, str]], temperature: float = 0.2,
+                         max_tokens: int = 600) -> Iterator[Dict[str, Any]]:
+        t0 = time.time()
+        total = _seconds(self.latency_s)
+        time.sleep(self.ttft_s)
+        self._faults.maybe_fail()
+        ttft = time.time() - t0
+        words = self._text(messages).split(" ")
+        step = max(0.0, total - self.ttft_s) / max(1, len(words))
+        for i, w in enumerate(words):
+            if i:
+                time.sleep(step)
+            yield {"type": "token", "text": w if i == 0 else " " + w}
+        yield {"type": "done", "text": " ".join(words), "latency_s": time.time() - t0, "ttft_s": ttft,
+               "usage": self._usage(messages), "model": self.model, "id": None}
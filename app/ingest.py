@@ -0,0 +1,278 @@
+# app/ingest.py
+"""
+Streaming document ingestion: extract -> chunk -> embed -> upsert.
+
+Stages run concurrently and are connected by bounded queues, so a large PDF never
+sits in memory as one string and upserts start after the first batch is embedded:
+
+    PDF pages (process pool, ordered, bounded in flight)
+      -> StreamingChunker (producer thread) -> [embed queue]
+      -> retriever.embed_array (embed thread) -> [upsert queue]
+      -> retriever.upsert_vectors (calling thread, reports progress)
+
+Worker processes are started with "spawn", never forked: ingestion also runs inside the
+Streamlit server, whose threads (and their locks) a fork would copy mid-flight.
+"""
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+import multiprocessing
+import queue
+import threading
+import time
+
+from app.config import settings
+from app.retriever_pine import build_vectors
+from app.chunking import StreamingChunker, make_chunker
+from app.chunk_manifest import SourceDiff
+
+Progress = Callable[[Dict[str, Any]], None]
+
+_DONE = object()
+
+
+def process_pool(workers: int, initializer=None, initargs=()) -> ProcessPoolExecutor:
+    """ProcessPoolExecutor whose workers are spawned (safe to start from a threaded server)."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=initializer, initargs=initargs)
+
+
+# -------- PDF extraction --------
+_reader = None  # one PdfReader per worker process
+
+
+def _open_reader(path: str) -> None:
+    global _reader
+    import PyPDF2  # type: ignore
+    _reader = PyPDF2.PdfReader(path)
+
+
+def _page_text(page) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception:
+        return ""
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """(1-based page number, text) for pages [start, stop); runs in a worker process."""
+    if _reader is None:
+        _open_reader(path)
+    return [(i + 1, _page_text(_reader.pages[i])) for i in range(start, stop)]
+
+
+def pdf_page_count(path: str | Path) -> int:
+    import PyPDF2  # type: ignore
+    return len(PyPDF2.PdfReader(str(path)).pages)
+
+
+def open_pdf(
+    path: str | Path,
+    workers: int | None = None,
+    pages_per_task: int = 8,
+) -> Tuple[int, Iterator[Tuple[int, str]]]:
+    """
+    Parse the PDF once and return (page count, iterator of (page number, text) in page
+    order). Page ranges are extracted in a process pool (text extraction is CPU-bound
+    pure Python); at most 2 * workers ranges are in flight, so memory stays bounded
+    however long the document is. Without a pool the pages come from this parse.
+    """
+    import PyPDF2  # type: ignore
+    path = str(path)
+    reader = PyPDF2.PdfReader(path)
+    workers = workers if workers is not None else settings.ingest_pdf_workers
+    return len(reader.pages), _pdf_pages(path, reader, workers, pages_per_task)
+
+
+def extract_pdf_pages(
+    path: str | Path,
+    workers: int | None = None,
+    pages_per_task: int = 8,
+) -> Iterator[Tuple[int, str]]:
+    """(page number, text) in page order; see open_pdf."""
+    return open_pdf(path, workers, pages_per_task)[1]
+
+
+def _pdf_pages(path: str, reader, workers: int, pages_per_task: int) -> Iterator[Tuple[int, str]]:
+    n_pages = len(reader.pages)
+    ranges = [(s, min(n_pages, s + pages_per_task)) for s in range(0, n_pages, pages_per_task)]
+    if workers <= 1 or len(ranges) <= 1:
+        for i in range(n_pages):
+            yield i + 1, _page_text(reader.pages[i])
+        return
+
+    with process_pool(workers, initializer=_open_reader, initargs=(path,)) as pool:
+        pending = deque()
+        todo = iter(ranges)
+        for start, stop in todo:
+            pending.append(pool.submit(_extract_range, path, start, stop))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending.append(pool.submit(_extract_range, path, *nxt))
+            yield from pages
+
+
+# -------- Streaming ingest --------
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    # Blocking put that gives up once the consumer has failed
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    # Blocking get that returns _DONE once the consumer has failed
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def stream_ingest(
+    retriever,
+    pages: Iterable[Tuple[int | None, str]],
+    meta: Dict[str, Any],
+    namespace: str | None = None,
+    total_pages: int | None = None,
+    on_progress: Progress | None = None,
+    batch_chunks: int | None = None,
+    queue_depth: int | None = None,
+    chunker: StreamingChunker | None = None,
+    diff: SourceDiff | None = None,
+) -> Dict[str, Any]:
+    """
+    Chunk, embed and upsert `pages` with the three stages overlapping.
+    With a `diff`, unchanged chunks are skipped and stale ids deleted once every upsert
+    succeeded; the counts are returned under "diff".
+    `on_progress` is called on the calling thread with {"stage": "batch", "batch", "chunks", "chunks_total",
+    "upsert_s"} events and {"stage": "page", "page", "pages_done", "total_pages"} events; a page is
+    reported only once every chunk that overlaps it is upserted.
+    Returns upsert_chunks-style stats plus "pages".
+    """
+    chunker = chunker or make_chunker()
+    batch_chunks = batch_chunks or settings.ingest_batch_chunks
+    queue_depth = queue_depth or settings.ingest_queue_depth
+    embed_q: queue.Queue = queue.Queue(maxsize=queue_depth)
+    upsert_q: queue.Queue = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    embed_s = [0.0]
+
+    def _produce():
+        try:
+            batch: List[Dict[str, Any]] = []
+
+            def _pages():
+                for page, text in pages:
+                    yield page, text
+                    # page marker travels behind the chunks it produced
+                    if not _put(embed_q, ("page", page), stop):
+                        return
+
+            chunks = chunker.chunks(_pages(), meta)
+            for chunk in (diff.filter(chunks) if diff is not None else chunks):
+                batch.append(chunk)
+                if len(batch) >= batch_chunks:
+                    if not _put(embed_q, ("chunks", batch), stop):
+                        return
+                    batch = []
+            if batch:
+                _put(embed_q, ("chunks", batch), stop)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            _put(embed_q, _DONE, stop)
+
+    def _embed():
+        try:
+            while True:
+                item = _get(embed_q, stop)
+                if item is _DONE:
+                    break
+                if item[0] == "chunks":
+                    t0 = time.time()
+                    values = retriever.embed_array([c["text"] for c in item[1]])
+                    embed_s[0] += time.time() - t0
+                    item = ("vectors", build_vectors(item[1], values))
+                if not _put(upsert_q, item, stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            _put(upsert_q, _DONE, stop)
+
+    threads = [threading.Thread(target=_produce, name="ingest-chunk", daemon=True),
+               threading.Thread(target=_embed, name="ingest-embed", daemon=True)]
+    t0 = time.time()
+    for t in threads:
+        t.start()
+
+    batch_stats: List[Dict[str, Any]] = []
+    n_pages = n_chunks = n_batches = 0
+    t_upsert = 0.0
+    read: deque = deque()  # pages handed to the chunker, not yet reported
+
+    def _pages_upserted(before: int | None) -> None:
+        """Report read pages before page `before` (all of them when None)."""
+        nonlocal n_pages
+        while read and (before is None or (read[0] is not None and read[0] < before)):
+            n_pages += 1
+            page = read.popleft()
+            if on_progress:
+                on_progress({"stage": "page", "page": page, "pages_done": n_pages, "total_pages": total_pages})
+
+    try:
+        while True:
+            item = upsert_q.get()
+            if item is _DONE:
+                break
+            kind, payload = item
+            if kind == "page":
+                read.append(payload)
+                continue
+            tb = time.time()
+            stats = retriever.upsert_vectors(payload, namespace)
+            t_upsert += time.time() - tb
+            batch_stats.extend(stats)
+            n_chunks += len(payload)
+            n_batches += 1
+            if on_progress:
+                on_progress({"stage": "batch", "batch": n_batches, "chunks": len(payload),
+                             "chunks_total": n_chunks, "upsert_s": time.time() - tb})
+            # Chunks arrive in text order, so later chunks start at or after this one's page
+            last_page = payload[-1]["metadata"].get("page")
+            if last_page is not None:
+                _pages_upserted(last_page)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    _pages_upserted(None)
+
+    elapsed = time.time() - t0
+    out = {
+        "chunks": n_chunks,
+        "pages": n_pages,
+        "batches": batch_stats,
+        "embed_s": embed_s[0],
+        "upsert_s": t_upsert,
+        "chunks_per_s": n_chunks / elapsed if elapsed > 0 else 0.0,
+    }
+    if diff is not None:
+        out["diff"] = diff.finish(retriever)
+    return out
@@ -0,0 +1,52 @@
+# app/lazy.py
+"""
+Deferred imports for heavy SDKs and model libraries, so `import app.pipeline` stays
+cheap (tests, scripts, Streamlit cold start) and the cost is paid on first use.
+"""
+from __future__ import annotations
+
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Callable
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Module object whose real import runs on first attribute access
+    (importlib.util.LazyLoader). Already-imported modules are returned as-is.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class LazyValue:
+    """Thread-safe build-once holder for an expensive object (model, SDK client)."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value: Any = None
+        self._built = False
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    def get(self) -> Any:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._value = self._factory()
+                    self._built = True
+        return self._value
@@ -1,19 +1,32 @@
 # app/llm.py
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 from app.config import settings
-from groq import Groq
+from app.lazy import LazyValue
 import time
 
+
+def Groq(api_key: str):
+    # groq (and its httpx/pydantic stack) is imported on first use, not with this module
+    from groq import Groq as _Groq
+    # The pipeline retries (app.resilience); the client timeout ends calls it stopped waiting for
+    return _Groq(api_key=api_key, timeout=settings.llm_budget_s, max_retries=0)
+
 SYSTEM_PROMPT = """You are a precise, citation-first assistant. 
 Use only the provided context. If unsure, say you don't know.
 Cite sources inline like [1], [2] corresponding to the provided context chunks.
 Keep answers concise and factual."""
 
 class GroqLLM:
+    backend = "groq"
+
     def __init__(self):
-        self.client = Groq(api_key=settings.groq_api_key)
+        self._client = LazyValue(lambda: Groq(api_key=settings.groq_api_key))
         self.model = settings.groq_model
 
+    @property
+    def client(self):
+        return self._client.get()
+
     def generate(self, messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 600) -> str:
         chat = self.client.chat.completions.create(
             model=self.model,
@@ -37,26 +50,73 @@ class GroqLLM:
         latency = time.time() - t0
         text = (chat.choices[0].message.content or "").strip()
 
-        usage_raw = getattr(chat, "usage", None)
-
-        # Normalize usage to a dict (works for dicts and Pydantic objects)
-        def _get(attr, default=None):
-            if usage_raw is None:
-                return default
-            if isinstance(usage_raw, dict):
-                return usage_raw.get(attr, default)
-            # Pydantic object or similar
-            return getattr(usage_raw, attr, default)
-
-        usage_norm = {
-            "prompt_tokens": _get("prompt_tokens"),
-            "completion_tokens": _get("completion_tokens"),
-            "total_tokens": _get("total_tokens"),
-        }
-
         return {
             "text": text,
             "latency_s": latency,
-            "usage": usage_norm,
+            "ttft_s": latency,  # nothing is shown before the full completion arrives
+            "usage": _normalize_usage(getattr(chat, "usage", None)),
             "model": self.model,
-        }
\ No newline at end of file
+            "id": getattr(chat, "id", None),
+        }
+
+    def stream_with_meta(
+        self, messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 600
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the completion. Yields {"type": "token", "text": delta} as deltas arrive,
+        then one {"type": "done", "text", "latency_s", "ttft_s", "usage", "model", "id"}.
+        """
+        t0 = time.time()
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        parts: List[str] = []
+        ttft = None
+        usage_raw = None
+        response_id = None
+        for chunk in stream:
+            response_id = response_id or getattr(chunk, "id", None)
+            # Groq reports usage on the last chunk (x_groq.usage); OpenAI-style servers use chunk.usage
+            x_groq = getattr(chunk, "x_groq", None)
+            x_usage = x_groq.get("usage") if isinstance(x_groq, dict) else getattr(x_groq, "usage", None)
+            usage_raw = getattr(chunk, "usage", None) or x_usage or usage_raw
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                if ttft is None:
+                    ttft = time.time() - t0
+                parts.append(delta)
+                yield {"type": "token", "text": delta}
+
+        latency = time.time() - t0
+        yield {
+            "type": "done",
+            "text": "".join(parts).strip(),
+            "latency_s": latency,
+            "ttft_s": ttft if ttft is not None else latency,
+            "usage": _normalize_usage(usage_raw),
+            "model": self.model,
+            "id": response_id,
+        }
+
+
+def _normalize_usage(usage_raw) -> Dict[str, Any]:
+    """Normalize usage to a dict (works for dicts and Pydantic objects)."""
+    def _get(attr, default=None):
+        if usage_raw is None:
+            return default
+        if isinstance(usage_raw, dict):
+            return usage_raw.get(attr, default)
+        # Pydantic object or similar
+        return getattr(usage_raw, attr, default)
+
+    return {
+        "prompt_tokens": _get("prompt_tokens"),
+        "completion_tokens": _get("completion_tokens"),
+        "total_tokens": _get("total_tokens"),
+    }
@@ -0,0 +1,166 @@
+# app/onnx_embedder.py
+"""
+ONNX Runtime embedding backend (EMBEDDING_BACKEND=onnx).
+
+The sentence-transformers model is exported once to ONNX with its pooling inside the
+graph, dynamically quantized to int8 (weights of MatMul/Gemm), and cached on disk.
+OnnxEmbedder then serves the same encode()/tokenizer/max_seq_length surface as a
+SentenceTransformer, so DenseRetriever uses it unchanged. Requires onnxruntime (and
+onnx for the one-off export/quantization step).
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterator, List
+import json
+import os
+import re
+
+import numpy as np
+
+from app.config import settings
+
+
+def _model_dir(cache_dir: str | Path, model_name: str, quantize: bool) -> Path:
+    return Path(cache_dir) / (re.sub(r"[^A-Za-z0-9_.-]", "_", model_name) + ("-int8" if quantize else "-fp32"))
+
+
+def export_onnx(model_name: str, cache_dir: str | Path, quantize: bool = True) -> Path:
+    """
+    Export `model_name` (a sentence-transformers model: transformer + mean/CLS pooling) to
+    `<cache_dir>/<model>-int8/model.onnx`, with the tokenizer and an embedder.json next to it.
+    Returns the directory; an existing export is reused.
+    """
+    out = _model_dir(cache_dir, model_name, quantize)
+    if (out / "model.onnx").exists() and (out / "embedder.json").exists():
+        return out
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0]
+    pooling = st[1] if len(st) > 1 else None
+    mode = "cls" if pooling is not None and getattr(pooling, "pooling_mode_cls_token", False) else "mean"
+
+    class Pooled(torch.nn.Module):
+        def __init__(self, net):
+            super().__init__()
+            self.net = net
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            kwargs = {"token_type_ids": token_type_ids} if token_type_ids is not None else {}
+            hidden = self.net(input_ids=input_ids, attention_mask=attention_mask, **kwargs)[0]
+            if mode == "cls":
+                return hidden[:, 0]
+            mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+            return (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+
+    out.mkdir(parents=True, exist_ok=True)
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+    fp32 = out / f"model.fp32.{os.getpid()}.onnx"
+    with torch.inference_mode():
+        torch.onnx.export(
+            Pooled(transformer.auto_model.eval()),
+            tuple(sample[k] for k in names),
+            str(fp32),
+            input_names=names,
+            output_names=["embedding"],
+            dynamic_axes={**{k: {0: "batch", 1: "seq"} for k in names}, "embedding": {0: "batch"}},
+            opset_version=17,
+            dynamo=False,
+        )
+    tmp = out / f"model.{os.getpid()}.tmp.onnx"
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(fp32), str(tmp), weight_type=QuantType.QInt8)
+        fp32.unlink()
+    else:
+        fp32.replace(tmp)
+    tokenizer.save_pretrained(out)
+    (out / "embedder.json").write_text(json.dumps({
+        "model_name": model_name,
+        "pooling": mode,
+        "max_seq_length": st.max_seq_length,
+        "dim": (getattr(st, "get_embedding_dimension", None) or st.get_sentence_embedding_dimension)(),
+        "quantized": quantize,
+    }))
+    os.replace(tmp, out / "model.onnx")  # last, so a half-finished export is never picked up
+    return out
+
+
+def length_buckets(lengths: List[int], batch_size: int, max_batch_tokens: int) -> Iterator[np.ndarray]:
+    """
+    Indices grouped into batches of similar token length (sorted by length), each capped at
+    `batch_size` items and at `max_batch_tokens` padded tokens (items * longest item).
+    """
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    start = 0
+    while start < len(order):
+        end = start + 1
+        # sorted ascending, so the padded width is the length of the last item taken
+        while end < len(order) and end - start < batch_size and (end - start + 1) * lengths[order[end]] <= max_batch_tokens:
+            end += 1
+        yield order[start:end]
+        start = end
+
+
+class OnnxEmbedder:
+    """SentenceTransformer-compatible encoder running an exported (int8) ONNX graph on CPU."""
+
+    def __init__(
+        self,
+        model_name: str | None = None,
+        cache_dir: str | Path | None = None,
+        quantize: bool | None = None,
+        threads: int | None = None,
+        max_batch_tokens: int | None = None,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name or settings.embedding_model_name
+        quantize = settings.onnx_quantize if quantize is None else quantize
+        path = export_onnx(self.model_name, cache_dir or settings.onnx_cache_dir, quantize)
+        info = json.loads((path / "embedder.json").read_text())
+        self.max_seq_length = int(info["max_seq_length"])
+        self.dim = int(info["dim"])
+        self.max_batch_tokens = max_batch_tokens or settings.onnx_max_batch_tokens
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+
+        opts = ort.SessionOptions()
+        # One request at a time per session: all cores on the matmuls, none on inter-op scheduling
+        opts.intra_op_num_threads = threads or settings.onnx_threads
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(path / "model.onnx"), opts, providers=["CPUExecutionProvider"])
+        self._inputs = [i.name for i in self.session.get_inputs()]
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False, **_):
+        """(n, dim) float32; texts are tokenized once, then run in length buckets with minimal padding."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        enc = self.tokenizer(texts, truncation=True, max_length=self.max_seq_length,
+                             return_attention_mask=False, return_token_type_ids=False)
+        ids = enc["input_ids"]
+        pad = self.tokenizer.pad_token_id or 0
+        for idx in length_buckets([len(x) for x in ids], batch_size, self.max_batch_tokens):
+            width = max(len(ids[i]) for i in idx)
+            input_ids = np.full((len(idx), width), pad, dtype=np.int64)
+            mask = np.zeros((len(idx), width), dtype=np.int64)
+            for row, i in enumerate(idx):
+                input_ids[row, :len(ids[i])] = ids[i]
+                mask[row, :len(ids[i])] = 1
+            feeds = {"input_ids": input_ids, "attention_mask": mask}
+            if "token_type_ids" in self._inputs:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            out[idx] = self.session.run(["embedding"], feeds)[0]
+        if normalize_embeddings:
+            out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+        return out[0] if single else out
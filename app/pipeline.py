@@ -2,90 +2,541 @@
 from typing import List, Dict, Any
 from app.config import settings
 from app.retriever_pine import PineconeRetriever
+from app.retriever_local import LocalVectorRetriever
 from app.llm import GroqLLM, SYSTEM_PROMPT
+from app.answer_cache import AnswerCache
+from app.rerank_cache import RerankCache, doc_key
+from app.reranker import make_reranker
 from app.utils import build_inline_citations, insert_citation_tags, clean_text, mmr
-import cohere
+from app.rate_limit import RateLimiter
+from app.resilience import CallPolicy, CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, stage_budget
+from app.tracing import span, timed
+from app.lazy import lazy_import
+cohere = lazy_import("cohere")  # CohereReranker builds cohere.Client; imported on first use
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import copy
+import numpy as np
+import threading
 import time
+import uuid
+
+_NO_GATES = {"vector": nullcontext(), "rerank": nullcontext(), "llm": nullcontext()}
+
+
+def _usage_attrs(usage) -> Dict[str, Any]:
+    """LLM token counts as span attributes."""
+    if not usage:
+        return {}
+    return {k: usage[k] for k in ("prompt_tokens", "completion_tokens") if usage.get(k) is not None}
+
 
 class RagPipeline:
-    def __init__(self):
-        self.retriever = PineconeRetriever()
-        self.llm = GroqLLM()
-        self.cohere = cohere.Client(api_key=settings.cohere_api_key)
-        self.rerank_model = settings.cohere_model
+    def __init__(self, retriever=None, llm=None, reranker=None):
+        # Components can be injected (benchmarks, load tests); defaults come from settings
+        if retriever is None:
+            retriever = LocalVectorRetriever() if settings.vector_backend == "local" else PineconeRetriever()
+        self.retriever = retriever
+        self.llm = llm if llm is not None else GroqLLM()
+        self.reranker = reranker if reranker is not None else make_reranker()
+        self.rerank_model = self.reranker.model
+        self.answer_cache = AnswerCache(
+            max_items=settings.answer_cache_max_items,
+            ttl_s=settings.answer_cache_ttl_s,
+            similarity=settings.answer_cache_similarity,
+        ) if settings.answer_cache_enabled else None
+        self.rerank_cache = RerankCache(
+            max_items=settings.rerank_cache_max_items,
+            ttl_s=settings.rerank_cache_ttl_s,
+        ) if settings.rerank_cache_enabled else None
+        self._rerank_call_s = None  # running average of uncached rerank calls
+        # Per-provider breaker, retries and hedging; a local cross-encoder is never hedged (it would double the CPU work)
+        self.rerank_policy = self._call_policy(
+            self.reranker.backend, settings.rerank_hedge_s if self.reranker.backend != "local" else 0.0)
+        self.llm_policy = self._call_policy(getattr(self.llm, "backend", "llm"), settings.llm_hedge_s)
+        self._chunker = None
+        self._chunk_manifest = None
+        self._context_packer = None
+
+    @staticmethod
+    def _call_policy(provider: str, hedge_after_s: float) -> CallPolicy:
+        breaker = CircuitBreaker(provider, settings.breaker_failures, settings.breaker_reset_s)
+        return CallPolicy(breaker, settings.call_retries, settings.retry_backoff_s, hedge_after_s)
+
+    def breaker_states(self) -> Dict[str, str]:
+        """Circuit state per provider role ("closed", "open" or "half_open"), as reported in metrics."""
+        return {"rerank": self.rerank_policy.breaker.state, "llm": self.llm_policy.breaker.state}
+
+    def warmup(self) -> Dict[str, float]:
+        """Pay one-off model start-up costs (embedder, local reranker) before the first real request."""
+        timings = {}
+        t0 = time.time()
+        if hasattr(self.retriever, "warmup"):
+            self.retriever.warmup()
+        timings["embed_s"] = time.time() - t0
+        if getattr(self.reranker, "backend", "") == "local":
+            t1 = time.time()
+            self.reranker.rerank("warm up", ["warm up"], 1)
+            timings["rerank_s"] = time.time() - t1
+        return timings
 
     # ... keep ingest_document as-is ...
 
-    def retrieve_and_rerank(self, query: str) -> Dict[str, Any]:
-        """Always returns a dict: {'hits': [...], 'timings': {'retrieve_s': float, 'rerank_s': float}, 'rerank_used': bool}"""
-        t_retrieve = 0.0
-        t_rerank = 0.0
+    def _dense_retrieve(self, query: str, namespace: str | None = None) -> List[Dict[str, Any]]:
+        # Only pass a namespace when one was asked for: minimal retrievers take just (query, top_k)
+        kwargs = {"namespace": namespace} if namespace is not None else {}
+        # Ask for stored vectors when the retriever supports it (saves re-embedding hits for MMR)
+        if getattr(self.retriever, "supports_values", False):
+            return self.retriever.retrieve(query, top_k=settings.initial_recall_k, include_values=True, **kwargs)
+        return self.retriever.retrieve(query, top_k=settings.initial_recall_k, **kwargs)
+
+    def _hit_embeddings(self, hits: List[Dict[str, Any]]):
+        if all(h.get("values") for h in hits):
+            return np.asarray([h["values"] for h in hits], dtype=np.float32)
+        with span("mmr_reembed", texts=len(hits)):
+            if hasattr(self.retriever, "embed_array"):
+                return self.retriever.embed_array([h["text"] for h in hits])
+            return self.retriever.embed([h["text"] for h in hits])
+
+    def _call_reranker(self, query: str, documents: List[str], top_n: int, deadline, sp) -> List:
+        """reranker.rerank under the rerank policy and stage budget; attempts/hedges go on the span."""
+        stats = {}
         try:
-            t0 = time.time()
-            # Dense retrieval
-            initial_hits = self.retriever.retrieve(query, top_k=settings.initial_recall_k)
-            t_retrieve = time.time() - t0
+            return self.rerank_policy.call(lambda: self.reranker.rerank(query, documents, top_n),
+                                           stage_budget(settings.rerank_budget_s, deadline), stats)
+        finally:
+            sp.set(**stats)
+
+    def _rerank(self, query: str, docs: List[Dict[str, Any]], timings: Dict[str, Any],
+                deadline: Deadline | None = None) -> List[Dict[str, Any]]:
+        """
+        Rerank with the per-chunk score cache; only uncached chunks are scored. Raises on provider
+        failure, when the rerank budget runs out (DeadlineExceeded) or the circuit is open.
+        """
+        top_n = min(settings.rerank_top_k, len(docs))
+        if self.rerank_cache is None:
+            with timed("rerank", timings, "rerank_s", docs=len(docs), backend=self.reranker.backend) as sp:
+                ranked = self._call_reranker(query, [d["text"] for d in docs], top_n, deadline, sp)
+            return [{**docs[i], "rerank_score": score} for i, score in ranked]
+
+        keys = [doc_key(d) for d in docs]
+        scores = self.rerank_cache.get_many(self.rerank_model, query, keys)
+        cached = len(scores)
+        todo = [i for i in range(len(docs)) if i not in scores]
+        if todo:
+            # Ask for every score so all of them can be cached
+            with timed("rerank", timings, "rerank_s", docs=len(todo), cached=cached, backend=self.reranker.backend) as sp:
+                ranked = self._call_reranker(query, [docs[i]["text"] for i in todo], len(todo), deadline, sp)
+            fresh = [(todo[i], score) for i, score in ranked]
+            scores.update(fresh)
+            self.rerank_cache.put_many(self.rerank_model, query, [(keys[i], sc) for i, sc in fresh])
+            self._rerank_call_s = timings["rerank_s"] if self._rerank_call_s is None else \
+                0.8 * self._rerank_call_s + 0.2 * timings["rerank_s"]
+
+        timings["rerank_cache_hit_rate"] = cached / len(docs) if docs else 0.0
+        # Estimate: a full hit saves one typical call; partial hits save a proportional share
+        timings["rerank_saved_s"] = (self._rerank_call_s or 0.0) * timings["rerank_cache_hit_rate"]
+        order = sorted(scores, key=lambda i: scores[i], reverse=True)[:top_n]
+        return [{**docs[i], "rerank_score": scores[i]} for i in order]
+
+    def _diversify(self, hits: List[Dict[str, Any]], timings: Dict[str, Any],
+                   namespace: str | None = None) -> List[Dict[str, Any]]:
+        if not all(h.get("values") for h in hits):
+            hits = self._hydrate(hits, namespace)  # re-embedding needs the text of every hit
+            if not hits:
+                return []
+        with timed("mmr", timings, "mmr_s", candidates=len(hits)) as sp:
+            embs = self._hit_embeddings(hits)
+            mmr_idx = mmr(
+                embs,
+                top_k=min(12, len(hits)),
+                lambda_mult=0.55,
+                query_embedding=hits[0].get("query_values"),
+            )
+            sp.set(kept=len(mmr_idx))
+        survivors = [hits[i] for i in mmr_idx]
+        # Only MMR survivors are reranked or shown, so only their text is read from the doc store
+        with timed("hydrate", timings, "hydrate_s", docs=len(survivors)):
+            return self._hydrate(survivors, namespace)
+
+    def _hydrate(self, hits: List[Dict[str, Any]], namespace: str | None = None) -> List[Dict[str, Any]]:
+        """Hits with their text filled in; hits whose text cannot be found are dropped."""
+        if hasattr(self.retriever, "hydrate"):
+            return self.retriever.hydrate(hits, namespace)
+        return hits
+
+    def _rerank_fallback(self, diversified: List[Dict[str, Any]], timings: Dict[str, Any], err: Exception) -> Dict[str, Any]:
+        # Fallback to dense retrieval (MMR order) if rerank fails, runs out of time or its circuit is open
+        if isinstance(err, DeadlineExceeded):
+            reason = "deadline"
+        elif isinstance(err, CircuitOpenError):
+            reason = "circuit_open"
+        else:
+            reason = "error"
+            timings["rerank_s"] = 0.0
+        print(f"[WARN] {self.reranker.backend} rerank failed ({reason}), using dense retrieval only: {err}")
+        timings["rerank_fallback"] = reason
+        reranked = diversified[: min(settings.rerank_top_k, len(diversified))]
+        return {"hits": reranked, "timings": timings, "rerank_used": False}
+
+    def _takes_query_vectors(self) -> bool:
+        """True when the retriever can search with a query vector computed here (embed_array + retrieve_by_vector)."""
+        return hasattr(self.retriever, "retrieve_by_vector") and hasattr(self.retriever, "embed_array")
+
+    def _search_by_vector(self, query: str, qvec, namespace: str | None = None) -> List[Dict[str, Any]]:
+        """_dense_retrieve with an already computed query vector (dense + BM25 when the retriever has both)."""
+        include_values = getattr(self.retriever, "supports_values", False)
+        search = getattr(self.retriever, "retrieve_hybrid", None)
+        if search is not None:
+            return search(query, qvec, top_k=settings.initial_recall_k, namespace=namespace,
+                          include_values=include_values)
+        return self.retriever.retrieve_by_vector(qvec, top_k=settings.initial_recall_k, namespace=namespace,
+                                                 include_values=include_values)
+
+    def retrieve_and_rerank(self, query: str, namespace: str | None = None) -> Dict[str, Any]:
+        """
+        Always returns a dict: {'hits': [...], 'timings': {...}, 'rerank_used': bool}.
+        timings: embed_s (query embedding), retrieve_s (vector query), mmr_s, hydrate_s, rerank_s and,
+        with the rerank cache on, rerank_cache_hit_rate / rerank_saved_s; rerank_fallback says why
+        MMR order was used ("error", "deadline", "circuit_open").
+        """
+        return self._retrieve_and_rerank(query, deadline=Deadline.start(settings.request_deadline_s),
+                                         namespace=namespace)
+
+    def _retrieve_and_rerank(self, query: str, qvec=None, gates: Dict[str, Any] = None,
+                             embed_s: float = 0.0, deadline: Deadline | None = None,
+                             namespace: str | None = None) -> Dict[str, Any]:
+        # qvec/embed_s: query vector (and its share of the encode time) computed by the caller;
+        # gates: per-service concurrency limits held around the vector query and the rerank call;
+        # deadline: the request's, which caps the rerank budget; namespace: None = the default one
+        gates = gates or _NO_GATES
+        timings = {"embed_s": embed_s, "retrieve_s": 0.0, "mmr_s": 0.0, "rerank_s": 0.0}
+        try:
+            if not self._takes_query_vectors():
+                qvec = None  # the retriever embeds inside retrieve(); embed_s stays 0
+            elif qvec is None:
+                with timed("query_embed", timings, "embed_s", queries=1):
+                    qvec = self.retriever.embed_array([query])[0]
+            # Dense (+ BM25) retrieval
+            with gates["vector"]:
+                with timed("vector_query", timings, "retrieve_s", top_k=settings.initial_recall_k) as sp:
+                    initial_hits = self._dense_retrieve(query, namespace) if qvec is None \
+                        else self._search_by_vector(query, qvec, namespace)
+                    sp.set(hits=len(initial_hits))
 
             if not initial_hits:
-                return {"hits": [], "timings": {"retrieve_s": t_retrieve, "rerank_s": 0.0}, "rerank_used": False}
+                return {"hits": [], "timings": timings, "rerank_used": False}
 
-            # MMR diversify (optional)
-            embs = self.retriever.embed([h["text"] for h in initial_hits])
-            from app.utils import mmr
-            mmr_idx = mmr(embs, top_k=min(12, len(initial_hits)), lambda_mult=0.55)
-            diversified = [initial_hits[i] for i in mmr_idx]
+            # MMR diversify over the stored vectors (falls back to embedding hit texts)
+            diversified = self._diversify(initial_hits, timings, namespace)
+            if not diversified:
+                return {"hits": [], "timings": timings, "rerank_used": False}
 
-            # Cohere rerank
+            # Rerank (Cohere or local cross-encoder)
             try:
-                t1 = time.time()
-                rr = self.cohere.rerank(
-                    model=self.rerank_model,
-                    query=query,
-                    documents=[d["text"] for d in diversified],
-                    top_n=min(settings.rerank_top_k, len(diversified)),
-                )
-                t_rerank = time.time() - t1
-
-                reranked = []
-                for r in rr.results:
-                    item = diversified[r.index]
-                    reranked.append({**item, "rerank_score": r.relevance_score})
-                return {"hits": reranked, "timings": {"retrieve_s": t_retrieve, "rerank_s": t_rerank}, "rerank_used": True}
+                with gates["rerank"]:
+                    reranked = self._rerank(query, diversified, timings, deadline)
+                return {"hits": reranked, "timings": timings, "rerank_used": True}
             except Exception as e:
-                # Fallback to dense retrieval if rerank fails
-                print(f"[WARN] Cohere rerank failed, using dense retrieval only: {e}")
-                reranked = diversified[: min(settings.rerank_top_k, len(diversified))]
-                return {"hits": reranked, "timings": {"retrieve_s": t_retrieve, "rerank_s": 0.0}, "rerank_used": False}
+                return self._rerank_fallback(diversified, timings, e)
 
         except Exception as e:
             # Any unexpected failure -> safe empty result
             print(f"[ERROR] retrieve_and_rerank crashed: {e}")
-            return {"hits": [], "timings": {"retrieve_s": t_retrieve, "rerank_s": t_rerank}, "rerank_used": False}
+            return {"hits": [], "timings": timings, "rerank_used": False}
+
+
+
+    # -------- Answer cache --------
+    def _cache_lookup(self, query: str, query_vec=None, namespace: str | None = None):
+        """
+        Return (cached result or None, lazily-filled [query vector], cache generation) for the answer
+        cache in `namespace`; the generation goes back to _cache_store with the fresh answer.
+        """
+        qvec = [] if query_vec is None else [query_vec]  # filled lazily: the semantic layer needs the query embedding
+        if self.answer_cache is None:
+            return None, qvec, None
+        t0 = time.time()
+        # Read before retrieval: an ingest finishing meanwhile makes the answer uncacheable
+        generation = self.answer_cache.generation(namespace or settings.pinecone_namespace)
+
+        def _query_vec():
+            if not qvec:
+                qvec.append(self.retriever.embed([query])[0])
+            return qvec[0]
+
+        hit = self.answer_cache.lookup(namespace or settings.pinecone_namespace, query, query_vec_fn=_query_vec)
+        if hit is None:
+            return None, qvec, generation
+        out = hit["result"]
+        out["metrics"] = {
+            **out["metrics"],
+            "llm_tokens": None,  # nothing was spent on this response
+            "cache_hit": hit["kind"],
+            "cache_similarity": hit["similarity"],
+            "cache_lookup_s": time.time() - t0,
+            "latency_saved_s": hit["cost_s"],
+        }
+        return out, qvec, generation
+
+    def _cache_store(self, query: str, out: Dict[str, Any], qvec: list, cost_s: float,
+                     namespace: str | None = None, generation: int | None = None) -> None:
+        if self.answer_cache is None:
+            return
+        out["metrics"]["cache_hit"] = None
+        if not out["contexts"]:
+            return
+        if not qvec:
+            # Reuse the query vector that came back with the hits when there is one
+            qv = out["contexts"][0].get("query_values")
+            qvec.append(qv if qv is not None else self.retriever.embed([query])[0])
+        self.answer_cache.store(namespace or settings.pinecone_namespace, query, out, query_vec=qvec[0], cost_s=cost_s,
+                                generation=generation)
+
+    # -------- Answer --------
+    def answer(self, query: str, namespace: str | None = None) -> Dict[str, Any]:
+        """
+        Answer from the cache when an identical or near-identical question was seen, else run the full
+        pipeline. `namespace` (default settings.pinecone_namespace) scopes both retrieval and the cache.
+        """
+        deadline = Deadline.start(settings.request_deadline_s)
+        with span("answer") as sp:
+            cached, qvec, gen = self._cache_lookup(query, namespace=namespace)
+            if cached is not None:
+                sp.set(cache_hit=cached["metrics"]["cache_hit"])
+                return cached
+            t1 = time.time()
+            # The semantic cache layer may already have embedded the query; retrieval reuses it
+            out = self._answer_uncached(query, qvec[0] if qvec else None, deadline, namespace)
+            self._cache_store(query, out, qvec, time.time() - t1, namespace, gen)
+            return out
+
+    def answer_batch(
+        self,
+        queries: List[str],
+        max_vector_queries: int | None = None,
+        max_reranks: int | None = None,
+        max_llm_calls: int | None = None,
+        return_exceptions: bool = False,
+        namespace: str | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        answer() for many queries at once; results keep input order and carry the same metrics
+        (embed_s is each query's share of the batched encode).
+          - all query vectors come from one batched encode
+          - vector queries, reranks and LLM calls then overlap across queries, each service capped
+            at its own in-flight limit (default settings.async_max_*)
+          - LLM calls are paced by settings.batch_llm_max_rpm when set
+        Repeated queries are answered once and each repeat gets its own copy of the result. With
+        return_exceptions=True a failed query's slot holds its exception instead of the whole batch
+        raising. All queries run against `namespace`.
+        """
+        queries = list(queries)
+        unique = list(dict.fromkeys(queries))
+        if not unique:
+            return []
+        n_vector = max_vector_queries or settings.async_max_vector_queries
+        n_rerank = max_reranks or settings.async_max_reranks
+        n_llm = max_llm_calls or settings.async_max_llm_calls
+        gates = {
+            "vector": threading.BoundedSemaphore(n_vector),
+            "rerank": threading.BoundedSemaphore(n_rerank),
+            "llm": threading.BoundedSemaphore(n_llm),
+        }
+        limiter = RateLimiter(settings.batch_llm_max_rpm, settings.batch_llm_burst) \
+            if settings.batch_llm_max_rpm > 0 else None
+
+        qvecs, embed_s = None, 0.0
+        if self._takes_query_vectors():
+            batch_t: Dict[str, float] = {}
+            with timed("query_embed", batch_t, "embed_s", queries=len(unique)):
+                qvecs = self.retriever.embed_array(unique)
+            embed_s = batch_t["embed_s"] / len(unique)
+
+        def _one(i: int):
+            try:
+                return self._answer_one(unique[i], None if qvecs is None else qvecs[i], gates, limiter, embed_s,
+                                        namespace)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        workers = min(len(unique), n_vector + n_rerank + n_llm)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-batch") as pool:
+            results = dict(zip(unique, pool.map(_one, range(len(unique)))))
+        out, seen = [], set()
+        for q in queries:
+            res = results[q]
+            # Callers may annotate or mutate results, so repeats must not share one dict
+            out.append(copy.deepcopy(res) if q in seen and isinstance(res, dict) else res)
+            seen.add(q)
+        return out
+
+    def _answer_one(self, query: str, qvec, gates: Dict[str, Any], limiter, embed_s: float,
+                    namespace: str | None = None) -> Dict[str, Any]:
+        """One answer_batch item: answer() with a precomputed query vector and shared service limits."""
+        deadline = Deadline.start(settings.request_deadline_s)  # from when this item starts, not the batch
+        cached, cache_vec, gen = self._cache_lookup(query, query_vec=qvec, namespace=namespace)
+        if cached is not None:
+            return cached
+        t1 = time.time()
+        prep = self._build_prompt(query, self._retrieve_and_rerank(query, qvec, gates, embed_s, deadline, namespace))
+        if prep["messages"] is None:
+            out = prep["result"]
+        else:
+            with gates["llm"]:
+                if limiter is not None:
+                    limiter.acquire()
+                llm_res = self._generate(prep["messages"], deadline)
+            out = self._finish(prep, llm_res)
+        self._cache_store(query, out, cache_vec, time.time() - t1 + embed_s, namespace, gen)
+        return out
+
+    def answer_stream(self, query: str, namespace: str | None = None):
+        """
+        Streaming variant of answer() (same `namespace` scoping). Yields, in order:
+          {"type": "sources", "sources": [...], "metrics": {retrieval timings}}
+          {"type": "token", "text": "..."}  (one per streamed delta)
+          {"type": "done", "answer", "contexts", "sources", "metrics"}  (same shape as answer())
+        """
+        deadline = Deadline.start(settings.request_deadline_s)
+        cached, qvec, gen = self._cache_lookup(query, namespace=namespace)
+        if cached is not None:
+            yield {"type": "sources", "sources": cached["sources"], "metrics": cached["metrics"]}
+            yield {"type": "token", "text": cached["answer"]}
+            yield {"type": "done", **cached}
+            return
+
+        t1 = time.time()
+        prep = self._prepare(query, qvec[0] if qvec else None, deadline, namespace)
+        if prep["messages"] is None:
+            out = prep["result"]
+            self._cache_store(query, out, qvec, time.time() - t1, namespace, gen)
+            yield {"type": "sources", "sources": [], "metrics": out["metrics"]}
+            yield {"type": "token", "text": out["answer"]}
+            yield {"type": "done", **out}
+            return
 
+        yield {"type": "sources", "sources": prep["sources"], "metrics": dict(prep["metrics"])}
+        if hasattr(self.llm, "stream_with_meta"):
+            llm_res = {}
+            # Tokens are already on screen, so a stream is neither retried nor cut off here;
+            # the client timeout bounds each read and the breaker still sees the outcome
+            with span("llm", streamed=True) as sp, self.llm_policy.guard():
+                for ev in self.llm.stream_with_meta(prep["messages"]):
+                    if ev["type"] == "token":
+                        yield ev
+                    else:
+                        llm_res = ev
+                sp.set(**_usage_attrs(llm_res.get("usage")))
+        else:
+            llm_res = self._generate(prep["messages"], deadline)
+            yield {"type": "token", "text": llm_res["text"]}
+
+        out = self._finish(prep, llm_res)
+        self._cache_store(query, out, qvec, time.time() - t1, namespace, gen)
+        yield {"type": "done", **out}
 
+    def _answer_uncached(self, query: str, qvec=None, deadline: Deadline | None = None,
+                         namespace: str | None = None) -> Dict[str, Any]:
+        prep = self._prepare(query, qvec, deadline, namespace)
+        if prep["messages"] is None:
+            return prep["result"]
+        return self._finish(prep, self._generate(prep["messages"], deadline))
 
-    def answer(self, query: str) -> Dict[str, Any]:
+    def _prepare(self, query: str, qvec=None, deadline: Deadline | None = None,
+                 namespace: str | None = None) -> Dict[str, Any]:
+        """Retrieve, rerank, number citations and build the prompt. messages is None when nothing was found."""
         # Retrieve + rerank with timings
-        rr = self.retrieve_and_rerank(query)
+        return self._build_prompt(query, self._retrieve_and_rerank(query, qvec, deadline=deadline, namespace=namespace))
+
+    def _build_prompt(self, query: str, rr: Dict[str, Any]) -> Dict[str, Any]:
         reranked = rr["hits"]
         timings = rr["timings"]
+        metrics = {
+            "embed_s": timings.get("embed_s", 0.0),
+            "retrieve_s": timings["retrieve_s"],
+            "mmr_s": timings.get("mmr_s", 0.0),
+            "rerank_s": timings["rerank_s"],
+            "rerank_used": rr.get("rerank_used", False),
+            "rerank_cache_hit_rate": timings.get("rerank_cache_hit_rate"),
+            "rerank_saved_s": timings.get("rerank_saved_s", 0.0),
+            "rerank_fallback": timings.get("rerank_fallback"),  # why MMR order was used, if it was
+            "breakers": self.breaker_states(),
+            "context_s": 0.0,  # citation numbering + prompt assembly
+            # token-budgeted packing: its own time, prompt tokens it removed, estimated LLM time saved
+            "context_pack_s": 0.0,
+            "prompt_tokens_saved": 0,
+            "llm_latency_saved_est_s": 0.0,
+        }
 
         if not reranked:
             return {
-                "answer": "I couldn’t find enough information in your documents to answer that confidently.",
-                "contexts": [],
-                "sources": [],
-                "metrics": {
-                    "retrieve_s": timings["retrieve_s"],
-                    "rerank_s": timings["rerank_s"],
-                    "llm_latency_s": 0.0,
-                    "llm_tokens": None,
-                    "model": settings.groq_model,
+                "messages": None,
+                "result": {
+                    "answer": "I couldn’t find enough information in your documents to answer that confidently.",
+                    "contexts": [],
+                    "sources": [],
+                    "metrics": {
+                        **metrics,
+                        "llm_latency_s": 0.0,
+                        "llm_ttft_s": 0.0,
+                        "llm_tokens": None,
+                        "model": settings.groq_model,
+                    },
                 },
             }
 
         contexts = reranked[: settings.max_context_docs]
+        packer = self.context_packer
+        if packer is not None:
+            with timed("context_pack", metrics, "context_pack_s", contexts=len(contexts)) as sp:
+                fixed_prompt = "\n".join(m["content"] for m in self._messages(query, ""))
+                contexts, pack = packer.pack(query, contexts, fixed_prompt)
+                saved = pack["context_tokens_before"] - pack["context_tokens_after"]
+                sp.set(tokens_before=pack["context_tokens_before"], tokens_saved=saved,
+                       sentences_kept=pack["sentences_kept"] or 0)
+            metrics["prompt_tokens_saved"] = saved
+            # Estimate: the removed tokens at the LLM's prompt-processing rate
+            metrics["llm_latency_saved_est_s"] = saved / settings.llm_prompt_tokens_per_s
+
+        with timed("context_build", metrics, "context_s", contexts=len(contexts)) as sp:
+            prep = self._assemble(query, contexts, metrics)
+            sp.set(prompt_chars=len(prep["messages"][-1]["content"]))
+        return prep
+
+    @property
+    def context_packer(self):
+        """ContextPacker for settings.context_token_budget; None when the budget is 0."""
+        if settings.context_token_budget <= 0:
+            return None
+        if self._context_packer is None:
+            from app.context_pack import ContextPacker
+            self._context_packer = ContextPacker(self._context_tokenizer(), settings.context_token_budget)
+        return self._context_packer
+
+    def _context_tokenizer(self):
+        if settings.context_tokenizer:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(settings.context_tokenizer)
+        tokenizer = self.retriever.tokenizer()[0] if hasattr(self.retriever, "tokenizer") else None
+        if tokenizer is None:
+            from app.chunking import RegexTokenizer
+            tokenizer = RegexTokenizer()
+        return tokenizer
+
+    def _messages(self, query: str, context_block: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": f"Question: {query}\n\nContext:\n{context_block}\n\nAnswer with inline citations like [1], [2]."
+            },
+        ]
 
+    def _assemble(self, query: str, contexts: List[Dict[str, Any]], metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """Number citations, build the prompt messages and the display sources for `contexts`."""
         # Assign citation numbers
         _, unique_sources = build_inline_citations([{
             "text": c["text"],
@@ -107,29 +558,7 @@ class RagPipeline:
             )
             c["cite_num"] = key_to_num.get(key, "?")
 
-        context_block = insert_citation_tags(contexts)
-
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": f"Question: {query}\n\nContext:\n{context_block}\n\nAnswer with inline citations like [1], [2]."
-            },
-        ]
-
-        # LLM call with meta 
-        if hasattr(self.llm, "generate_with_meta"):
-            llm_res = self.llm.generate_with_meta(messages)
-            final_answer = clean_text(llm_res["text"])
-            model_name = llm_res.get("model", settings.groq_model)
-            latency_s = llm_res.get("latency_s", 0.0)
-            usage = llm_res.get("usage")
-        else:
-            t0 = time.time()
-            final_answer = clean_text(self.llm.generate(messages))
-            latency_s = time.time() - t0
-            model_name = settings.groq_model
-            usage = None
+        messages = self._messages(query, insert_citation_tags(contexts))
 
         display_sources = []
         for c in contexts:
@@ -140,32 +569,115 @@ class RagPipeline:
                 "title": md.get("title"),
                 "section": md.get("section"),
                 "position": md.get("position"),
+                "page": md.get("page"),
                 "snippet": c["text"][:300] + ("..." if len(c["text"]) > 300 else "")
             })
         display_sources.sort(key=lambda x: x["n"])
 
+        return {"messages": messages, "contexts": contexts, "sources": display_sources, "metrics": metrics}
+
+    def _generate(self, messages: List[Dict[str, str]], deadline: Deadline | None = None) -> Dict[str, Any]:
+        """The LLM call under the LLM policy, within min(settings.llm_budget_s, time left on `deadline`)."""
+        with span("llm") as sp:
+            stats = {}
+            try:
+                res = self.llm_policy.call(lambda: self._call_llm(messages),
+                                           stage_budget(settings.llm_budget_s, deadline), stats)
+            finally:
+                sp.set(**stats)
+            sp.set(**_usage_attrs(res.get("usage")))
+        return res
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        # LLM call with meta
+        if hasattr(self.llm, "generate_with_meta"):
+            return self.llm.generate_with_meta(messages)
+        t0 = time.perf_counter()
+        text = self.llm.generate(messages)
+        latency_s = time.perf_counter() - t0
+        return {"text": text, "latency_s": latency_s, "ttft_s": latency_s, "usage": None, "model": settings.groq_model}
+
+    def _finish(self, prep: Dict[str, Any], llm_res: Dict[str, Any]) -> Dict[str, Any]:
+        latency_s = llm_res.get("latency_s", 0.0)
         return {
-        "answer": final_answer,
-        "contexts": contexts,
-        "sources": display_sources,
-        "metrics": {
-            "retrieve_s": timings["retrieve_s"],
-            "rerank_s": timings["rerank_s"],
-            "llm_latency_s": latency_s,
-            "llm_tokens": usage,
-            "model": model_name,
-            "rerank_used": rr.get("rerank_used", False),  # <-- add this
-        },
-    }
-    
-    def ingest_document(self, text: str, source: str, title: str = "", section: str = ""):
-        from app.utils import sliding_window_chunk
-        from app.config import settings
-        chunks = sliding_window_chunk(
-            text=text,
-            chunk_size_tokens=settings.chunk_size_tokens,
-            overlap_ratio=settings.chunk_overlap,
-            meta={"source": source, "title": title, "section": section},
-        )
-        self.retriever.upsert_chunks(chunks)
+            "answer": clean_text(llm_res.get("text", "")),
+            "contexts": prep["contexts"],
+            "sources": prep["sources"],
+            "metrics": {
+                **prep["metrics"],
+                "llm_latency_s": latency_s,
+                # time to first token; equals llm_latency_s for non-streamed calls
+                "llm_ttft_s": llm_res.get("ttft_s", latency_s),
+                "llm_tokens": llm_res.get("usage"),
+                "model": llm_res.get("model", settings.groq_model),
+                "breakers": self.breaker_states(),  # after the LLM call
+                # token accounting counts each response once under this id
+                "response_id": llm_res.get("id") or uuid.uuid4().hex,
+            },
+        }
+
+    @property
+    def chunker(self):
+        """Streaming chunker sized with the embedding model's own tokenizer (built on first ingest)."""
+        if self._chunker is None:
+            from app.chunking import make_chunker
+            tokenizer, max_len = self.retriever.tokenizer() if hasattr(self.retriever, "tokenizer") else (None, None)
+            self._chunker = make_chunker(tokenizer, max_len)
+        return self._chunker
+
+    def _source_diff(self, namespace: str, source: str):
+        """Chunk diff against the last ingest of `source` (None when CHUNK_MANIFEST=0 or unsupported)."""
+        if not settings.chunk_manifest_enabled or not hasattr(self.retriever, "delete_ids"):
+            return None
+        from app.chunk_manifest import ChunkManifest, SourceDiff, store_fingerprint
+        if self._chunk_manifest is None:
+            self._chunk_manifest = ChunkManifest(settings.chunk_manifest_path)
+        # Hashes recorded against another store or embedding model say nothing about this one
+        self._chunk_manifest.check(namespace, store_fingerprint(self.retriever, namespace))
+        return SourceDiff(self._chunk_manifest, namespace, source)
+
+    def ingest_document(self, text: str, source: str, title: str = "", section: str = "", namespace: str | None = None):
+        """
+        Chunk, embed and upsert one text. With the chunk manifest on, only added/changed
+        chunks are upserted, stale ids are deleted and the counts are returned under "diff".
+        """
+        from app.chunking import chunk_text
+        namespace = namespace or settings.pinecone_namespace
+        with span("ingest", chars=len(text)) as sp:
+            chunks = chunk_text(text, self.chunker, meta={"source": source, "title": title, "section": section})
+            diff = self._source_diff(namespace, source)
+            chunks = list(diff.filter(chunks) if diff is not None else chunks)
+            stats = self.retriever.upsert_chunks(chunks, namespace=namespace)
+            if diff is not None:
+                stats["diff"] = diff.finish(self.retriever)
+            sp.set(chunks=stats["chunks"])
+        # New content can change any cached answer for this namespace
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(namespace)
+        return stats
+
+    def ingest_pages(self, pages, source: str, title: str = "", section: str = "", namespace: str | None = None,
+                     total_pages: int | None = None, on_progress=None):
+        """
+        Streaming ingest of (page number, text) pairs: chunking, embedding and upserts overlap
+        (see app.ingest.stream_ingest). Chunks carry "page"/"page_end" metadata.
+        """
+        from app.ingest import stream_ingest
+        namespace = namespace or settings.pinecone_namespace
+        try:
+            return stream_ingest(self.retriever, pages, {"source": source, "title": title, "section": section},
+                                 namespace=namespace, total_pages=total_pages, on_progress=on_progress,
+                                 chunker=self.chunker, diff=self._source_diff(namespace, source))
+        finally:
+            # Invalidate even after a partial ingest: some chunks may already be upserted
+            if self.answer_cache is not None:
+                self.answer_cache.invalidate(namespace)
+
+    def ingest_pdf(self, path, source: str, title: str = "", section: str = "", namespace: str | None = None,
+                   on_progress=None):
+        """Extract pages in a process pool and stream them through ingest_pages."""
+        from app.ingest import open_pdf
+        total_pages, pages = open_pdf(path)
+        return self.ingest_pages(pages, source, title, section, namespace,
+                                 total_pages=total_pages, on_progress=on_progress)
 
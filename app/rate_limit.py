@@ -0,0 +1,34 @@
+# app/rate_limit.py
+from __future__ import annotations
+
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: acquire() blocks until a call is allowed. `per_minute` calls
+    are spread evenly over the minute with up to `burst` calls let through back to back.
+    """
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.interval = 60.0 / per_minute
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) / self.interval)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return waited
+                delay = (1.0 - self._tokens) * self.interval
+            time.sleep(delay)
+            waited += delay
@@ -0,0 +1,68 @@
+# app/rerank_cache.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import hashlib
+import threading
+import time
+
+from app.answer_cache import normalize_query
+
+
+def doc_key(doc: Dict[str, Any]) -> str:
+    """Chunk id plus a short content hash, so a re-ingested chunk with new text never reuses an old score."""
+    digest = hashlib.blake2b(doc.get("text", "").encode(), digest_size=8).hexdigest()
+    return f'{doc.get("id") or ""}#{digest}'
+
+
+class RerankCache:
+    """
+    Relevance scores keyed by (rerank model, normalized query, chunk key).
+
+    Scores are cached per chunk rather than per ordered chunk list: Cohere scores
+    are absolute per (query, document), so a full-list hit is simply every chunk
+    hitting, and on a partial overlap only the uncached chunks need scoring.
+    Bounded by `max_items` (LRU) and `ttl_s`.
+    """
+
+    def __init__(self, max_items: int = 20_000, ttl_s: float = 3600.0):
+        self.max_items = max_items
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._scores: "OrderedDict[Tuple[str, str, str], Tuple[float, float]]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0}
+
+    def get_many(self, model: str, query: str, keys: List[str]) -> Dict[int, float]:
+        """Return {position: score} for the keys that are cached and fresh."""
+        nq = normalize_query(query)
+        cutoff = time.time() - self.ttl_s
+        found: Dict[int, float] = {}
+        with self._lock:
+            for i, k in enumerate(keys):
+                entry = self._scores.get((model, nq, k))
+                if entry is None:
+                    continue
+                score, created = entry
+                if created < cutoff:
+                    del self._scores[(model, nq, k)]
+                    continue
+                self._scores.move_to_end((model, nq, k))
+                found[i] = score
+            self.counters["hits"] += len(found)
+            self.counters["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, query: str, scored: List[Tuple[str, float]]) -> None:
+        nq = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            for k, score in scored:
+                self._scores[(model, nq, k)] = (score, now)
+                self._scores.move_to_end((model, nq, k))
+            while len(self._scores) > self.max_items:
+                self._scores.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        total = self.counters["hits"] + self.counters["misses"]
+        return self.counters["hits"] / total if total else 0.0
@@ -0,0 +1,96 @@
+# app/reranker.py
+from __future__ import annotations
+
+from typing import List, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.lazy import LazyValue, lazy_import
+
+cohere = lazy_import("cohere")
+
+
+class CohereReranker:
+    """Hosted rerank via cohere.Client. rerank() returns [(doc index, relevance score)] best-first."""
+
+    backend = "cohere"
+
+    def __init__(self, model: str | None = None):
+        # timeout: the rerank stage budget, so a call the pipeline gave up on does not linger
+        self._client = LazyValue(lambda: cohere.Client(api_key=settings.cohere_api_key,
+                                                       timeout=settings.rerank_budget_s))
+        self.model = model or settings.cohere_model
+
+    @property
+    def client(self):
+        return self._client.get()
+
+    def rerank(self, query: str, documents: List[str], top_n: int) -> List[Tuple[int, float]]:
+        rr = self.client.rerank(model=self.model, query=query, documents=documents, top_n=top_n)
+        return [(r.index, r.relevance_score) for r in rr.results]
+
+
+class CrossEncoderReranker:
+    """
+    Local CPU cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2).
+    Scores (query, chunk) pairs in length-sorted batches with a capped sequence length;
+    the tokenizer is loaded once and reused, and the model can be int8-quantized
+    (torch dynamic quantization of Linear layers).
+    """
+
+    backend = "local"
+
+    def __init__(
+        self,
+        model: str | None = None,
+        max_length: int | None = None,
+        batch_size: int | None = None,
+        quantize: bool | None = None,
+    ):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.model = model or settings.local_rerank_model
+        self.max_length = max_length or settings.local_rerank_max_length
+        self.batch_size = batch_size or settings.local_rerank_batch_size
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model)
+        quantize = settings.local_rerank_quantize if quantize is None else quantize
+        net = AutoModelForSequenceClassification.from_pretrained(self.model).eval()
+        if quantize:
+            net = torch.quantization.quantize_dynamic(net, {torch.nn.Linear}, dtype=torch.qint8)
+        self.net = net
+
+    def score(self, query: str, documents: List[str]) -> np.ndarray:
+        """Relevance in [0, 1] (sigmoid of the logit) for each document, in input order."""
+        scores = np.zeros(len(documents), dtype=np.float32)
+        # Similar lengths share a batch, so little compute is spent on padding
+        order = sorted(range(len(documents)), key=lambda i: len(documents[i]))
+        with self._torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                idx = order[start:start + self.batch_size]
+                enc = self.tokenizer(
+                    [query] * len(idx),
+                    [documents[i] for i in idx],
+                    truncation="only_second",
+                    max_length=self.max_length,
+                    padding=True,
+                    return_tensors="pt",
+                )
+                logits = self.net(**enc).logits
+                logits = logits[:, 0] if logits.shape[1] == 1 else logits[:, -1]
+                scores[idx] = self._torch.sigmoid(logits).float().numpy()
+        return scores
+
+    def rerank(self, query: str, documents: List[str], top_n: int) -> List[Tuple[int, float]]:
+        scores = self.score(query, documents)
+        best = np.argsort(-scores, kind="stable")[:top_n]
+        return [(int(i), float(scores[i])) for i in best]
+
+
+def make_reranker():
+    """Reranker selected by settings.reranker_backend ("cohere" or "local")."""
+    if settings.reranker_backend == "local":
+        return CrossEncoderReranker()
+    return CohereReranker()
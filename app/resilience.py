@@ -0,0 +1,236 @@
+# app/resilience.py
+"""
+Deadline-aware calls to external providers (Cohere rerank, Groq LLM).
+
+- Deadline: the end-to-end budget of one request; each stage gets min(its own budget, time left).
+- CircuitBreaker: per provider; after consecutive failures calls fail fast until a trial call succeeds.
+- CallPolicy: one provider call under a time budget, retried with jittered exponential backoff and
+  optionally hedged (a duplicate request once the first is slower than `hedge_after_s`; the first
+  answer wins). Timed calls run on a shared thread pool so the caller can stop waiting; the SDK
+  client timeout (same budget) ends the abandoned request.
+"""
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+import contextvars
+import random
+import threading
+import time
+
+from app.lazy import LazyValue
+
+_CALL_WORKERS = 64  # timed/hedged provider calls in flight across the process (incl. abandoned ones)
+_pool = LazyValue(lambda: ThreadPoolExecutor(max_workers=_CALL_WORKERS, thread_name_prefix="rag-call"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """A stage ran out of its time budget."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The provider's circuit breaker is open; the call was not made."""
+
+
+class Deadline:
+    """End-to-end request deadline (monotonic clock)."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    @classmethod
+    def start(cls, seconds: float) -> "Deadline | None":
+        """Deadline `seconds` from now; None when `seconds` <= 0 (no deadline)."""
+        return cls(seconds) if seconds > 0 else None
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+
+def stage_budget(stage_s: float, deadline: Deadline | None) -> float | None:
+    """Seconds a stage may take: its own budget (<= 0 = none) capped by the deadline; None = unbounded."""
+    budgets = [b for b in (stage_s if stage_s > 0 else None,
+                           deadline.remaining() if deadline is not None else None) if b is not None]
+    return max(0.0, min(budgets)) if budgets else None
+
+
+def retryable(exc: BaseException) -> bool:
+    """Timeouts, connection errors, 408/409/429 and 5xx are worth another try; other 4xx are not."""
+    if isinstance(exc, CircuitOpenError):
+        return False
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status not in (408, 409, 429))
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failures it opens and
+    calls fail fast with CircuitOpenError for `reset_s`; then one trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit. A threshold of 0 disables it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_s: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opens = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_s:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError unless a call may go out now; True when this call is the half-open trial."""
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_s:
+                    raise CircuitOpenError(f"{self.name} circuit open")
+                self._state, self._trial = self.HALF_OPEN, False
+            if self._state == self.HALF_OPEN:
+                if self._trial:
+                    raise CircuitOpenError(f"{self.name} circuit half-open, trial call in flight")
+                self._trial = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """End a trial call that recorded no outcome; the next call becomes the trial."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._state, self._trial = self.CLOSED, False
+
+    def record_failure(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opens += 1
+                self._state, self._trial = self.OPEN, False
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "opens": self.opens}
+
+
+class CallPolicy:
+    """How one provider is called: its breaker, retries with jittered backoff and an optional hedge."""
+
+    def __init__(self, breaker: CircuitBreaker, retries: int = 0, backoff_s: float = 0.2,
+                 hedge_after_s: float = 0.0):
+        self.breaker = breaker
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.hedge_after_s = hedge_after_s
+
+    def call(self, fn: Callable[[], Any], budget_s: float | None = None, stats: Dict[str, int] | None = None):
+        """
+        fn() within `budget_s` seconds in total (None = no limit), retries and backoff included.
+        Raises DeadlineExceeded when the budget runs out, CircuitOpenError when the breaker is
+        open, else the last error. `stats` (optional) counts "attempts" and "hedges".
+        """
+        stats = stats if stats is not None else {}
+        stats.setdefault("attempts", 0)
+        stats.setdefault("hedges", 0)
+        end = time.monotonic() + budget_s if budget_s is not None else None
+        if end is not None and budget_s <= 0:
+            raise DeadlineExceeded(f"no time left for {self.breaker.name}")
+        trial = self.breaker.before_call()
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    result = self._attempt(fn, end, stats)
+                except Exception as e:
+                    if not retryable(e):
+                        # e.g. a 400/401: the provider answered, so it counts as healthy
+                        self.breaker.record_success()
+                        raise
+                    self.breaker.record_failure()
+                    if isinstance(e, DeadlineExceeded) or attempt > self.retries:
+                        raise
+                    # Full jitter: uniform over [0, backoff * 2^(attempt-1)]
+                    delay = random.uniform(0.0, self.backoff_s * 2 ** (attempt - 1))
+                    if end is not None and time.monotonic() + delay >= end:
+                        raise DeadlineExceeded(f"{self.breaker.name}: no time left to retry") from e
+                    time.sleep(delay)
+                    trial = self.breaker.before_call() or trial
+                    continue
+                self.breaker.record_success()
+                return result
+        finally:
+            if trial:
+                self.breaker.release()  # never leave a half-open trial in flight
+
+    @contextmanager
+    def guard(self):
+        """Breaker bookkeeping only, for calls that cannot be timed from outside (streams)."""
+        trial = self.breaker.before_call()
+        try:
+            yield
+        except GeneratorExit:
+            raise  # the consumer stopped reading: says nothing about the provider
+        except Exception as e:
+            if retryable(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            if trial:
+                self.breaker.release()
+
+    def _attempt(self, fn: Callable[[], Any], end: float | None, stats: Dict[str, int]):
+        stats["attempts"] += 1
+        if end is None and self.hedge_after_s <= 0:
+            return fn()  # nothing to time: stay on the caller's thread
+
+        pool = _pool.get()
+        # A copied context per submit keeps tracing spans parented to the caller's span
+        futures = [pool.submit(contextvars.copy_context().run, fn)]
+        hedge_at = time.monotonic() + self.hedge_after_s if self.hedge_after_s > 0 else None
+        error = None
+        while True:
+            wake = [t for t in (end, hedge_at) if t is not None]
+            timeout = max(0.0, min(wake) - time.monotonic()) if wake else None
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for f in done:
+                futures.remove(f)
+                if f.exception() is None:
+                    for other in futures:
+                        other.cancel()
+                    return f.result()
+                error = f.exception()
+            if not futures:
+                raise error
+            now = time.monotonic()
+            if end is not None and now >= end:
+                for f in futures:
+                    f.cancel()  # a call already running finishes in the background, bounded by the client timeout
+                raise DeadlineExceeded(f"{self.breaker.name} did not answer in time")
+            if hedge_at is not None and now >= hedge_at:
+                futures.append(pool.submit(contextvars.copy_context().run, fn))
+                stats["hedges"] += 1
+                hedge_at = None
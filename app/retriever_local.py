@@ -0,0 +1,407 @@
+# app/retriever_local.py
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from app.config import settings
+from app.retriever_pine import DIM, DenseRetriever, _namespace_dir, build_vectors
+from app.tracing import span
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate index: k-means centroids plus rows grouped by nearest
+    centroid (CSR layout). A query scans only the `nprobe` closest lists.
+
+    `version` is the store version the index reflects. Rows written later are folded in
+    by update(), which assigns them to the existing centroids; `drift` is how many rows
+    were placed that way relative to the rows the centroids were fitted on.
+    """
+
+    def __init__(self, centroids: np.ndarray, assign: np.ndarray, version: int = 0,
+                 fitted_rows: int | None = None, moved: int = 0):
+        self.centroids = centroids
+        self.assign = assign
+        self.version = version
+        self.fitted_rows = len(assign) if fitted_rows is None else fitted_rows
+        self.moved = moved
+        self._group()
+
+    def _group(self) -> None:
+        self.order = np.argsort(self.assign, kind="stable").astype(np.int64)
+        self.offsets = np.searchsorted(self.assign[self.order], np.arange(len(self.centroids) + 1)).astype(np.int64)
+
+    @staticmethod
+    def _nearest(C: np.ndarray, V: np.ndarray) -> np.ndarray:
+        if V.shape[0] == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.argmax(V[s:s + 65536] @ C.T, axis=1)
+                               for s in range(0, V.shape[0], 65536)]).astype(np.int64)
+
+    @classmethod
+    def build(cls, V: np.ndarray, nlist: int | None = None, iters: int = 8, seed: int = 0,
+              version: int = 0) -> "IVFIndex":
+        n = V.shape[0]
+        nlist = nlist or int(min(4096, max(16, np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample = V[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        C = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ C.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    C[c] = members.mean(axis=0)
+            C /= np.linalg.norm(C, axis=1, keepdims=True) + 1e-12
+        C = C.astype(np.float32)
+        return cls(C, cls._nearest(C, V), version)
+
+    @property
+    def drift(self) -> float:
+        return self.moved / max(1, self.fitted_rows)
+
+    def update(self, V: np.ndarray, rows, version: int) -> None:
+        """Assign `rows` (rewritten since `self.version`) and any rows new to V to the existing centroids."""
+        n, old = V.shape[0], len(self.assign)
+        assign = np.zeros(n, dtype=np.int64)
+        assign[:min(n, old)] = self.assign[:n]
+        rows = np.unique(np.concatenate([np.asarray(rows, dtype=np.int64), np.arange(old, n, dtype=np.int64)]))
+        rows = rows[rows < n]
+        assign[rows] = self._nearest(self.centroids, V[rows])
+        self.assign, self.version = assign, version
+        self.moved += len(rows)
+        self._group()
+
+    def candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, assign=self.assign, version=self.version,
+                     fitted_rows=self.fitted_rows, moved=self.moved)
+        os.replace(tmp, path)  # readers in other processes never see a half-written file
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex | None":
+        if not path.exists():
+            return None
+        data = np.load(path)
+        if "assign" not in data.files:
+            return None  # older layout without per-row assignments: rebuild
+        return cls(data["centroids"], data["assign"], int(data["version"]), int(data["fitted_rows"]), int(data["moved"]))
+
+
+class NamespaceStore:
+    """
+    One namespace on disk: float32 vectors in a growable memmap (`vectors.f32`, one row
+    per id) and a SQLite side table holding id -> row, the JSON metadata and the version
+    that last wrote the row. Every write bumps a version number so readers (other
+    processes too) reload lazily. Deleted rows stay in the file as dead rows that search
+    skips; their space is not reclaimed.
+    """
+
+    def __init__(self, root: Path, dim: int = DIM):
+        self.root = root
+        self.dim = dim
+        root.mkdir(parents=True, exist_ok=True)
+        self.vec_path = root / "vectors.f32"
+        self.ivf_path = root / "ivf.npz"
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(root / "meta.sqlite", timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS items (id TEXT PRIMARY KEY, row INTEGER UNIQUE NOT NULL, metadata TEXT NOT NULL,"
+            " updated INTEGER NOT NULL DEFAULT 0)"
+        )
+        if "updated" not in {c[1] for c in self.db.execute("PRAGMA table_info(items)")}:
+            self.db.execute("ALTER TABLE items ADD COLUMN updated INTEGER NOT NULL DEFAULT 0")
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_updated ON items (updated)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v INTEGER NOT NULL)")
+        self.db.execute("INSERT OR IGNORE INTO meta (k, v) VALUES ('version', 0)")
+        # in-memory view, refreshed when the on-disk version moves
+        self._version = -1
+        self._V = np.zeros((0, dim), dtype=np.float32)
+        self._ids: List[str | None] = []
+        self._meta: List[str | None] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._ivf: IVFIndex | None = None
+
+    def version(self) -> int:
+        return self.db.execute("SELECT v FROM meta WHERE k = 'version'").fetchone()[0]
+
+    # -------- Writes --------
+    def upsert(self, vectors: List[Dict[str, Any]]) -> None:
+        if not vectors:
+            return
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [v["id"] for v in vectors]
+                known = {}
+                for start in range(0, len(ids), 500):
+                    part = ids[start:start + 500]
+                    marks = ",".join("?" * len(part))
+                    known.update(self.db.execute(f"SELECT id, row FROM items WHERE id IN ({marks})", part).fetchall())
+                next_row = self.db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM items").fetchone()[0]
+                rows = []
+                for vid in ids:
+                    if vid not in known:
+                        known[vid] = next_row
+                        next_row += 1
+                    rows.append(known[vid])
+
+                V = self._writable(next_row)
+                mat = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+                mat /= np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12
+                V[rows] = mat
+                V.flush()
+                del V
+                version = self.version() + 1
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO items (id, row, metadata, updated) VALUES (?, ?, ?, ?)",
+                    [(v["id"], r, json.dumps(v.get("metadata") or {}), version) for v, r in zip(vectors, rows)],
+                )
+                self.db.execute("UPDATE meta SET v = ? WHERE k = 'version'", (version,))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def delete(self, ids: List[str]) -> int:
+        """Drop ids; their rows stay in the file as dead rows."""
+        if not ids:
+            return 0
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                removed = 0
+                for start in range(0, len(ids), 500):
+                    part = ids[start:start + 500]
+                    marks = ",".join("?" * len(part))
+                    removed += self.db.execute(f"DELETE FROM items WHERE id IN ({marks})", part).rowcount
+                self.db.execute("UPDATE meta SET v = v + 1 WHERE k = 'version'")
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            return removed
+
+    def _writable(self, n_rows: int) -> np.memmap:
+        # Grow the backing file geometrically so appends stay amortized O(1)
+        size = self.vec_path.stat().st_size if self.vec_path.exists() else 0
+        need = n_rows * self.dim * 4
+        if size < need:
+            with open(self.vec_path, "ab") as f:
+                f.truncate(max(need, size * 2, 1024 * self.dim * 4))
+            size = self.vec_path.stat().st_size
+        return np.memmap(self.vec_path, dtype=np.float32, mode="r+", shape=(size // (self.dim * 4), self.dim))
+
+    # -------- Reads --------
+    def _refresh(self) -> None:
+        version = self.version()
+        if version == self._version:
+            return
+        rows = self.db.execute("SELECT id, row, metadata FROM items").fetchall()
+        n = max((r for _, r, _ in rows), default=-1) + 1
+        ids: List[str | None] = [None] * n
+        meta: List[str | None] = [None] * n
+        for vid, r, md in rows:
+            ids[r], meta[r] = vid, md
+        if n:
+            full = np.memmap(self.vec_path, dtype=np.float32, mode="r")
+            self._V = full[: n * self.dim].reshape(n, self.dim)
+        else:
+            self._V = np.zeros((0, self.dim), dtype=np.float32)
+        self._ids, self._meta = ids, meta
+        self._alive = np.array([i is not None for i in ids], dtype=bool)
+        self._version = version
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    def get(self, ids: List[str]) -> Dict[str, Tuple[Dict[str, Any], np.ndarray]]:
+        """id -> (metadata, unit vector) for the ids that exist."""
+        out = {}
+        with self._lock:
+            self._refresh()
+            for start in range(0, len(ids), 500):
+                part = ids[start:start + 500]
+                marks = ",".join("?" * len(part))
+                for vid, row in self.db.execute(f"SELECT id, row FROM items WHERE id IN ({marks})", part):
+                    if row < len(self._ids) and self._ids[row] == vid:
+                        out[vid] = (json.loads(self._meta[row]), np.array(self._V[row]))
+        return out
+
+    def search(self, q: np.ndarray, top_k: int) -> List[Tuple[str, float, Dict[str, Any], np.ndarray]]:
+        """Top-k by inner product (vectors are unit length). Exact below the IVF threshold, IVF above it."""
+        with self._lock:
+            self._refresh()
+            n = self._V.shape[0]
+            if n == 0 or top_k <= 0:
+                return []
+            q = np.asarray(q, dtype=np.float32).reshape(-1)
+            q = q / (np.linalg.norm(q) + 1e-12)
+
+            if n >= settings.local_ivf_min_vectors:
+                cand = self._ivf_index().candidates(q, settings.local_ivf_nprobe)
+                cand = cand[self._alive[cand]]
+                scores = self._V[cand] @ q
+            else:
+                cand = None
+                scores = self._V @ q
+                scores[~self._alive] = -np.inf
+
+            k = min(top_k, scores.shape[0])
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            out = []
+            for i in top:
+                row = int(cand[i]) if cand is not None else int(i)
+                if not np.isfinite(scores[i]):
+                    continue
+                out.append((self._ids[row], float(scores[i]), json.loads(self._meta[row]), self._V[row]))
+            return out
+
+    def _ivf_index(self) -> IVFIndex:
+        """
+        The IVF index at the current version. Rows written since the last index (this
+        process's or the one on disk) are assigned to its centroids; k-means reruns only
+        when those rows pass settings.local_ivf_rebuild_drift of the rows it was fitted on.
+        """
+        ivf = self._ivf
+        if ivf is not None and ivf.version == self._version:
+            return ivf
+        disk = IVFIndex.load(self.ivf_path)
+        if disk is not None and disk.version <= self._version and (ivf is None or disk.version > ivf.version):
+            ivf = disk  # another process already folded in some of the writes
+            if ivf.version == self._version:
+                self._ivf = ivf
+                return ivf
+        if ivf is not None:
+            changed = [r for (r,) in self.db.execute("SELECT row FROM items WHERE updated > ?", (ivf.version,))]
+            ivf.update(self._V, changed, self._version)
+        if ivf is None or ivf.drift > settings.local_ivf_rebuild_drift:
+            ivf = IVFIndex.build(np.ascontiguousarray(self._V), version=self._version)
+        ivf.save(self.ivf_path)
+        self._ivf = ivf
+        return ivf
+
+
+class LocalVectorRetriever(DenseRetriever):
+    """
+    In-process vector store with the same embed / upsert_chunks / retrieve interface as
+    PineconeRetriever. One NamespaceStore per namespace under settings.local_store_dir.
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        super().__init__()
+        self.root = Path(root or settings.local_store_dir)
+        self._stores: Dict[str, NamespaceStore] = {}
+        self._stores_lock = threading.Lock()
+
+    def store(self, namespace: str | None = None) -> NamespaceStore:
+        namespace = namespace or settings.pinecone_namespace
+        with self._stores_lock:
+            if namespace not in self._stores:
+                self._stores[namespace] = NamespaceStore(_namespace_dir(self.root, namespace))
+            return self._stores[namespace]
+
+    # -------- Upsert (chunks) --------
+    def upsert_chunks(self, chunks: List[Dict[str, Any]], namespace: str | None = None) -> Dict[str, Any]:
+        """Embed and write chunks locally; returns the same stats shape as PineconeRetriever.upsert_chunks."""
+        t0 = time.time()
+        all_values = self.embed_array([c["text"] for c in chunks])
+        t_embed = time.time() - t0
+
+        vectors = build_vectors(chunks, all_values)
+        t1 = time.time()
+        batch_stats = self.upsert_vectors(vectors, namespace)
+        t_upsert = time.time() - t1
+
+        elapsed = time.time() - t0
+        return {
+            "chunks": len(vectors),
+            "batches": batch_stats,
+            "embed_s": t_embed,
+            "upsert_s": t_upsert,
+            "chunks_per_s": len(vectors) / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def upsert_vectors(self, vectors: List[Dict[str, Any]], namespace: str | None = None) -> List[Dict[str, Any]]:
+        """Write already-embedded vectors in one transaction. Returns per-batch stats (a single batch)."""
+        if not vectors:
+            return []
+        t0 = time.time()
+        nbytes = sum(len(v["values"]) * 4 + len(json.dumps(v["metadata"])) for v in vectors)
+        with span("upsert_batch", vectors=len(vectors), bytes=nbytes):
+            self.store(namespace).upsert(vectors)
+            self._index_sparse(vectors, namespace)
+        return [{"count": len(vectors), "bytes": nbytes, "upsert_s": time.time() - t0}]
+
+    def delete_ids(self, ids: List[str], namespace: str | None = None) -> int:
+        removed = self.store(namespace).delete(ids)
+        self._unindex_sparse(ids, namespace)
+        return removed
+
+    def fetch(self, ids: List[str], namespace: str | None = None) -> Dict[str, Dict[str, Any]]:
+        return {vid: {"metadata": md, "values": v.tolist()} for vid, (md, v) in self.store(namespace).get(ids).items()}
+
+    def store_id(self, namespace: str | None = None) -> str:
+        """
+        Which store upserts land in (see chunk_manifest.store_fingerprint): the namespace dir
+        plus a random id written when it was created, so a wiped store gets a new identity.
+        """
+        path = self.store(namespace).root
+        id_path = path / "store_id"
+        try:
+            fd = os.open(id_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            sid = id_path.read_text().strip()
+        else:
+            sid = uuid.uuid4().hex
+            with os.fdopen(fd, "w") as f:
+                f.write(sid)
+        return f"local:{path.resolve()}:{sid}"
+
+    def _sparse_dir(self, namespace: str) -> Path:
+        # BM25 files live next to the namespace's vectors
+        return _namespace_dir(self.root, namespace)
+
+    # -------- Retrieve (vector search) --------
+    def retrieve_by_vector(
+        self,
+        qvec,
+        top_k: int | None = None,
+        namespace: str | None = None,
+        min_score: float = 0.25,
+        include_values: bool = False,
+    ):
+        top_k = top_k or settings.initial_recall_k
+        qvec = np.asarray(qvec, dtype=np.float32)
+        qlist = qvec.tolist() if include_values else None
+
+        hits = []
+        for vid, score, md, values in self.store(namespace).search(qvec, top_k):
+            if score >= min_score:
+                hit = {"id": vid, "score": score, "text": md.get("text", ""), "metadata": md}
+                if include_values:
+                    hit["values"] = values.tolist()
+                    hit["query_values"] = qlist
+                hits.append(hit)
+        return hits
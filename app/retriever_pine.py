@@ -1,28 +1,419 @@
 # app/retriever_pine.py
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
+import hashlib
+import json
+import re
+import threading
+import time
 
+import numpy as np
+
+from app.bm25 import BM25Store, fuse
 from app.config import settings
+from app.doc_store import DocStore
+from app.embedding_cache import EmbeddingCache
+from app.lazy import LazyValue
+from app.tracing import span
 
 
 DIM = settings.embedding_dim  # 384 for MiniLM
 
 
-class PineconeRetriever:
+# Heavy SDKs (torch via sentence-transformers, pinecone) are imported on first use,
+# not when this module is imported. Module-level names so tests can patch them.
+def SentenceTransformer(name: str):
+    from sentence_transformers import SentenceTransformer as _SentenceTransformer
+    return _SentenceTransformer(name)
+
+
+def make_embedder(name: str):
+    """Embedding model for settings.embedding_backend: "torch" (sentence-transformers) or "onnx" (int8 ONNX Runtime)."""
+    if settings.embedding_backend == "onnx":
+        from app.onnx_embedder import OnnxEmbedder
+        return OnnxEmbedder(name)
+    return SentenceTransformer(name)
+
+
+def embedding_model_key() -> str:
+    """The embedding model as far as stored vectors are concerned (ONNX int8/fp32 vectors differ from PyTorch ones)."""
+    if settings.embedding_backend == "onnx":
+        return f"{settings.embedding_model_name}@onnx-{'int8' if settings.onnx_quantize else 'fp32'}"
+    return settings.embedding_model_name
+
+
+def Pinecone(api_key: str):
+    from pinecone import Pinecone as _Pinecone
+    return _Pinecone(api_key=api_key)
+
+
+def ServerlessSpec(cloud: str, region: str):
+    from pinecone import ServerlessSpec as _ServerlessSpec
+    return _ServerlessSpec(cloud=cloud, region=region)
+
+
+def _index_names(listing) -> List[str]:
+    """Index names from list_indexes(); handles IndexList, dict and plain list shapes."""
+    if hasattr(listing, "names"):
+        return list(listing.names())
+    if isinstance(listing, dict):
+        listing = listing.get("indexes", [])
+    return [i["name"] if isinstance(i, dict) else getattr(i, "name", i) for i in listing or []]
+
+
+def _index_dimension(description) -> int | None:
+    if isinstance(description, dict):
+        return description.get("dimension")
+    return getattr(description, "dimension", None)
+
+
+def _index_check_key(name: str) -> str:
+    # Same index name under another API key (project) is a different index
+    project = hashlib.blake2b(settings.pinecone_api_key.encode(), digest_size=6).hexdigest()
+    return f"{name}|{DIM}|{project}"
+
+
+def _read_index_checks() -> Dict[str, float]:
+    try:
+        return json.loads(Path(settings.pinecone_index_check_cache).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _index_check_fresh(name: str) -> bool:
+    """True if this index was verified (exists, right dimension) within the last pinecone_index_check_ttl_s."""
+    ttl = settings.pinecone_index_check_ttl_s
+    if ttl <= 0:
+        return False
+    checked = _read_index_checks().get(_index_check_key(name))
+    return checked is not None and time.time() - checked < ttl
+
+
+def _record_index_check(name: str) -> None:
+    if settings.pinecone_index_check_ttl_s <= 0:
+        return
+    path = Path(settings.pinecone_index_check_cache)
+    checks = _read_index_checks()
+    checks[_index_check_key(name)] = time.time()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{time.time_ns()}.tmp")
+        tmp.write_text(json.dumps(checks))
+        tmp.replace(path)  # atomic, so concurrent workers never read a torn file
+    except OSError as e:
+        print(f"[WARN] Could not record Pinecone index check: {e}")
+
+
+def _namespace_dir(root: Path, namespace: str) -> Path:
+    return root / (re.sub(r"[^A-Za-z0-9_.-]", "_", namespace) or "_")
+
+
+def _vector_bytes(vector: Dict[str, Any]) -> int:
+    # Approximate request payload size of one vector (JSON wire format)
+    return len(json.dumps(vector, separators=(",", ":"), default=str))
+
+
+def split_upsert_batches(
+    vectors: List[Dict[str, Any]],
+    max_count: int,
+    max_bytes: int,
+) -> List[tuple[List[Dict[str, Any]], int]]:
+    """
+    Split vectors into batches bounded by both count and estimated payload bytes.
+    Returns [(batch, batch_bytes), ...]; a single oversized vector gets its own batch.
+    """
+    batches = []
+    current, current_bytes = [], 0
+    for v in vectors:
+        size = _vector_bytes(v)
+        if current and (len(current) >= max_count or current_bytes + size > max_bytes):
+            batches.append((current, current_bytes))
+            current, current_bytes = [], 0
+        current.append(v)
+        current_bytes += size
+    if current:
+        batches.append((current, current_bytes))
+    return batches
+
+
+def vector_id(source: str, position: int) -> str:
+    return f"{source}:{position}"
+
+
+def build_vectors(chunks: List[Dict[str, Any]], all_values) -> List[Dict[str, Any]]:
+    """Pair chunks with their embeddings as {"id", "values", "metadata"} records (id = source:position)."""
+    vectors = []
+    for i, (c, values) in enumerate(zip(chunks, all_values)):
+        # c: {"text": "...", "metadata": {"source": "...", "title": "...", "section": "...", "position": int}}
+        md_in = c.get("metadata", {}) or {}
+        metadata = {
+            "text": c["text"],
+            # keep only the keys you care about (used later for citations)
+            **{k: v for k, v in md_in.items() if k in ("source", "title", "section", "position", "page", "page_end", "start_char", "end_char")}
+        }
+        vid = vector_id(metadata.get("source", "doc"), metadata.get("position", i))
+        vectors.append({"id": vid, "values": values, "metadata": metadata})
+    return vectors
+
+
+class DenseRetriever(ABC):
+    """
+    Embedding side shared by every vector backend (model, mini-batching, embedding cache).
+    Backends implement retrieve_by_vector() and fetch().
+    """
+
+    # retrieve(include_values=True) returns stored vectors, so callers can skip re-embedding hits
+    supports_values = True
+    # set by backends that keep chunk text out of the index; hits then arrive without "text" until hydrate()
+    doc_store: DocStore | None = None
+
     def __init__(self):
-        # --- Embeddings model ---
+        # --- Embeddings model (loaded on first encode, or by warmup()) ---
         # Normalize embeddings to match cosine metric best practices.
-        self.embedder = SentenceTransformer(settings.embedding_model_name)
+        self._embedder = LazyValue(lambda: make_embedder(settings.embedding_model_name))
+        self.embed_cache = self._open_embed_cache()
+        # --- BM25 side of hybrid search, one store per namespace (opened on first use) ---
+        self._sparse: Dict[str, BM25Store] = {}
+        self._sparse_lock = threading.Lock()
+        self._hybrid_pool = LazyValue(lambda: ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid"))
 
-        # --- Pinecone client ---
-        self.pc = Pinecone(api_key=settings.pinecone_api_key)
+    @property
+    def embedder(self):
+        return self._embedder.get()
+
+    # -------- Embeddings --------
+    @staticmethod
+    def _open_embed_cache() -> EmbeddingCache | None:
+        if not settings.embedding_cache_enabled:
+            return None
+        try:
+            return EmbeddingCache(
+                settings.embedding_cache_dir,
+                # ONNX (int8) vectors differ slightly from PyTorch ones, so they get their own entries
+                model_name=embedding_model_key(),
+                dim=DIM,
+                max_entries=settings.embedding_cache_max_entries,
+                memory_items=settings.embedding_cache_memory_items,
+            )
+        except Exception as e:
+            # e.g. read-only filesystem on a hosted deployment
+            print(f"[WARN] Embedding cache disabled: {e}")
+            return None
 
-        # --- Ensure index exists (serverless) ---
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        parts = []
+        for start in range(0, len(texts), batch_size):
+            vecs = self.embedder.encode(texts[start:start + batch_size], normalize_embeddings=True)
+            parts.append(np.asarray(vecs, dtype=np.float32))
+        if not parts:
+            return np.zeros((0, DIM), dtype=np.float32)
+        return parts[0] if len(parts) == 1 else np.vstack(parts)
+
+    def embed_array(self, texts: List[str], batch_size: int | None = None) -> np.ndarray:
+        """
+        Encode texts in mini-batches of `batch_size` (default settings.embed_batch_size) into an (n, DIM) float32 matrix.
+        Texts already in the embedding cache are not re-encoded.
+        """
+        batch_size = batch_size or settings.embed_batch_size
+        if self.embed_cache is None or not texts:
+            with span("embed", texts=len(texts)):
+                return self._encode(texts, batch_size)
+
+        found, missing = self.embed_cache.get_many(texts)
+        if not missing:
+            return np.vstack([found[i] for i in range(len(texts))])
+        with span("embed", texts=len(missing), cached=len(found)):
+            fresh = self._encode([texts[i] for i in missing], batch_size)
+        self.embed_cache.put_many([texts[i] for i in missing], fresh)
+        out = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+        out[missing] = fresh
+        for i, vec in found.items():
+            out[i] = vec
+        return out
+
+    def embed(self, texts: List[str], batch_size: int | None = None) -> List[List[float]]:
+        return self.embed_array(texts, batch_size).tolist()
+
+    def tokenizer(self):
+        """(tokenizer, max sequence length) of the embedding model, for sizing chunks; either may be None."""
+        return getattr(self.embedder, "tokenizer", None), getattr(self.embedder, "max_seq_length", None)
+
+    def warmup(self) -> None:
+        """Run one encode that bypasses the cache, so weights and kernels are ready for the first query."""
+        self._encode(["warm up"], 1)
+
+    # -------- Sparse (BM25) index --------
+    def _sparse_dir(self, namespace: str) -> Path:
+        return _namespace_dir(Path(settings.bm25_dir), namespace)
+
+    def sparse_index(self, namespace: str | None = None) -> BM25Store | None:
+        """The namespace's BM25 store, or None when hybrid search is off."""
+        if not settings.hybrid_search_enabled:
+            return None
+        namespace = namespace or settings.pinecone_namespace
+        with self._sparse_lock:
+            if namespace not in self._sparse:
+                self._sparse[namespace] = BM25Store(self._sparse_dir(namespace))
+            return self._sparse[namespace]
+
+    def _index_sparse(self, vectors: List[Dict[str, Any]], namespace: str | None) -> None:
+        # Called after the vector upsert succeeded, so BM25 never returns ids the vector store lacks
+        store = self.sparse_index(namespace)
+        if store is not None and vectors:
+            store.upsert((v["id"], v["metadata"].get("text", "")) for v in vectors)
+
+    def _unindex_sparse(self, ids: List[str], namespace: str | None) -> None:
+        store = self.sparse_index(namespace)
+        if store is not None and ids:
+            store.delete(ids)
+
+    # -------- Retrieve (vector search) --------
+    def retrieve(
+        self,
+        query: str,
+        top_k: int | None = None,
+        namespace: str | None = None,
+        min_score: float = 0.25,
+        include_values: bool = False,
+    ):
+        """
+        Embed the query, then retrieve_hybrid (dense + BM25, or dense only when hybrid search is off).
+        With include_values=True each hit also carries its stored vector ("values") and the query
+        vector ("query_values", shared list).
+        """
+        qvec = self.embed_array([query])[0]
+        return self.retrieve_hybrid(query, qvec, top_k=top_k, namespace=namespace, min_score=min_score,
+                                    include_values=include_values)
+
+    def retrieve_hybrid(
+        self,
+        query: str,
+        qvec,
+        top_k: int | None = None,
+        namespace: str | None = None,
+        min_score: float = 0.25,
+        include_values: bool = False,
+    ):
+        """
+        Dense search and BM25 run concurrently and their top-k lists are fused (settings.hybrid_fusion).
+        "score" is the fused score; "dense_score" / "bm25_score" keep the inputs. BM25-only hits are
+        hydrated with fetch() (issued alongside the dense query), so they carry metadata and values too.
+        min_score applies to the dense list only: an exact-term match is kept whatever its cosine.
+        """
+        store = self.sparse_index(namespace)
+        if store is None:
+            return self.retrieve_by_vector(qvec, top_k=top_k, namespace=namespace, min_score=min_score,
+                                           include_values=include_values)
+        top_k = top_k or settings.initial_recall_k
+        pool = self._hybrid_pool.get()
+        dense_f = pool.submit(self.retrieve_by_vector, qvec, top_k=top_k, namespace=namespace,
+                              min_score=min_score, include_values=include_values)
+        sparse = store.search(query, top_k)
+        fetch_f = pool.submit(self.fetch, [i for i, _ in sparse], namespace) if sparse else None
+        dense = dense_f.result()
+        if not sparse:
+            return dense
+
+        fused = fuse(dense, sparse, top_k, method=settings.hybrid_fusion, rrf_k=settings.hybrid_rrf_k,
+                     sparse_weight=settings.hybrid_sparse_weight)
+        by_id = {h["id"]: h for h in dense}
+        bm25 = dict(sparse)
+        fetched = fetch_f.result() if any(i not in by_id for i, _ in fused) else {}
+        qlist = (dense[0]["query_values"] if dense else np.asarray(qvec, dtype=np.float32).tolist()) \
+            if include_values else None
+        hits = []
+        for vid, score in fused:
+            hit = by_id.get(vid)
+            if hit is not None:
+                hit = {**hit, "score": score, "dense_score": hit["score"]}
+            elif vid in fetched:
+                md = fetched[vid]["metadata"]
+                hit = {"id": vid, "score": score, "text": md.get("text", ""), "metadata": md}
+                if include_values:
+                    hit["values"] = list(fetched[vid]["values"])
+                    hit["query_values"] = qlist
+            else:
+                continue  # in BM25 but gone from the vector store
+            if vid in bm25:
+                hit["bm25_score"] = bm25[vid]
+            hits.append(hit)
+        return hits
+
+    @abstractmethod
+    def retrieve_by_vector(self, qvec, top_k=None, namespace=None, min_score=0.25, include_values=False):
+        """Dense hits for a query vector with score >= min_score, best first."""
+
+    def hydrate(self, hits: List[Dict[str, Any]], namespace: str | None = None) -> List[Dict[str, Any]]:
+        """
+        Fill in "text" for hits that came back without it, with one doc-store lookup. Returns the
+        hits that have text: ids the doc store does not know (e.g. a fresh container that does not
+        share the ingest host's DOC_STORE_PATH) are dropped with a warning instead of being answered
+        from empty text.
+        """
+        missing = [h for h in hits if not h.get("text")]
+        if self.doc_store is None or not missing:
+            return hits
+        texts = self.doc_store.get_many(namespace or settings.pinecone_namespace, [h["id"] for h in missing])
+        for h in missing:
+            h["text"] = texts.get(h["id"], "")
+        lost = [h["id"] for h in missing if not h["text"]]
+        if not lost:
+            return hits
+        print(f"[WARN] {len(lost)} hit(s) have no text in the doc store {self.doc_store.path} "
+              f"(first: {lost[0]}); is DOC_STORE_PATH shared with ingest?")
+        return [h for h in hits if h["text"]]
+
+    @abstractmethod
+    def fetch(self, ids: List[str], namespace: str | None = None) -> Dict[str, Dict[str, Any]]:
+        """Stored {"metadata", "values"} per id (missing ids are left out)."""
+
+
+class PineconeRetriever(DenseRetriever):
+    def __init__(self):
+        super().__init__()
+
+        # --- Pinecone client and index handle, created on first upsert/query ---
+        self._pc = LazyValue(lambda: Pinecone(api_key=settings.pinecone_api_key))
+        self._index = LazyValue(self._open_index)
+        self.doc_store = self._open_doc_store()
+
+    @staticmethod
+    def _open_doc_store() -> DocStore | None:
+        if not settings.doc_store_enabled:
+            return None
+        try:
+            return DocStore(settings.doc_store_path)
+        except Exception as e:
+            # chunk text then stays in Pinecone metadata, as before
+            print(f"[WARN] Local doc store disabled: {e}")
+            return None
+
+    def store_id(self, namespace: str | None = None) -> str:
+        """Which store upserts land in (see chunk_manifest.store_fingerprint)."""
+        return f"pinecone:{settings.pinecone_index}"
+
+    @property
+    def pc(self):
+        return self._pc.get()
+
+    @property
+    def index(self):
+        return self._index.get()
+
+    def _open_index(self):
         name = settings.pinecone_index
-        existing = [i["name"] for i in self.pc.list_indexes().get("indexes", [])]
+        if not _index_check_fresh(name):
+            self._ensure_index(name)
+            _record_index_check(name)
+        return self.pc.Index(name)
+
+    def _ensure_index(self, name: str) -> None:
+        """Create the serverless index if missing; an existing one must match the embedding dimension."""
+        existing = _index_names(self.pc.list_indexes())
         if name not in existing:
             # Cloud/region come from your config (e.g., cloud="aws", region="us-east-1")
             self.pc.create_index(
@@ -34,53 +425,113 @@ class PineconeRetriever:
                     region=settings.pinecone_region or "us-east-1",
                 ),
             )
+            return
+        if hasattr(self.pc, "describe_index"):
+            dim = _index_dimension(self.pc.describe_index(name))
+            if dim is not None and dim != DIM:
+                raise ValueError(
+                    f"Pinecone index {name!r} has dimension {dim}, but {settings.embedding_model_name} produces {DIM}"
+                )
+
+    # -------- Upsert (chunks) --------
+    def upsert_chunks(self, chunks: List[Dict[str, Any]], namespace: str | None = None) -> Dict[str, Any]:
+        """
+        Bulk ingest: encode all chunks in mini-batches, split the vectors into
+        size-bounded upsert batches and send them concurrently.
+        Returns stats: {"chunks", "batches": [{"count", "bytes", "upsert_s"}], "embed_s", "upsert_s", "chunks_per_s"}.
+        """
+        namespace = namespace or settings.pinecone_namespace
+        t0 = time.time()
 
-        # --- Open index handle ---
-        self.index = self.pc.Index(name)
+        # embed() skips texts already in the embedding cache and encodes the rest in
+        # settings.embed_batch_size mini-batches (_encode).
+        all_values = self.embed([c["text"] for c in chunks]) if chunks else []
+        t_embed = time.time() - t0
 
-    # -------- Embeddings --------
-    def embed(self, texts: List[str]) -> List[List[float]]:
-        vecs = self.embedder.encode(texts, normalize_embeddings=True)
-        return vecs.tolist() if hasattr(vecs, "tolist") else vecs
+        vectors = build_vectors(chunks, all_values)
 
-    # -------- Upsert (chunks) --------
-    def upsert_chunks(self, chunks: List[Dict[str, Any]], namespace: str | None = None):
+        t1 = time.time()
+        batch_stats = self.upsert_vectors(vectors, namespace)
+        t_upsert = time.time() - t1
+
+        elapsed = time.time() - t0
+        return {
+            "chunks": len(vectors),
+            "batches": batch_stats,
+            "embed_s": t_embed,
+            "upsert_s": t_upsert,
+            "chunks_per_s": len(vectors) / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def upsert_vectors(self, vectors: List[Dict[str, Any]], namespace: str | None = None) -> List[Dict[str, Any]]:
+        """Upsert already-embedded vectors in size-bounded batches, sent concurrently. Returns per-batch stats."""
+        namespace = namespace or settings.pinecone_namespace
+        payload = vectors
+        if self.doc_store is not None and vectors:
+            # Text goes to the local store first, so a vector is never visible without its text
+            self.doc_store.put_many(namespace, ((v["id"], v["metadata"].get("text", "")) for v in vectors))
+            payload = [{**v, "metadata": {k: x for k, x in v["metadata"].items() if k != "text"}} for v in vectors]
+        batches = split_upsert_batches(payload, settings.upsert_batch_size, settings.upsert_max_bytes)
+
+        def _send(batch):
+            vecs, nbytes = batch
+            tb = time.time()
+            # Pinecone v3 upsert
+            with span("upsert_batch", vectors=len(vecs), bytes=nbytes):
+                self.index.upsert(vectors=vecs, namespace=namespace)
+            return {"count": len(vecs), "bytes": nbytes, "upsert_s": time.time() - tb}
+
+        if not batches:
+            return []
+        if len(batches) == 1:
+            stats = [_send(batches[0])]
+        else:
+            workers = max(1, min(settings.upsert_workers, len(batches)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                stats = list(pool.map(_send, batches))
+        self._index_sparse(vectors, namespace)
+        return stats
+
+    def delete_ids(self, ids: List[str], namespace: str | None = None) -> int:
+        """Delete vectors by id (Pinecone accepts up to 1000 ids per call)."""
         namespace = namespace or settings.pinecone_namespace
+        for start in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[start:start + 1000], namespace=namespace)
+        self._unindex_sparse(ids, namespace)
+        if self.doc_store is not None:
+            self.doc_store.delete(namespace, ids)
+        return len(ids)
 
-        vectors = []
-        for i, c in enumerate(chunks):
-            # c: {"text": "...", "metadata": {"source": "...", "title": "...", "section": "...", "position": int}}
-            values = self.embed([c["text"]])[0]
-            md_in = c.get("metadata", {}) or {}
-            metadata = {
-                "text": c["text"],
-                # keep only the keys you care about (used later for citations)
-                **{k: v for k, v in md_in.items() if k in ("source", "title", "section", "position")}
-            }
-            vid = f'{metadata.get("source", "doc")}:{metadata.get("position", i)}'
-            vectors.append({"id": vid, "values": values, "metadata": metadata})
-
-        # Pinecone v3 upsert
-        if vectors:
-            self.index.upsert(vectors=vectors, namespace=namespace)
+    def fetch(self, ids: List[str], namespace: str | None = None) -> Dict[str, Dict[str, Any]]:
+        namespace = namespace or settings.pinecone_namespace
+        out = {}
+        for start in range(0, len(ids), 1000):
+            res = self.index.fetch(ids=ids[start:start + 1000], namespace=namespace)
+            for vid, v in (res.get("vectors") or {}).items():
+                out[vid] = {"metadata": v.get("metadata") or {}, "values": v.get("values") or []}
+        return out
 
     # -------- Retrieve (vector search) --------
-    def retrieve(
+    def retrieve_by_vector(
         self,
-        query: str,
+        qvec,
         top_k: int | None = None,
         namespace: str | None = None,
         min_score: float = 0.25,
+        include_values: bool = False,
     ):
+        """Pinecone query for an already-embedded query vector (see retrieve)."""
         top_k = top_k or settings.initial_recall_k
         namespace = namespace or settings.pinecone_namespace
+        qvec = qvec.tolist() if hasattr(qvec, "tolist") else list(qvec)
 
-        qvec = self.embed([query])[0]
+        extra = {"include_values": True} if include_values else {}
         res = self.index.query(
             vector=qvec,
             top_k=top_k,
             include_metadata=True,
             namespace=namespace,
+            **extra,
         )
 
         hits = []
@@ -89,14 +540,14 @@ class PineconeRetriever:
             score = m.get("score", 0.0)
             if score >= min_score:
                 md = m.get("metadata") or {}
-                hits.append(
-                    {
-                        "id": m.get("id"),
-                        "score": score,
-                        "text": md.get("text", ""),
-                        "metadata": md,
-                    }
-                )
+                hit = {
+                    "id": m.get("id"),
+                    "score": score,
+                    "text": md.get("text", ""),
+                    "metadata": md,
+                }
+                if include_values:
+                    hit["values"] = list(m.get("values") or [])
+                    hit["query_values"] = qvec
+                hits.append(hit)
         return hits
-
-
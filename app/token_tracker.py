@@ -1,26 +1,175 @@
 # app/token_tracker.py
-import os, json
-from datetime import date
+"""
+Daily LLM token budget, shared by every worker process on the host.
+
+Usage lives in SQLite (WAL mode): one row per LLM response id, so a response is
+counted exactly once no matter how often its turn is re-rendered, plus a per-day
+running total that makes `remaining()` a single primary-key read.
+`add_tokens` only buffers in memory; buffered rows are written in one transaction
+once TOKEN_FLUSH_EVERY responses are waiting, by a timer at most TOKEN_FLUSH_INTERVAL_S
+seconds after the first one was buffered, and at exit. A killed process (SIGKILL, OOM)
+loses at most that interval's usage.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from datetime import date, timedelta
 from pathlib import Path
+from typing import Dict, Tuple
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import uuid
 
-TRACK_FILE = Path(".token_usage.json")
+TRACK_DB = Path(os.getenv("TOKEN_USAGE_DB", ".token_usage.sqlite"))
+LEGACY_FILE = Path(".token_usage.json")
 DAILY_LIMIT = int(os.getenv("DAILY_TOKEN_LIMIT", "500000"))  # default 500k
+FLUSH_EVERY = int(os.getenv("TOKEN_FLUSH_EVERY", "20"))
+FLUSH_INTERVAL_S = float(os.getenv("TOKEN_FLUSH_INTERVAL_S", "5"))
+KEEP_DAYS = 7  # per-response rows older than this are pruned; daily totals are kept
+
+
+class TokenTracker:
+    def __init__(
+        self,
+        path: str | Path = TRACK_DB,
+        daily_limit: int = DAILY_LIMIT,
+        flush_every: int = FLUSH_EVERY,
+        flush_interval_s: float = FLUSH_INTERVAL_S,
+        legacy_file: str | Path | None = LEGACY_FILE,
+    ):
+        self.path = Path(path)
+        self.daily_limit = daily_limit
+        self.flush_every = flush_every
+        self.flush_interval_s = flush_interval_s
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Tuple[str, int]] = {}  # response id -> (day, tokens)
+        self._flushed: "OrderedDict[str, None]" = OrderedDict()  # recent ids, so repeats skip the buffer
+        self._timer: threading.Timer | None = None  # armed while _pending is non-empty
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " response_id TEXT PRIMARY KEY, day TEXT NOT NULL, tokens INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_day ON responses(day)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS daily (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+        if legacy_file:
+            self._import_legacy(Path(legacy_file))
+
+    def _import_legacy(self, legacy: Path) -> None:
+        # Carry today's total over from the old JSON counter (only if nothing is recorded yet)
+        if not legacy.exists():
+            return
+        try:
+            state = json.loads(legacy.read_text())
+        except (OSError, ValueError):
+            return
+        if state.get("day") == str(date.today()):
+            self._db.execute("INSERT OR IGNORE INTO daily (day, used) VALUES (?, ?)", (state["day"], int(state["used"])))
+
+    # -------- Writes --------
+    def add_tokens(self, count: int, response_id: str | None = None) -> Tuple[int, int, int]:
+        """
+        Record `count` tokens for `response_id` (a response without an id is always
+        new). Repeats of an id are ignored. Returns (left, used, limit) for today.
+        """
+        response_id = response_id or uuid.uuid4().hex
+        with self._lock:
+            if response_id not in self._flushed:
+                self._pending.setdefault(response_id, (str(date.today()), int(count)))
+            due = len(self._pending) >= self.flush_every
+            if self._pending and not due and self._timer is None:
+                # Flush a quiet process's buffer too, so other workers see it within the interval
+                self._timer = threading.Timer(self.flush_interval_s, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+        return self.remaining()
+
+    def _timed_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            # the rows stay buffered; the next add_tokens re-arms the timer
+            print(f"[WARN] Token usage flush failed: {e}")
+
+    def flush(self) -> None:
+        """Write buffered responses; ids already stored (by any process) add nothing."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not pending:
+                return
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                added: Dict[str, int] = {}
+                for rid, (day, tokens) in pending.items():
+                    cur = self._db.execute(
+                        "INSERT OR IGNORE INTO responses (response_id, day, tokens) VALUES (?, ?, ?)",
+                        (rid, day, tokens),
+                    )
+                    if cur.rowcount:
+                        added[day] = added.get(day, 0) + tokens
+                self._db.executemany(
+                    "INSERT INTO daily (day, used) VALUES (?, ?) ON CONFLICT(day) DO UPDATE SET used = used + excluded.used",
+                    list(added.items()),
+                )
+                cutoff = str(date.today() - timedelta(days=KEEP_DAYS))
+                self._db.execute("DELETE FROM responses WHERE day < ?", (cutoff,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                self._pending = {**pending, **self._pending}
+                raise
+            for rid in pending:
+                self._flushed[rid] = None
+            while len(self._flushed) > 10_000:
+                self._flushed.popitem(last=False)
+
+    # -------- Reads --------
+    def remaining(self) -> Tuple[int, int, int]:
+        """(left, used, limit) for today, including not-yet-flushed usage. Never writes."""
+        today = str(date.today())
+        with self._lock:
+            row = self._db.execute("SELECT used FROM daily WHERE day = ?", (today,)).fetchone()
+            used = (row[0] if row else 0) + sum(t for d, t in self._pending.values() if d == today)
+        return self.daily_limit - used, used, self.daily_limit
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+
+_tracker: TokenTracker | None = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker() -> TokenTracker:
+    """Process-wide tracker, opened on first use and flushed at interpreter exit."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = TokenTracker()
+            atexit.register(_tracker.flush)
+        return _tracker
+
+
+def add_tokens(count: int, response_id: str | None = None):
+    return get_tracker().add_tokens(count, response_id)
+
+
+def remaining():
+    return get_tracker().remaining()
+
 
-def _load_state():
-    if TRACK_FILE.exists():
-        with open(TRACK_FILE, "r") as f:
-            return json.load(f)
-    return {"day": str(date.today()), "used": 0}
-
-def _save_state(state):
-    with open(TRACK_FILE, "w") as f:
-        json.dump(state, f)
-
-def add_tokens(count: int):
-    state = _load_state()
-    today = str(date.today())
-    if state["day"] != today:
-        state = {"day": today, "used": 0}
-    state["used"] += count
-    _save_state(state)
-    return DAILY_LIMIT - state["used"], state["used"], DAILY_LIMIT
+def flush():
+    get_tracker().flush()
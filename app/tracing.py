@@ -0,0 +1,283 @@
+# app/tracing.py
+"""
+Per-stage spans for the pipeline, with a Prometheus histogram endpoint and an optional
+OpenTelemetry bridge.
+
+    with span("rerank", docs=12) as sp:
+        ...
+        sp.set(cached=3)
+
+    with timed("vector_query", timings, "retrieve_s", top_k=25):
+        ...            # timings["retrieve_s"] is always set (perf_counter); the span only when tracing is on
+
+With tracing off (TRACING=0, the default) span() returns a shared no-op object, so an
+instrumented stage costs one function call. With it on, every finished span feeds a
+duration histogram per span name (plus totals of its numeric attributes), which
+render_prometheus() / start_metrics_server() expose, and any registered exporters.
+TRACING_OTEL=1 also mirrors spans into OpenTelemetry (opentelemetry-api must be
+installed and an SDK/exporter configured by the host application).
+"""
+from __future__ import annotations
+
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import bisect
+import threading
+import time
+
+from app.config import settings
+
+# Prometheus' default latency buckets (seconds)
+BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = settings.tracing_enabled
+_exporters: List[Callable[["Span"], None]] = []
+_current: ContextVar[Optional["Span"]] = ContextVar("rag_span", default=None)
+_otel_tracer = None
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed stage. `attrs` are sizes and labels (chunk count, bytes, backend...)."""
+
+    __slots__ = ("name", "attrs", "parent", "start", "duration", "error", "_timings", "_key", "_traced", "_otel")
+
+    def __init__(self, name: str, attrs: Dict[str, Any], timings: Dict[str, Any] | None = None,
+                 key: str | None = None, traced: bool = True):
+        self.name = name
+        self.attrs = attrs
+        self.parent: Span | None = None
+        self.start = 0.0
+        self.duration = 0.0
+        self.error: str | None = None
+        self._timings = timings
+        self._key = key
+        self._traced = traced
+        self._otel = None
+
+    def set(self, **attrs) -> None:
+        if self._traced:
+            self.attrs.update(attrs)
+
+    def __enter__(self):
+        if self._traced:
+            self.parent = _current.get()
+            _current.set(self)
+            if _otel_tracer is not None:
+                self._otel = _otel_start(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if self._timings is not None:
+            self._timings[self._key] = self.duration
+        if self._traced:
+            # set() rather than a reset token: spans may close in another context (generators)
+            _current.set(self.parent)
+            if exc_type is not None:
+                self.error = exc_type.__name__
+            if self._otel is not None:
+                _otel_end(self)
+            _record(self)
+        return False
+
+
+def span(name: str, **attrs):
+    """Context manager timing one stage; a shared no-op when tracing is off."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def timed(name: str, timings: Dict[str, Any], key: str, **attrs):
+    """Like span(), but always stores the duration (seconds) in timings[key]."""
+    return Span(name, attrs, timings, key, traced=_enabled)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True) -> None:
+    """Turn tracing on or off for the process (TRACING sets the initial state)."""
+    global _enabled
+    _enabled = on
+    if on and settings.tracing_otel:
+        _init_otel()
+
+
+def add_exporter(fn: Callable[[Span], None]) -> None:
+    """Call `fn(span)` for every finished span (from the thread that ran it)."""
+    _exporters.append(fn)
+
+
+def remove_exporter(fn: Callable[[Span], None]) -> None:
+    if fn in _exporters:
+        _exporters.remove(fn)
+
+
+# -------- Histograms (Prometheus text format) --------
+class _Histogram:
+    __slots__ = ("counts", "sum", "count", "attr_sums", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.attr_sums: Dict[str, float] = {}
+        self.errors = 0
+
+
+_hist: Dict[str, _Histogram] = {}
+_hist_lock = threading.Lock()
+
+
+def _record(sp: Span) -> None:
+    with _hist_lock:
+        h = _hist.get(sp.name)
+        if h is None:
+            h = _hist[sp.name] = _Histogram()
+        h.counts[bisect.bisect_left(BUCKETS, sp.duration)] += 1
+        h.sum += sp.duration
+        h.count += 1
+        if sp.error is not None:
+            h.errors += 1
+        for k, v in sp.attrs.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                h.attr_sums[k] = h.attr_sums.get(k, 0.0) + v
+    for fn in list(_exporters):
+        try:
+            fn(sp)
+        except Exception as e:
+            print(f"[WARN] span exporter failed: {e}")
+
+
+def histogram(name: str) -> Dict[str, Any] | None:
+    """Snapshot of one span's histogram: {"count", "sum", "buckets": [(le, cumulative count)], "attrs", "errors"}."""
+    with _hist_lock:
+        h = _hist.get(name)
+        if h is None:
+            return None
+        cumulative, total = [], 0
+        for le, n in zip(BUCKETS + (float("inf"),), h.counts):
+            total += n
+            cumulative.append((le, total))
+        return {"count": h.count, "sum": h.sum, "buckets": cumulative, "attrs": dict(h.attr_sums), "errors": h.errors}
+
+
+def reset() -> None:
+    with _hist_lock:
+        _hist.clear()
+
+
+def render_prometheus() -> str:
+    """All span histograms in the Prometheus text exposition format."""
+    lines = [
+        "# HELP rag_span_duration_seconds Duration of pipeline stages.",
+        "# TYPE rag_span_duration_seconds histogram",
+    ]
+    attr_lines, error_lines = [], []
+    with _hist_lock:
+        names = sorted(_hist)
+    for name in names:
+        snap = histogram(name)
+        for le, n in snap["buckets"]:
+            le_s = "+Inf" if le == float("inf") else repr(le)
+            lines.append(f'rag_span_duration_seconds_bucket{{span="{name}",le="{le_s}"}} {n}')
+        lines.append(f'rag_span_duration_seconds_sum{{span="{name}"}} {snap["sum"]}')
+        lines.append(f'rag_span_duration_seconds_count{{span="{name}"}} {snap["count"]}')
+        error_lines.append(f'rag_span_errors_total{{span="{name}"}} {snap["errors"]}')
+        for attr, total in sorted(snap["attrs"].items()):
+            attr_lines.append(f'rag_span_attr_total{{span="{name}",attr="{attr}"}} {total}')
+    lines += ["# HELP rag_span_errors_total Stages that raised.", "# TYPE rag_span_errors_total counter", *error_lines]
+    lines += ["# HELP rag_span_attr_total Sum of a numeric span attribute (chunks, bytes, ...).",
+              "# TYPE rag_span_attr_total counter", *attr_lines]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server: ThreadingHTTPServer | None = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int | None = None, host: str = "0.0.0.0") -> ThreadingHTTPServer | None:
+    """
+    Serve GET /metrics on a daemon thread (once per process; later calls return the same
+    server) and turn tracing on. Port defaults to METRICS_PORT; 0 means no server.
+    """
+    global _server
+    port = settings.metrics_port if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    enable(True)
+    return _server
+
+
+# -------- OpenTelemetry bridge --------
+def _init_otel() -> None:
+    global _otel_tracer
+    if _otel_tracer is not None:
+        return
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        print("[WARN] TRACING_OTEL=1 but opentelemetry-api is not installed; spans stay local")
+        return
+    _otel_tracer = trace.get_tracer("rag-pipeline")
+
+
+def _otel_start(sp: Span):
+    from opentelemetry import trace
+    parent = sp.parent._otel if sp.parent is not None else None
+    ctx = trace.set_span_in_context(parent) if parent is not None else None
+    return _otel_tracer.start_span(sp.name, context=ctx)
+
+
+def _otel_end(sp: Span) -> None:
+    from opentelemetry.trace import Status, StatusCode
+    for k, v in sp.attrs.items():
+        if isinstance(v, (str, bool, int, float)):
+            sp._otel.set_attribute(k, v)
+    if sp.error is not None:
+        sp._otel.set_status(Status(StatusCode.ERROR, sp.error))
+    sp._otel.end()
+
+
+if _enabled and settings.tracing_otel:
+    _init_otel()
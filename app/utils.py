@@ -62,50 +62,68 @@ def build_inline_citations(sources: List[Dict[str, Any]]) -> Tuple[str, List[Dic
     # Not used in the LLM prompt; prompt uses bracket tags inline.
     return "", ordered
 
+def format_context_block(c: Dict[str, Any], n: Any) -> str:
+    """One context block of the prompt: the chunk text tagged [n], then its source."""
+    # "prompt_text": the sentences the context packer kept; "text" stays whole for display
+    txt = (c.get("prompt_text") or c["text"]).strip()
+    src = c["metadata"].get("source", "unknown")
+    return f"[{n}] {txt}\n(Source: {src})"
+
 def insert_citation_tags(contexts: List[Dict[str, Any]]) -> str:
     """
     Compose a retrieval context string with inline [n] tags.
     """
-    blocks = []
-    for c in contexts:
-        n = c.get("cite_num", "?")
-        txt = c["text"].strip()
-        src = c["metadata"].get("source", "unknown")
-        blocks.append(f"[{n}] {txt}\n(Source: {src})")
-    return "\n\n".join(blocks)
+    return "\n\n".join(format_context_block(c, c.get("cite_num", "?")) for c in contexts)
 
 def mmr(
-    embeddings: list[list[float]],
+    embeddings,
     top_k: int,
-    lambda_mult: float = 0.5
+    lambda_mult: float = 0.5,
+    query_embedding=None,
+    assume_normalized: bool = False,
 ) -> list[int]:
     """
-    Simple MMR index selection over a list of embeddings (cosine).
-    You can apply this on the initial Pinecone hits to promote diversity.
+    Vectorized MMR index selection (cosine).
+    `embeddings` may be a list of lists or an (n, d) float32 matrix (used without copying).
+    `query_embedding` is the real query vector; without it the first row stands in for the query.
+    Keeps a running max-similarity-to-selected array, so each step is O(n) NumPy work.
     """
     import numpy as np
-    E = np.array(embeddings, dtype=float)
-    norms = np.linalg.norm(E, axis=1, keepdims=True) + 1e-12
-    E = E / norms
+    E = np.asarray(embeddings, dtype=np.float32)
+    n = E.shape[0] if E.ndim == 2 else 0
+    k = min(top_k, n)
+    if k <= 0:
+        return []
+    if not assume_normalized:
+        E = E / (np.linalg.norm(E, axis=1, keepdims=True) + 1e-12)
+
+    if query_embedding is None:
+        # assume first doc is best per initial score
+        relevance = E @ E[0]
+        first = 0
+    else:
+        q = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        if not assume_normalized:
+            q = q / (np.linalg.norm(q) + 1e-12)
+        relevance = E @ q
+        first = int(np.argmax(relevance))
 
-    selected = []
-    candidates = set(range(E.shape[0]))
-    # assume first doc is best per initial score
-    current = 0
-    selected.append(current)
-    candidates.remove(current)
+    base = lambda_mult * relevance
+    penalty = 1.0 - lambda_mult
+    max_sim = np.full(n, -np.inf, dtype=np.float32)  # max similarity to any selected doc
+    scores = np.empty(n, dtype=np.float32)
+    taken = np.zeros(n, dtype=bool)
 
-    while len(selected) < min(top_k, E.shape[0]):
-        # relevance to query approximated by first vector (0)
-        relevance = E[0] @ E.T
-        max_div_score, next_idx = -1e9, None
-        for j in candidates:
-            diversity = max(E[j] @ E[selected].T)
-            score = lambda_mult * relevance[j] - (1 - lambda_mult) * diversity
-            if score > max_div_score:
-                max_div_score, next_idx = score, j
-        selected.append(next_idx)
-        candidates.remove(next_idx)
+    selected = [first]
+    taken[first] = True
+    np.maximum(max_sim, E @ E[first], out=max_sim)
+    while len(selected) < k:
+        np.subtract(base, penalty * max_sim, out=scores)
+        scores[taken] = -np.inf
+        nxt = int(np.argmax(scores))
+        selected.append(nxt)
+        taken[nxt] = True
+        np.maximum(max_sim, E @ E[nxt], out=max_sim)
     return selected
 
 def clean_text(s: str) -> str:
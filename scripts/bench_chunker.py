@@ -0,0 +1,97 @@
+"""
+Throughput and peak memory of the streaming chunker vs the old sliding_window_chunk.
+
+    python scripts/bench_chunker.py [--mb 50] [--tokenizer regex|sentence-transformers/all-MiniLM-L6-v2]
+
+Generates a synthetic text of the given size, then chunks it in a fresh child
+process per chunker: one timed pass, then one pass under tracemalloc for the peak
+memory allocated while chunking (the input text itself is not counted).
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def make_text(mb: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    vocab = [f"{rng.choice('bcdfgklmnprstv')}{rng.choice('aeiou')}{rng.choice('lmnrst')}{i % 97}" for i in range(5000)]
+    parts, size, target = [], 0, int(mb * 1024 * 1024)
+    while size < target:
+        sentence = " ".join(rng.choices(vocab, k=rng.randint(6, 30))) + rng.choice([". ", "! ", "? ", ".\n\n"])
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def _run(kind: str, path: str, tokenizer: str) -> dict:
+    from app.chunking import StreamingChunker
+    from app.utils import sliding_window_chunk
+
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    mb = len(text) / (1024 * 1024)
+    if kind == "sliding_window":
+        def run():
+            return len(sliding_window_chunk(text, 1000, 0.12, {"source": "bench"}))
+    else:
+        tok = None
+        if tokenizer != "regex":
+            from transformers import AutoTokenizer
+            tok = AutoTokenizer.from_pretrained(tokenizer)
+        chunker = StreamingChunker(tok, max_tokens=254, overlap_tokens=30)
+
+        def run():
+            return sum(1 for _ in chunker.chunks([(None, text)], {"source": "bench"}))
+
+    t0 = time.perf_counter()
+    n = run()
+    elapsed = time.perf_counter() - t0
+    # Second pass under tracemalloc: peak bytes allocated while chunking (the text itself excluded)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"chunker": kind, "chunks": n, "seconds": elapsed, "mb_per_s": mb / elapsed, "peak_mb": peak / 2**20}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=50.0)
+    ap.add_argument("--tokenizer", default="regex")
+    ap.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--text-file", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(_run(args.child, args.text_file, args.tokenizer)))
+        return
+
+    # Generated once; each child only holds the text itself before chunking starts
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(make_text(args.mb))
+    print(f"{args.mb:.0f} MB synthetic text, tokenizer={args.tokenizer}")
+    print(f"{'chunker':<16} {'chunks':>8} {'seconds':>8} {'MB/s':>7} {'peak alloc (MB)':>16}")
+    try:
+        for kind in ("sliding_window", "streaming"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--text-file", path, "--tokenizer", args.tokenizer, "--child", kind],
+                capture_output=True, text=True, check=True,
+            )
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{r['chunker']:<16} {r['chunks']:>8} {r['seconds']:>8.2f} {r['mb_per_s']:>7.1f} "
+                  f"{r['peak_mb']:>16.1f}")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
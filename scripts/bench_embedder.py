@@ -0,0 +1,82 @@
+"""
+Embedding throughput and single-query latency: PyTorch (sentence-transformers) vs ONNX int8.
+
+    python scripts/bench_embedder.py [--model sentence-transformers/all-MiniLM-L6-v2] [--sentences 2000]
+                                     [--queries 200] [--threads N] [--backends torch,onnx,onnx-fp32]
+
+Throughput encodes synthetic chunk-sized texts of mixed length in EMBED_BATCH_SIZE slices
+(as ingest does); latency encodes one short query at a time (as a search does). The
+ONNX export is built on first use and cached under ONNX_CACHE_DIR. Also reports the
+cosine agreement of each backend with the PyTorch vectors.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app.config import settings  # noqa: E402
+
+WORDS = ("pump seal valve gasket motor error code replace inspect pressure flow housing bearing the a of "
+         "and to in is for on with when after during check clean filter sensor").split()
+
+
+def make_texts(n: int, lo: int, hi: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(lo, hi))) + "." for _ in range(n)]
+
+
+def load(backend: str, model: str, threads: int):
+    if backend == "torch":
+        import torch
+        from sentence_transformers import SentenceTransformer
+        torch.set_num_threads(threads)
+        return SentenceTransformer(model, device="cpu")
+    from app.onnx_embedder import OnnxEmbedder
+    return OnnxEmbedder(model, quantize=backend == "onnx", threads=threads)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=settings.embedding_model_name)
+    ap.add_argument("--sentences", type=int, default=2000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--threads", type=int, default=settings.onnx_threads)
+    ap.add_argument("--backends", default="torch,onnx")
+    args = ap.parse_args()
+
+    docs = make_texts(args.sentences, 20, 220, seed=0)
+    queries = make_texts(args.queries, 4, 14, seed=1)
+    batch = settings.embed_batch_size
+    print(f"model={args.model} threads={args.threads} docs={len(docs)} queries={len(queries)} batch={batch}")
+    print(f"{'backend':<10} {'load_s':>7} {'sent/s':>8} {'p50_ms':>8} {'p99_ms':>8} {'min_cos':>8}")
+
+    reference = None
+    for backend in args.backends.split(","):
+        t0 = time.perf_counter()
+        model = load(backend, args.model, args.threads)
+        load_s = time.perf_counter() - t0
+        model.encode(queries[:8], normalize_embeddings=True)  # warm-up
+
+        t0 = time.perf_counter()
+        vecs = np.vstack([np.asarray(model.encode(docs[i:i + batch], normalize_embeddings=True), dtype=np.float32)
+                          for i in range(0, len(docs), batch)])
+        rate = len(docs) / (time.perf_counter() - t0)
+
+        lat = []
+        for q in queries:
+            t = time.perf_counter()
+            model.encode([q], normalize_embeddings=True)
+            lat.append((time.perf_counter() - t) * 1000)
+
+        if reference is None and backend == "torch":
+            reference = vecs
+        cos = f"{(vecs * reference).sum(axis=1).min():>8.4f}" if reference is not None else f"{'-':>8}"
+        print(f"{backend:<10} {load_s:>7.1f} {rate:>8.0f} {np.percentile(lat, 50):>8.2f} {np.percentile(lat, 99):>8.2f} {cos}")
+
+
+if __name__ == "__main__":
+    main()
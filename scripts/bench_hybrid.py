@@ -0,0 +1,110 @@
+"""
+Recall vs latency of dense-only and hybrid (dense + BM25, fused) retrieval.
+
+    python scripts/bench_hybrid.py [--docs 5000] [--queries 300] [--embedder hash|sentence-transformers/all-MiniLM-L6-v2]
+
+Builds a synthetic manual-style corpus in a temporary local vector store: every chunk
+has a part number and an error code plus topic words shared with many other chunks.
+Queries ask about one code in paraphrased words, so the relevant chunk is known.
+Reports recall@k (is the relevant chunk in the top k) and per-query retrieval latency
+for each k; the query embedding is computed once up front and not timed.
+
+"--embedder hash" (default, offline) uses the bag-of-words test embedding; absolute
+numbers differ with a real sentence encoder, so pass a model name for those.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ["HYBRID_SEARCH"] = "1"
+os.environ.setdefault("EMBEDDING_CACHE", "0")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import app.retriever_pine as retriever_pine  # noqa: E402
+from app.fakes import hash_embed  # noqa: E402
+from app.retriever_local import LocalVectorRetriever  # noqa: E402
+
+TOPICS = ("pump impeller seal bearing valve gasket motor sensor filter nozzle hose clamp relay fuse "
+          "thermostat compressor belt pulley shaft housing").split()
+VERBS = "check replace inspect tighten clean reset calibrate lubricate drain flush".split()
+FILLER = "the unit may show this when operating under load during startup after maintenance".split()
+
+
+def make_corpus(n_docs: int, seed: int = 0):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        part = f"PN-{1000 + i:04d}-{rng.choice('ABCDEFGH')}"
+        code = f"E{100 + i}"
+        topic = rng.sample(TOPICS, 3)
+        words = rng.sample(FILLER, 6)
+        text = (f"Error {code} on the {topic[0]}: {rng.choice(VERBS)} the {topic[1]} and {rng.choice(VERBS)} "
+                f"the {topic[2]}. Replacement part {part}. " + " ".join(words) + ".")
+        docs.append({"text": text, "metadata": {"source": f"manual-{i // 50}", "position": i % 50},
+                     "code": code, "part": part, "topic": topic})
+    return docs
+
+
+def make_queries(docs, n_queries: int, seed: int = 1):
+    rng = random.Random(seed)
+    out = []
+    for d in rng.sample(docs, min(n_queries, len(docs))):
+        if rng.random() < 0.5:
+            q = f"what does {d['code']} mean for my {d['topic'][0]}"
+        else:
+            q = f"where can I order {d['part']} for the {rng.choice(TOPICS)}"
+        out.append((q, f"{d['metadata']['source']}:{d['metadata']['position']}"))
+    return out
+
+
+class _HashModel:
+    def encode(self, texts, normalize_embeddings=True, **_):
+        return hash_embed(list(texts))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=5000)
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--ks", default="5,10,25")
+    ap.add_argument("--embedder", default="hash")
+    args = ap.parse_args()
+
+    load_model = retriever_pine.SentenceTransformer
+    retriever_pine.SentenceTransformer = (lambda name: _HashModel()) if args.embedder == "hash" \
+        else (lambda name: load_model(args.embedder))
+
+    docs = make_corpus(args.docs)
+    queries = make_queries(docs, args.queries)
+    with tempfile.TemporaryDirectory() as root:
+        r = LocalVectorRetriever(root=root)
+        t0 = time.perf_counter()
+        for start in range(0, len(docs), 256):
+            r.upsert_chunks([{"text": d["text"], "metadata": d["metadata"]} for d in docs[start:start + 256]], "bench")
+        print(f"{len(docs)} chunks indexed in {time.perf_counter() - t0:.1f}s (embedder={args.embedder}), "
+              f"{len(queries)} queries")
+        qvecs = r.embed_array([q for q, _ in queries])
+
+        print(f"{'mode':<8} {'k':>4} {'recall@k':>9} {'p50_ms':>8} {'p95_ms':>8}")
+        for k in [int(x) for x in args.ks.split(",")]:
+            for mode in ("dense", "hybrid"):
+                found, lat = 0, []
+                for (q, want), qv in zip(queries, qvecs):
+                    t = time.perf_counter()
+                    if mode == "dense":
+                        hits = r.retrieve_by_vector(qv, top_k=k, namespace="bench", min_score=0.0)
+                    else:
+                        hits = r.retrieve_hybrid(q, qv, top_k=k, namespace="bench", min_score=0.0)
+                    lat.append(time.perf_counter() - t)
+                    found += any(h["id"] == want for h in hits)
+                lat_ms = np.asarray(lat) * 1000
+                print(f"{mode:<8} {k:>4} {found / len(queries):>9.3f} {np.percentile(lat_ms, 50):>8.2f} "
+                      f"{np.percentile(lat_ms, 95):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark for app.utils.mmr against the previous loop implementation.
+
+    python scripts/bench_mmr.py [--top-k 12] [--dim 384]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app.utils import mmr  # noqa: E402
+
+
+def legacy_mmr(embeddings, top_k, lambda_mult=0.5):
+    # The original per-candidate Python loop, kept here for comparison
+    E = np.array(embeddings, dtype=float)
+    E = E / (np.linalg.norm(E, axis=1, keepdims=True) + 1e-12)
+    selected = [0]
+    candidates = set(range(1, E.shape[0]))
+    while len(selected) < min(top_k, E.shape[0]):
+        relevance = E[0] @ E.T
+        best, nxt = -1e9, None
+        for j in candidates:
+            diversity = max(E[j] @ E[selected].T)
+            score = lambda_mult * relevance[j] - (1 - lambda_mult) * diversity
+            if score > best:
+                best, nxt = score, j
+        selected.append(nxt)
+        candidates.remove(nxt)
+    return selected
+
+
+def _best_of(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--top-k", type=int, default=12)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--sizes", default="25,100,500,1000,2000,5000")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'n':>6} {'legacy_ms':>10} {'vector_ms':>10} {'speedup':>8}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        E = rng.normal(size=(n, args.dim)).astype(np.float32)
+        q = rng.normal(size=args.dim).astype(np.float32)
+        as_lists = E.tolist()
+        repeats = 5 if n <= 1000 else 2
+        t_old = _best_of(lambda: legacy_mmr(as_lists, args.top_k, 0.55), repeats)
+        t_new = _best_of(lambda: mmr(E, args.top_k, 0.55, query_embedding=q), repeats)
+        print(f"{n:>6} {t_old * 1000:>10.2f} {t_new * 1000:>10.2f} {t_old / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Offline end-to-end benchmark: ingest + query workloads through RagPipeline against
+latency/failure-injecting stand-ins for Pinecone, Cohere and Groq (see app/benchmark.py).
+
+    python scripts/bench_pipeline.py [--docs 200] [--queries 200] [--concurrency 8]
+                                     [--vector-ms 40,120] [--rerank-ms 150,400] [--llm-ms 400,1500]
+                                     [--vector-fail 0] [--rerank-fail 0.02] [--llm-fail 0.01]
+                                     [--out bench.json] [--compare baseline.json] [--tolerance 0.1]
+
+Latencies are "p50,p99" in milliseconds (lognormal between them; a single value is fixed).
+Writes the JSON baseline to --out (stdout without it). With --compare, lists the regressions
+against an earlier baseline and exits 1 when there are any.
+"""
+import argparse
+import json
+import os
+import sys
+
+os.environ.setdefault("CHUNK_MANIFEST", "0")  # no manifest file in the working tree
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app.benchmark import compare, run_benchmark  # noqa: E402
+
+
+def service(latency: str, failure_rate: float) -> dict:
+    p50, _, p99 = latency.partition(",")
+    return {"p50_ms": float(p50), "p99_ms": float(p99 or p50), "failure_rate": failure_rate}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=200)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--vector-ms", default="40,120")
+    ap.add_argument("--rerank-ms", default="150,400")
+    ap.add_argument("--llm-ms", default="400,1500")
+    ap.add_argument("--vector-fail", type=float, default=0.0)
+    ap.add_argument("--rerank-fail", type=float, default=0.0)
+    ap.add_argument("--llm-fail", type=float, default=0.0)
+    ap.add_argument("--caches", action="store_true", help="keep the answer and rerank caches on")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out")
+    ap.add_argument("--compare")
+    ap.add_argument("--tolerance", type=float, default=0.10)
+    args = ap.parse_args()
+
+    services = {
+        "vector": service(args.vector_ms, args.vector_fail),
+        "rerank": service(args.rerank_ms, args.rerank_fail),
+        "llm": service(args.llm_ms, args.llm_fail),
+    }
+    result = run_benchmark(args.docs, args.queries, args.concurrency, services, caches=args.caches, seed=args.seed)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        q, ing = result["query"], result["ingest"]
+        print(f"ingest: {ing['chunks']} chunks in {ing['seconds']:.1f}s ({ing['chunks_per_s']} chunks/s, "
+              f"{ing['errors']} errors)")
+        print(f"query:  {q['qps']} q/s at concurrency {q['concurrency']} ({q['errors']} errors, "
+              f"{q['rerank_fallbacks']} rerank fallbacks, {q['empty']} empty)")
+        print(f"{'stage':<14} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9}")
+        for stage, p in q["stages"].items():
+            print(f"{stage:<14} {p['p50_ms'] or 0:>9.1f} {p['p95_ms'] or 0:>9.1f} {p['p99_ms'] or 0:>9.1f}")
+        print(f"peak RSS: {result['peak_rss_mb']} MB -> {args.out}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), result, tolerance=args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.compare} (tolerance {args.tolerance:.0%})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Bulk-ingest a directory of PDF / text / Markdown files, resumably.
+
+    python scripts/bulk_ingest.py DOCS_DIR [--namespace default] [--workers 4] [--batch-chunks 64]
+                                  [--manifest .cache/ingest_manifest.sqlite]
+
+Re-running skips files already ingested (same size + mtime, or same content hash)
+and retries files that failed. Ctrl-C is safe: finished files are already recorded.
+A changed file only re-sends its changed chunks and deletes its stale ones
+(CHUNK_MANIFEST=0 re-sends every chunk).
+Uses PineconeRetriever (or the local store with VECTOR_BACKEND=local).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app.bulk_ingest import DEFAULT_SUFFIXES, IngestManifest, bulk_ingest, format_summary  # noqa: E402
+from app.chunk_manifest import ChunkManifest  # noqa: E402
+from app.chunking import make_chunker  # noqa: E402
+from app.config import settings  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("root")
+    ap.add_argument("--namespace", default=settings.pinecone_namespace)
+    ap.add_argument("--workers", type=int, default=settings.ingest_pdf_workers, help="extraction processes")
+    ap.add_argument("--batch-chunks", type=int, default=settings.ingest_batch_chunks, help="chunks per embed/upsert")
+    ap.add_argument("--manifest", default=".cache/ingest_manifest.sqlite")
+    ap.add_argument("--suffixes", default=",".join(DEFAULT_SUFFIXES))
+    args = ap.parse_args()
+
+    if settings.vector_backend == "local":
+        from app.retriever_local import LocalVectorRetriever
+        retriever = LocalVectorRetriever()
+    else:
+        from app.retriever_pine import PineconeRetriever
+        retriever = PineconeRetriever()
+    chunker = make_chunker(*retriever.tokenizer())
+    manifest = IngestManifest(args.manifest)
+    chunk_manifest = ChunkManifest(settings.chunk_manifest_path) if settings.chunk_manifest_enabled else None
+
+    last = [0.0]
+
+    def progress(ev):
+        if time.time() - last[0] >= 2:
+            last[0] = time.time()
+            print(f"  … {ev['files_done']} files, {ev['chunks']} chunks", flush=True)
+
+    summary = None
+    try:
+        summary = bulk_ingest(
+            args.root, retriever, manifest, chunker,
+            namespace=args.namespace,
+            workers=args.workers,
+            batch_chunks=args.batch_chunks,
+            suffixes=tuple(s.strip().lower() for s in args.suffixes.split(",") if s.strip()),
+            on_progress=progress,
+            chunk_manifest=chunk_manifest,
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted — finished files are recorded; re-run to resume.")
+        sys.exit(130)
+    finally:
+        manifest.close()
+        if chunk_manifest is not None:
+            chunk_manifest.close()
+    print(format_summary(summary))
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
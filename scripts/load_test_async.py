@@ -0,0 +1,66 @@
+"""
+Throughput of AsyncRagPipeline vs. concurrency, against latency-injecting fakes.
+
+    python scripts/load_test_async.py [--queries 64] [--levels 1,2,4,8,16]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from app.async_pipeline import AsyncRagPipeline  # noqa: E402
+from app.fakes import FakeLLM, FakeReranker, FakeRetriever  # noqa: E402
+from app.pipeline import RagPipeline  # noqa: E402
+
+
+def build_pipeline(args) -> RagPipeline:
+    pipe = RagPipeline(
+        retriever=FakeRetriever(latency_s=args.vector_ms / 1000),
+        llm=FakeLLM(latency_s=args.llm_ms / 1000),
+        reranker=FakeReranker(latency_s=args.rerank_ms / 1000),
+    )
+    pipe.answer_cache = None  # every query must do the full round trip
+    pipe.rerank_cache = None
+    for i in range(50):
+        pipe.ingest_document(f"Document {i} talks about topic {i % 7} and item {i}.", source=f"doc{i}")
+    return pipe
+
+
+async def run_level(pipe: RagPipeline, n_queries: int, concurrency: int) -> float:
+    apipe = AsyncRagPipeline(pipe, max_vector_queries=concurrency, max_reranks=concurrency,
+                             max_llm_calls=concurrency, embed_workers=2)
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            return await apipe.answer(f"what about topic {i % 7} item {i}")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_queries)))
+    elapsed = time.perf_counter() - t0
+    apipe.close()
+    return n_queries / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", type=int, default=64)
+    ap.add_argument("--levels", default="1,2,4,8,16")
+    ap.add_argument("--vector-ms", type=float, default=40)
+    ap.add_argument("--rerank-ms", type=float, default=150)
+    ap.add_argument("--llm-ms", type=float, default=400)
+    args = ap.parse_args()
+
+    pipe = build_pipeline(args)
+    base = None
+    print(f"{'concurrency':>11} {'qps':>8} {'scaling':>8}")
+    for level in [int(x) for x in args.levels.split(",")]:
+        qps = asyncio.run(run_level(pipe, args.queries, level))
+        base = base or qps
+        print(f"{level:>11} {qps:>8.2f} {qps / base:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Cold-start import report (python -X importtime) for the app's entry modules.
+
+    python scripts/startup_report.py [app.pipeline app.async_pipeline ...] [--top 15] [--budget-ms 1500]
+
+Each module is imported in a fresh interpreter. Prints total import time, the
+slowest imports (cumulative), and any heavy SDK that got imported eagerly.
+Exits 1 if a module is over budget or pulls in a heavy SDK.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# Must only be imported on first use (see app/lazy.py)
+HEAVY = ("torch", "sentence_transformers", "transformers", "pinecone", "groq", "cohere", "onnxruntime")
+
+
+def import_profile(module: str):
+    """[(self_us, cumulative_us, depth, name)] in import order, from a fresh interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cum_us), depth, name.strip()))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("modules", nargs="*", default=["app.pipeline", "app.async_pipeline"])
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--budget-ms", type=float, default=1500.0)
+    args = ap.parse_args()
+
+    failed = False
+    for module in args.modules:
+        rows = import_profile(module)
+        total_ms = sum(self_us for self_us, _, _, _ in rows) / 1000
+        names = {name.split(".")[0] for _, _, _, name in rows}
+        eager = sorted(names & set(HEAVY))
+        over = total_ms > args.budget_ms
+        failed |= over or bool(eager)
+
+        print(f"\n== import {module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms){'  OVER BUDGET' if over else ''}")
+        if eager:
+            print(f"   heavy SDKs imported eagerly: {', '.join(eager)}")
+        print(f"   {'cumulative':>10} {'self':>8}  module")
+        for self_us, cum_us, depth, name in sorted(rows, key=lambda r: -r[1])[: args.top]:
+            print(f"   {cum_us / 1000:>8.1f}ms {self_us / 1000:>6.1f}ms  {'  ' * depth}{name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,68 @@
 # streamlit_app.py
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+_RUN_T0 = time.perf_counter()  # rerun cost, shown at the bottom of the sidebar
+
 import streamlit as st
 from app import token_tracker
 from app.pipeline import RagPipeline
+from app.tracing import start_metrics_server
 
 # -------- Helpers --------
-def _extract_text_from_pdf(uploaded_file) -> str:
+def _ingest_pdf(uploaded_file):
     """
-    Extracts text from an uploaded PDF using PyPDF2 if available.
-    Falls back to a naive byte decode if PDF parsing lib is missing.
+    Stream an uploaded PDF through the pipeline (pages extracted in parallel, chunks
+    embedded and upserted in batches as they come) with a live progress bar.
     """
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(uploaded_file.getvalue())
+        path = tmp.name
+    bar = st.progress(0.0, text="Reading PDF…")
+    state = {"frac": 0.0, "pages": "", "chunks": ""}
+
+    def _progress(ev):
+        if ev["stage"] == "page":
+            total = ev.get("total_pages") or 0
+            state["pages"] = f"page {ev['pages_done']}/{total or '?'}"
+            if total:
+                state["frac"] = min(1.0, ev["pages_done"] / total)
+        else:
+            state["chunks"] = f"{ev['chunks_total']} chunks upserted (batch {ev['batch']})"
+        bar.progress(state["frac"], text=" · ".join(v for v in (state["pages"], state["chunks"]) if v))
+
     try:
-        import PyPDF2  # type: ignore
-        reader = PyPDF2.PdfReader(uploaded_file)
-        texts = []
-        for i, page in enumerate(reader.pages):
-            try:
-                texts.append(page.extract_text() or "")
-            except Exception:
-                texts.append("")
-        return "\n\n".join(texts).strip()
-    except Exception:
-        try:
-            data = uploaded_file.getvalue()
-            return data.decode(errors="ignore")
-        except Exception:
-            return ""
+        src_name = getattr(uploaded_file, "name", "uploaded.pdf")
+        return get_pipeline().ingest_pdf(path, source=src_name, title="", section="", on_progress=_progress)
+    finally:
+        bar.empty()
+        os.unlink(path)
+
+def _ingest_caption(stats) -> None:
+    """Show bulk-upsert throughput returned by ingest_document."""
+    if not stats:
+        return
+    sizes = ", ".join(f"{b['bytes'] / 1024:.0f} KB" for b in stats.get("batches", []))
+    diff = stats.get("diff")
+    changes = (f" · {diff['added']} added, {diff['changed']} changed, {diff['unchanged']} unchanged, "
+               f"{diff['deleted']} deleted") if diff else ""
+    st.caption(
+        f"{stats.get('chunks', 0)} chunks · {stats.get('chunks_per_s', 0):.1f} chunks/s · "
+        f"batches: {sizes or '—'}{changes}"
+    )
+
+def _degraded_caption(m) -> None:
+    """Say when the answer was produced in a degraded mode (rerank skipped, provider circuit open)."""
+    notes = []
+    if m.get("rerank_fallback"):
+        notes.append(f"rerank skipped ({m['rerank_fallback'].replace('_', ' ')}), sources in MMR order")
+    notes += [f"{role} circuit {state.replace('_', '-')}" for role, state in (m.get("breakers") or {}).items()
+              if state != "closed"]
+    if notes:
+        st.caption("⚠️ " + " · ".join(notes))
 
 # ---------------- Page config ----------------
 st.set_page_config(
@@ -32,19 +70,35 @@ st.set_page_config(
     layout="wide",
 )
 
-# ---------------- Centered loading message until pipeline is ready ----------------
-placeholder = st.empty()
-with placeholder.container():
-    st.markdown(
-        "<h2 style='text-align:center;'>⏳ Loading… please wait</h2>",
-        unsafe_allow_html=True
-    )
+# ---------------- Shared pipeline (one per server process) ----------------
+@st.cache_resource(show_spinner=False)
+def _pipeline_future() -> Future:
+    """
+    Build the pipeline once per server process and share it across sessions and reruns.
+    Construction + model warm-up run on a background thread, so the page renders at once
+    and only the first ingest/question waits if loading isn't finished yet.
+    """
+    def _build() -> RagPipeline:
+        start_metrics_server()  # Prometheus /metrics when METRICS_PORT is set
+        p = RagPipeline()
+        p.warmup()
+        return p
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-startup").submit(_build)
 
-# ---------------- Instantiate pipeline ----------------
-pipe = RagPipeline()
 
-# ---------------- Clear loading ----------------
-placeholder.empty()
+def get_pipeline() -> RagPipeline:
+    fut = _pipeline_future()
+    if not fut.done():
+        with st.spinner("⏳ Loading models… (first request only)"):
+            fut.exception()  # wait
+    if fut.exception() is not None:
+        _pipeline_future.clear()  # retry on the next rerun instead of caching the failure
+        st.error(f"Could not start the pipeline: {fut.exception()}")
+        st.stop()
+    return fut.result()
+
+
+_pipeline_future()  # kick off loading on the very first run
 
 # ---------------- Header ----------------
 st.markdown(
@@ -76,24 +130,28 @@ with st.sidebar:
     if ingest_btn:
         # PDF
         if pdf_file is not None:
-            with st.spinner("Reading PDF and chunking…"):
-                pdf_text = _extract_text_from_pdf(pdf_file)
-            if pdf_text.strip():
-                src_name = getattr(pdf_file, "name", "uploaded.pdf")
-                pipe.ingest_document(pdf_text, source=src_name, title="", section="")
-                st.success(f"Ingested from PDF: {src_name} ✅")
-            else:
+            src_name = getattr(pdf_file, "name", "uploaded.pdf")
+            try:
+                stats = _ingest_pdf(pdf_file)
+            except Exception as e:
+                stats = None
+                st.error(f"Could not read the PDF ({e}). Please check the file.")
+            if stats and stats.get("chunks"):
+                st.success(f"Ingested from PDF: {src_name} ({stats['pages']} pages) ✅")
+                _ingest_caption(stats)
+            elif stats is not None:
                 st.error("Could not extract any text from the PDF. Please check the file.")
 
         # Pasted text
         if text_to_index.strip():
-            pipe.ingest_document(
+            stats = get_pipeline().ingest_document(
                 text_to_index.strip(),
                 source="local-paste",
                 title="",
                 section=""
             )
             st.success("Ingested pasted text ✅")
+            _ingest_caption(stats)
 
         if not (pdf_file is not None or text_to_index.strip()):
             st.warning("Upload a PDF or paste some text to ingest.")
@@ -103,6 +161,7 @@ with st.sidebar:
     auto_expand_sources = st.checkbox("Auto-expand Sources", value=True)
     auto_expand_metrics = st.checkbox("Auto-expand Metrics", value=False)
     st.caption("Tip: keep Sources open while verifying grounding.")
+    rerun_slot = st.empty()
 
 # ---------------- Chat state ----------------
 if "chat_history" not in st.session_state:
@@ -130,6 +189,8 @@ for i, turn in enumerate(st.session_state.chat_history):
                 for s in turn["out"]["sources"]:
                     st.markdown(f"**[{s['n']}] {s.get('title') or s.get('source')}**")
                     small = f"{s.get('source','')} • {s.get('section','')} • pos {s.get('position')}"
+                    if s.get("page"):
+                        small += f" • p. {s['page']}"
                     st.caption(small)
                     st.code(s["snippet"])
             else:
@@ -141,14 +202,20 @@ for i, turn in enumerate(st.session_state.chat_history):
             m = turn["out"].get("metrics", {}) or {}
             tok = m.get("llm_tokens") or {}
             col1, col2, col3, col4, col5 = st.columns(5)
-            col1.metric("LLM latency", f"{m.get('llm_latency_s', 0):.2f}s")
-            col2.metric("Retrieve", f"{m.get('retrieve_s', 0):.2f}s")
-            col3.metric("Rerank", f"{m.get('rerank_s', 0):.2f}s")
+            col1.metric("LLM latency", f"{m.get('llm_latency_s', 0):.2f}s", f"TTFT {m.get('llm_ttft_s', 0):.2f}s", delta_color="off")
+            col2.metric("Retrieve", f"{m.get('retrieve_s', 0):.2f}s", f"embed {m.get('embed_s', 0) * 1000:.0f} ms", delta_color="off")
+            col3.metric("Rerank", f"{m.get('rerank_s', 0):.2f}s", f"MMR {m.get('mmr_s', 0) * 1000:.0f} ms", delta_color="off")
             col4.metric("Model", m.get("model", "—"))
+            if m.get("cache_hit"):
+                st.caption(
+                    f"⚡ Answered from cache ({m['cache_hit']}, similarity {m.get('cache_similarity', 0):.3f}) "
+                    f"— saved ~{m.get('latency_saved_s', 0):.2f}s"
+                )
+            _degraded_caption(m)
 
             total_used = tok.get("total_tokens")
             if total_used:
-                left, used, limit = token_tracker.add_tokens(int(total_used))
+                left, used, limit = token_tracker.remaining()  # already counted when it was answered
                 col5.metric("Tokens left (today)", f"{left:,}", f"-{used:,}/{limit:,}")
                 st.caption(
                     f"Tokens — Prompt: {tok.get('prompt_tokens','?')}, "
@@ -166,10 +233,20 @@ if q and q.strip():
         st.write(q)
 
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            out = pipe.answer(q)
+        events = get_pipeline().answer_stream(q)
+        with st.spinner("Searching your documents..."):
+            first = next(events)  # sources + retrieval timings arrive before any token
+        final = {}
 
-        st.write(out["answer"])
+        def _tokens():
+            for ev in events:
+                if ev["type"] == "token":
+                    yield ev["text"]
+                elif ev["type"] == "done":
+                    final.update(ev)
+
+        st.write_stream(_tokens())
+        out = final or {"answer": "", "sources": first.get("sources", []), "metrics": first.get("metrics", {})}
 
         # Sources expander
         src_open = auto_expand_sources
@@ -178,6 +255,8 @@ if q and q.strip():
                 for s in out["sources"]:
                     st.markdown(f"**[{s['n']}] {s.get('title') or s.get('source')}**")
                     small = f"{s.get('source','')} • {s.get('section','')} • pos {s.get('position')}"
+                    if s.get("page"):
+                        small += f" • p. {s['page']}"
                     st.caption(small)
                     st.code(s["snippet"])
             else:
@@ -189,14 +268,20 @@ if q and q.strip():
             m = out.get("metrics", {}) or {}
             tok = m.get("llm_tokens") or {}
             col1, col2, col3, col4, col5 = st.columns(5)
-            col1.metric("LLM latency", f"{m.get('llm_latency_s', 0):.2f}s")
-            col2.metric("Retrieve", f"{m.get('retrieve_s', 0):.2f}s")
-            col3.metric("Rerank", f"{m.get('rerank_s', 0):.2f}s")
+            col1.metric("LLM latency", f"{m.get('llm_latency_s', 0):.2f}s", f"TTFT {m.get('llm_ttft_s', 0):.2f}s", delta_color="off")
+            col2.metric("Retrieve", f"{m.get('retrieve_s', 0):.2f}s", f"embed {m.get('embed_s', 0) * 1000:.0f} ms", delta_color="off")
+            col3.metric("Rerank", f"{m.get('rerank_s', 0):.2f}s", f"MMR {m.get('mmr_s', 0) * 1000:.0f} ms", delta_color="off")
             col4.metric("Model", m.get("model", "—"))
+            if m.get("cache_hit"):
+                st.caption(
+                    f"⚡ Answered from cache ({m['cache_hit']}, similarity {m.get('cache_similarity', 0):.3f}) "
+                    f"— saved ~{m.get('latency_saved_s', 0):.2f}s"
+                )
+            _degraded_caption(m)
 
             total_used = tok.get("total_tokens")
             if total_used:
-                left, used, limit = token_tracker.add_tokens(int(total_used))
+                left, used, limit = token_tracker.add_tokens(int(total_used), m.get("response_id"))
                 col5.metric("Tokens left (today)", f"{left:,}", f"-{used:,}/{limit:,}")
                 st.caption(
                     f"Tokens — Prompt: {tok.get('prompt_tokens','?')}, "
@@ -211,3 +296,12 @@ if q and q.strip():
     st.session_state.chat_history.append(
         {"query": q, "answer": out["answer"], "out": out}
     )
+
+# ---------------- Rerun cost ----------------
+_rerun_ms = (time.perf_counter() - _RUN_T0) * 1000
+st.session_state.setdefault("rerun_ms", deque(maxlen=50)).append(_rerun_ms)
+_hist = sorted(st.session_state.rerun_ms)
+rerun_slot.caption(
+    f"⏱️ Rerun: {_rerun_ms:.0f} ms (median {_hist[len(_hist) // 2]:.0f} ms) · "
+    f"models {'ready' if _pipeline_future().done() else 'loading…'}"
+)
@@ -3,3 +3,10 @@ import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+# Keep tests hermetic: no on-disk caches in the working tree
+os.environ["EMBEDDING_CACHE"] = "0"
+os.environ["PINECONE_INDEX_CHECK_TTL_S"] = "0"
+os.environ["CHUNK_MANIFEST"] = "0"
+os.environ["HYBRID_SEARCH"] = "0"
+os.environ["DOC_STORE"] = "0"
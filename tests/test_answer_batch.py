@@ -0,0 +1,94 @@
+# tests/test_answer_batch.py
+import threading
+import time
+
+import pytest
+
+from app.fakes import FakeLLM, FakeReranker, FakeRetriever
+from app.pipeline import RagPipeline
+from app.rate_limit import RateLimiter
+
+CAPITALS = ["Paris is the capital of France.", "Berlin is the capital of Germany.", "Rome is the capital of Italy."]
+
+
+class CountingRetriever(FakeRetriever):
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.encodes = []
+
+    def embed_array(self, texts, batch_size=None):
+        self.encodes.append(len(texts))
+        return super().embed_array(texts, batch_size)
+
+
+class PeakLLM(FakeLLM):
+    """FakeLLM that records the most calls it saw in flight at once; fails on 'explode'."""
+
+    def __init__(self, latency_s):
+        super().__init__(latency_s=latency_s)
+        self._lock = threading.Lock()
+        self.active = self.peak = 0
+
+    def generate_with_meta(self, messages, temperature=0.2, max_tokens=600):
+        if "explode" in messages[-1]["content"]:
+            raise RuntimeError("provider down")
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().generate_with_meta(messages, temperature, max_tokens)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _pipe(llm=None):
+    pipe = RagPipeline(retriever=CountingRetriever(), llm=llm or FakeLLM(), reranker=FakeReranker())
+    pipe.answer_cache = None
+    for i, text in enumerate(CAPITALS):
+        pipe.ingest_document(text, source=f"doc{i}")
+    pipe.retriever.encodes.clear()
+    return pipe
+
+
+def test_batch_matches_answer_in_input_order():
+    pipe = _pipe()
+    queries = ["capital of Italy", "capital of France", "capital of Germany", "capital of France"]
+    outs = pipe.answer_batch(queries)
+    assert pipe.retriever.encodes == [3]  # one batched encode; the repeated query is answered once
+
+    for q, out in zip(queries, outs):
+        ref = pipe.answer(q)
+        assert out["answer"] == ref["answer"] and out["sources"] == ref["sources"]
+        assert set(out["metrics"]) == set(ref["metrics"]) and out["metrics"]["rerank_used"] is True
+    assert outs[1] == outs[3] and outs[1] is not outs[3]
+    outs[1]["metrics"]["tag"] = "first"
+    assert "tag" not in outs[3]["metrics"]
+
+
+def test_batch_overlaps_llm_calls_up_to_limit():
+    llm = PeakLLM(latency_s=0.1)
+    pipe = _pipe(llm)
+    t0 = time.perf_counter()
+    assert len(pipe.answer_batch([f"capital of France {i}" for i in range(8)], max_llm_calls=8)) == 8
+    assert time.perf_counter() - t0 < 0.1 * 8 / 2  # far below the serial 0.8 s
+
+    llm.peak = 0
+    pipe.answer_batch([f"capital of Italy {i}" for i in range(8)], max_llm_calls=2)
+    assert llm.peak == 2
+
+
+def test_batch_failures():
+    pipe = _pipe(PeakLLM(latency_s=0.0))
+    outs = pipe.answer_batch(["capital of France", "explode the capital"], return_exceptions=True)
+    assert outs[0]["answer"] and isinstance(outs[1], RuntimeError)
+    with pytest.raises(RuntimeError):
+        pipe.answer_batch(["explode the capital"])
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(per_minute=1200, burst=2)  # one call per 50 ms after a burst of two
+    t0 = time.perf_counter()
+    for _ in range(5):
+        limiter.acquire()
+    assert 0.14 <= time.perf_counter() - t0 < 0.5
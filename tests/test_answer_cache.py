@@ -0,0 +1,110 @@
+# tests/test_answer_cache.py
+import time
+from app.answer_cache import AnswerCache, normalize_query
+from app.pipeline import RagPipeline
+
+def test_exact_and_semantic_layers():
+    cache = AnswerCache(max_items=8, ttl_s=60, similarity=0.9)
+    cache.store("ns", "What is the capital of France?", {"answer": "Paris"}, query_vec=[1.0, 0.0], cost_s=2.0)
+
+    exact = cache.lookup("ns", "  what is the capital of france ")
+    assert exact["kind"] == "exact" and exact["result"]["answer"] == "Paris"
+
+    near = cache.lookup("ns", "France's capital city?", query_vec_fn=lambda: [0.99, 0.05])
+    assert near["kind"] == "semantic" and near["similarity"] > 0.9 and near["cost_s"] == 2.0
+
+    assert cache.lookup("ns", "Unrelated?", query_vec_fn=lambda: [0.0, 1.0]) is None
+    assert cache.lookup("other-ns", "What is the capital of France?") is None
+
+def test_ttl_lru_and_invalidate():
+    cache = AnswerCache(max_items=2, ttl_s=60, similarity=0.9)
+    for q in ("a", "b", "c"):
+        cache.store("ns", q, {"answer": q})
+    assert cache.lookup("ns", "a") is None  # LRU evicted
+    assert cache.invalidate("ns") == 2
+    assert cache.lookup("ns", "b") is None
+
+    short = AnswerCache(ttl_s=0.01)
+    short.store("ns", "q", {"answer": "x"})
+    time.sleep(0.02)
+    assert short.lookup("ns", "q") is None
+
+def test_normalize_query():
+    assert normalize_query("  Hello   World?! ") == "hello world"
+
+def test_pipeline_cache_hit_and_ingest_invalidation(monkeypatch):
+    calls = {"llm": 0}
+    class DummyRetriever:
+        def embed(self, texts): return [[1.0, 0.0] for _ in texts]
+        def retrieve(self, query, top_k):
+            return [{"text": "Paris is the capital of France.", "metadata": {"source": "doc1", "position": 0}}]
+        def upsert_chunks(self, chunks, namespace=None): return {"chunks": len(chunks)}
+    class DummyLLM:
+        def generate(self, messages, temperature=0.2, max_tokens=600):
+            calls["llm"] += 1
+            return "Paris [1]."
+    class FailingCohere:
+        def rerank(self, **k): raise RuntimeError("offline")
+
+    monkeypatch.setattr("app.pipeline.PineconeRetriever", lambda: DummyRetriever())
+    monkeypatch.setattr("app.pipeline.GroqLLM", lambda: DummyLLM())
+    monkeypatch.setattr("app.pipeline.cohere.Client", lambda api_key, **kw: FailingCohere())
+
+    pipe = RagPipeline()
+    first = pipe.answer("What is France's capital?")
+    assert first["metrics"]["cache_hit"] is None
+    again = pipe.answer("what is france's capital")
+    assert again["metrics"]["cache_hit"] == "exact"
+    assert again["answer"] == first["answer"] and calls["llm"] == 1
+    near = pipe.answer("Capital of France?")
+    assert near["metrics"]["cache_hit"] == "semantic"
+    assert near["metrics"]["latency_saved_s"] >= 0.0
+
+    pipe.ingest_document("New facts about France.", source="doc2")
+    assert pipe.answer("What is France's capital?")["metrics"]["cache_hit"] is None
+    assert calls["llm"] == 2
+
+def test_cache_is_scoped_to_the_request_namespace(monkeypatch, tmp_path):
+    from app.fakes import FakeLLM, FakeReranker, hash_embed
+    from app.retriever_local import LocalVectorRetriever
+
+    class HashModel:
+        def encode(self, texts, normalize_embeddings=True):
+            return hash_embed(list(texts))
+
+    monkeypatch.setattr("app.retriever_pine.SentenceTransformer", lambda name: HashModel())
+    pipe = RagPipeline(retriever=LocalVectorRetriever(root=tmp_path), llm=FakeLLM(), reranker=FakeReranker())
+    pipe.ingest_document("Paris is the capital of France.", source="paris", namespace="a")
+    pipe.ingest_document("Lyon was the capital of France under Rome.", source="lyon", namespace="b")
+
+    first = pipe.answer("capital of France", namespace="a")
+    other = pipe.answer("capital of France", namespace="b")
+    assert other["metrics"]["cache_hit"] is None
+    assert [s["source"] for s in first["sources"]] == ["paris"] and [s["source"] for s in other["sources"]] == ["lyon"]
+    assert pipe.answer("capital of France", namespace="a")["metrics"]["cache_hit"] == "exact"
+
+    pipe.ingest_document("Rome is the capital of Italy.", source="rome", namespace="b")
+    assert pipe.answer("capital of France", namespace="a")["metrics"]["cache_hit"] == "exact"
+    assert pipe.answer("capital of France", namespace="b")["metrics"]["cache_hit"] is None
+
+def test_store_drops_answers_from_before_an_invalidation():
+    cache = AnswerCache()
+    gen = cache.generation("ns")
+    cache.invalidate("ns")  # an ingest finished while the answer was being computed
+    assert cache.store("ns", "q", {"answer": "old"}, generation=gen) is False
+    assert cache.lookup("ns", "q") is None
+    assert cache.store("ns", "q", {"answer": "new"}, generation=cache.generation("ns")) is True
+    assert cache.generation("other") == 0
+
+def test_answer_racing_an_ingest_is_not_cached():
+    from app.fakes import FakeLLM, FakeReranker, FakeRetriever
+
+    class IngestingLLM(FakeLLM):
+        def generate_with_meta(self, messages, temperature=0.2, max_tokens=600):
+            pipe.ingest_document("Lyon is a large city in France.", source="lyon")
+            return super().generate_with_meta(messages, temperature, max_tokens)
+
+    pipe = RagPipeline(retriever=FakeRetriever(), llm=IngestingLLM(), reranker=FakeReranker())
+    pipe.ingest_document("Paris is the capital of France.", source="paris")
+    pipe.answer("capital of France")
+    assert pipe.answer("capital of France")["metrics"]["cache_hit"] is None
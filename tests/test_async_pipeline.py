@@ -0,0 +1,50 @@
+# tests/test_async_pipeline.py
+import asyncio
+import time
+from app.async_pipeline import AsyncRagPipeline
+from app.fakes import FakeLLM, FakeReranker, FakeRetriever
+from app.pipeline import RagPipeline
+
+def _pipe(llm_latency=0.0):
+    pipe = RagPipeline(retriever=FakeRetriever(), llm=FakeLLM(latency_s=llm_latency), reranker=FakeReranker())
+    pipe.answer_cache = None
+    for i, text in enumerate(["Paris is the capital of France.", "Berlin is the capital of Germany.",
+                              "Rome is the capital of Italy."]):
+        pipe.ingest_document(text, source=f"doc{i}")
+    return pipe
+
+def test_async_answer_matches_sync():
+    pipe = _pipe()
+    sync_out = pipe.answer("capital of France")
+    async_out = asyncio.run(AsyncRagPipeline(pipe).answer("capital of France"))
+    assert async_out["answer"] == sync_out["answer"]
+    assert async_out["sources"] == sync_out["sources"]
+    assert set(async_out["metrics"]) == set(sync_out["metrics"])
+    assert async_out["metrics"]["rerank_used"] is True
+
+def test_async_queries_overlap_up_to_llm_limit():
+    pipe = _pipe(llm_latency=0.2)
+    apipe = AsyncRagPipeline(pipe, max_llm_calls=8)
+
+    async def run():
+        return await asyncio.gather(*(apipe.answer(f"capital {i}") for i in range(8)))
+
+    t0 = time.perf_counter()
+    outs = asyncio.run(run())
+    assert len(outs) == 8
+    assert time.perf_counter() - t0 < 0.2 * 8 / 2  # far below the serial 1.6 s
+
+def test_async_ingest():
+    pipe = _pipe()
+    stats = asyncio.run(AsyncRagPipeline(pipe).ingest_document("Madrid is the capital of Spain.", source="es"))
+    assert stats["chunks"] == 1
+    assert pipe.answer("capital of Spain")["sources"][0]["source"] == "es"
+
+def test_one_instance_serves_several_event_loops():
+    apipe = AsyncRagPipeline(_pipe(llm_latency=0.02), max_llm_calls=1)
+
+    async def run():
+        return await asyncio.gather(*(apipe.answer(f"capital {i}") for i in range(3)))
+
+    for _ in range(2):  # the second loop would hit semaphores bound to the first one
+        assert all(out["answer"] for out in asyncio.run(run()))
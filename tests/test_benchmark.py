@@ -0,0 +1,65 @@
+# tests/test_benchmark.py
+import json
+
+import numpy as np
+import pytest
+
+from app.benchmark import compare, run_benchmark, synthetic_corpus
+from app.fakes import FakeReranker, FakeServiceError, Latency
+
+
+def test_latency_distribution_hits_its_percentiles():
+    lat = Latency(0.010, 0.050, seed=3)
+    samples = np.array([lat.sample() for _ in range(20000)])
+    assert np.percentile(samples, 50) == pytest.approx(0.010, rel=0.05)
+    assert np.percentile(samples, 99) == pytest.approx(0.050, rel=0.15)
+    assert Latency(0.02).sample() == 0.02
+
+
+def test_failure_rate_is_injected():
+    rr = FakeReranker(failure_rate=0.3, seed=1)
+    failures = 0
+    for _ in range(1000):
+        try:
+            rr.rerank("q", ["a", "b"], 1)
+        except FakeServiceError:
+            failures += 1
+    assert 250 < failures < 350
+
+
+def test_corpus_is_deterministic():
+    assert synthetic_corpus(5, seed=2) == synthetic_corpus(5, seed=2)
+    assert synthetic_corpus(5, seed=2) != synthetic_corpus(5, seed=3)
+
+
+def test_benchmark_report_and_compare():
+    services = {"vector": {"p50_ms": 1, "p99_ms": 3}, "rerank": {"p50_ms": 1, "failure_rate": 0.5},
+                "llm": {"p50_ms": 2, "failure_rate": 0.2, "retries": 0}}
+    report = run_benchmark(docs=8, queries=30, concurrency=4, services=services)
+    json.dumps(report)  # machine-readable as is
+
+    assert report["ingest"]["docs"] == 8 and report["ingest"]["chunks"] >= 8 and report["ingest"]["chunks_per_s"] > 0
+    q = report["query"]
+    assert q["queries"] == 30 and q["qps"] > 0 and 0 < q["errors"] < 30 and q["rerank_fallbacks"] > 0
+    assert set(q["stages"]) == {"embed_s", "retrieve_s", "mmr_s", "rerank_s", "context_s", "llm_latency_s", "total_s"}
+    assert q["stages"]["total_s"]["p99_ms"] >= q["stages"]["total_s"]["p50_ms"] > 0
+    assert report["peak_rss_mb"] is None or report["peak_rss_mb"] > 0
+
+    assert compare(report, report) == []
+    slower = json.loads(json.dumps(report))
+    slower["query"]["qps"] = q["qps"] / 2
+    slower["query"]["stages"]["total_s"]["p95_ms"] = q["stages"]["total_s"]["p95_ms"] * 2 + 5
+    regressions = compare(report, slower)
+    assert len(regressions) == 2 and regressions[0].startswith("query.qps")
+
+
+def test_repeated_runs_do_not_share_a_chunk_manifest(monkeypatch, tmp_path):
+    import dataclasses
+    import app.pipeline as pipeline_mod
+    path = tmp_path / "chunk_manifest.sqlite"
+    monkeypatch.setattr(pipeline_mod, "settings", dataclasses.replace(
+        pipeline_mod.settings, chunk_manifest_enabled=True, chunk_manifest_path=str(path)))
+    first, second = (run_benchmark(docs=5, queries=5, concurrency=1) for _ in range(2))
+    assert first["ingest"]["chunks"] == second["ingest"]["chunks"] > 0
+    assert first["query"]["empty"] == second["query"]["empty"] == 0
+    assert not path.exists()
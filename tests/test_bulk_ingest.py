@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from app.bulk_ingest import IngestManifest, bulk_ingest, format_summary
+from app.chunking import StreamingChunker
+from app.fakes import FakeRetriever
+
+
+def _corpus(root, n=6):
+    (root / "sub").mkdir(parents=True)
+    for i in range(n):
+        folder = root / "sub" if i % 2 else root
+        (folder / f"doc{i}.txt").write_text(" ".join(f"doc{i} word{j}." for j in range(120)))
+    (root / "notes.md").write_text("# Notes\n\nShort markdown file about pumps.")
+    (root / "broken.pdf").write_bytes(b"not a pdf")
+    (root / "ignored.bin").write_bytes(b"\x00\x01")
+    (root / ".hidden").mkdir()
+    (root / ".hidden" / "secret.txt").write_text("never ingested")
+
+
+def _run(root, retriever, manifest, **kw):
+    return bulk_ingest(root, retriever, manifest, StreamingChunker(max_tokens=64, overlap_tokens=4),
+                       namespace="ns", workers=1, batch_chunks=8, **kw)
+
+
+def test_ingests_then_skips_and_reingests_changed(tmp_path):
+    root = tmp_path / "docs"
+    _corpus(root)
+    manifest = IngestManifest(tmp_path / "manifest.sqlite")
+    r = FakeRetriever()
+
+    first = _run(root, r, manifest)
+    assert (first["files"], first["ingested"], first["failed"]) == (8, 7, 1)
+    assert first["errors"][0]["path"] == "broken.pdf"
+    assert first["chunks"] == len(r._ids) > 7
+    assert {md["source"] for md in r._meta} >= {"doc0.txt", "sub/doc1.txt", "notes.md"}
+    assert "throughput" in format_summary(first)
+
+    second = _run(root, r, manifest)
+    assert (second["skipped"], second["ingested"], second["failed"]) == (7, 0, 1)  # the error is retried
+
+    (root / "doc0.txt").write_text("completely new content about valves.")
+    os.utime(root / "doc2.txt")  # touched, same bytes -> hashed, not re-embedded
+    third = _run(root, r, manifest)
+    assert (third["ingested"], third["unchanged"], third["chunks"]) == (1, 1, 1)
+    assert manifest.get("ns", "doc2.txt")["status"] == "done"
+
+
+def test_interrupted_run_resumes(tmp_path):
+    root = tmp_path / "docs"
+    _corpus(root, n=10)
+    manifest = IngestManifest(tmp_path / "manifest.sqlite")
+
+    class Interrupting(FakeRetriever):
+        calls = 0
+
+        def upsert_vectors(self, vectors, namespace=None):
+            Interrupting.calls += 1
+            if Interrupting.calls == 4:
+                raise KeyboardInterrupt
+            return super().upsert_vectors(vectors, namespace)
+
+    with pytest.raises(KeyboardInterrupt):
+        _run(root, Interrupting(), manifest)
+    done_before = [p for p in (f"doc{i}.txt" for i in range(10)) if (manifest.get("ns", p) or {}).get("status") == "done"]
+    assert 0 < len(done_before) < 10
+
+    resumed = _run(root, FakeRetriever(), manifest)
+    assert resumed["skipped"] >= len(done_before)
+    assert resumed["ingested"] + resumed["skipped"] == 11  # 10 docs + notes.md
+
+
+def test_process_pool_extraction(tmp_path):
+    root = tmp_path / "docs"
+    _corpus(root)
+    summary = bulk_ingest(root, FakeRetriever(), IngestManifest(tmp_path / "m.sqlite"),
+                          StreamingChunker(max_tokens=64), namespace="ns", workers=2, batch_chunks=8)
+    assert (summary["ingested"], summary["failed"]) == (7, 1)
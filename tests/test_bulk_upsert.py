@@ -0,0 +1,46 @@
+# tests/test_bulk_upsert.py
+from app.retriever_pine import PineconeRetriever, split_upsert_batches
+
+class RecordingIndex:
+    def __init__(self): self.calls = []
+    def upsert(self, vectors, namespace):
+        self.calls.append((len(vectors), namespace))
+        return {"upserted_count": len(vectors)}
+
+class DummyPC:
+    def __init__(self, index): self._index = index
+    def list_indexes(self): return {"indexes": [{"name": "rag-mini"}]}
+    def create_index(self, **k): return True
+    def Index(self, name): return self._index
+
+class CountingEmbed:
+    def __init__(self): self.calls = 0
+    def encode(self, texts, normalize_embeddings=True):
+        self.calls += 1
+        return [[0.1] * 384 for _ in texts]
+
+def test_split_upsert_batches_respects_count_and_bytes():
+    vecs = [{"id": f"d:{i}", "values": [0.5] * 8, "metadata": {"text": "x" * 100}} for i in range(10)]
+    by_count = split_upsert_batches(vecs, max_count=3, max_bytes=10**9)
+    assert [len(b) for b, _ in by_count] == [3, 3, 3, 1]
+    one = by_count[0][1] // 3
+    by_bytes = split_upsert_batches(vecs, max_count=100, max_bytes=one * 2 + 1)
+    assert all(len(b) <= 2 for b, _ in by_bytes)
+    assert sum(len(b) for b, _ in by_bytes) == 10
+
+def test_upsert_chunks_batches_embedding_and_upserts(monkeypatch):
+    index = RecordingIndex()
+    embed = CountingEmbed()
+    monkeypatch.setattr("app.retriever_pine.Pinecone", lambda api_key: DummyPC(index))
+    monkeypatch.setattr("app.retriever_pine.SentenceTransformer", lambda name: embed)
+
+    r = PineconeRetriever()
+    chunks = [{"text": f"chunk {i}", "metadata": {"source": "doc", "position": i}} for i in range(250)]
+    stats = r.upsert_chunks(chunks, namespace="ns")
+
+    assert stats["chunks"] == 250
+    assert embed.calls == 4  # ceil(250 / 64) mini-batches, not one call per chunk
+    assert sum(n for n, _ in index.calls) == 250
+    assert all(ns == "ns" for _, ns in index.calls)
+    assert len(stats["batches"]) == len(index.calls) >= 3
+    assert all(b["bytes"] > 0 for b in stats["batches"])
@@ -0,0 +1,132 @@
+import dataclasses
+
+import pytest
+
+from app import pipeline as pipeline_mod
+from app.bulk_ingest import IngestManifest, bulk_ingest, format_summary
+from app.chunk_manifest import ChunkManifest, SourceDiff
+from app.chunking import StreamingChunker
+from app.fakes import FakeLLM, FakeReranker, FakeRetriever
+from app.ingest import stream_ingest
+from app.pipeline import RagPipeline
+
+
+def _pages(n, edit=None):
+    # one sentence per line so chunk boundaries snap to sentence ends and resync after an edit
+    pages = []
+    for p in range(1, n + 1):
+        sentences = [f"Page {p} sentence {i} talks about pump {p * 100 + i}." for i in range(12)]
+        if p == edit:
+            sentences[5] = "This sentence was rewritten during review."
+        pages.append((p, " ".join(sentences)))
+    return pages
+
+
+def _chunker():
+    return StreamingChunker(max_tokens=48, overlap_tokens=6)
+
+
+def test_reingest_sends_only_changed_chunks_and_deletes_the_tail(tmp_path):
+    manifest = ChunkManifest(tmp_path / "chunks.sqlite")
+    r = FakeRetriever()
+
+    def ingest(pages):
+        return stream_ingest(r, pages, {"source": "manual.pdf"}, namespace="ns", chunker=_chunker(),
+                             batch_chunks=8, diff=SourceDiff(manifest, "ns", "manual.pdf"))
+
+    first = ingest(_pages(10))
+    total = first["diff"]["added"]
+    assert first["chunks"] == total == len(r._ids) > 10
+    assert first["diff"] == {"added": total, "changed": 0, "unchanged": 0, "deleted": 0}
+
+    again = ingest(_pages(10))
+    assert again["chunks"] == 0 and again["diff"]["unchanged"] == total
+
+    edited = ingest(_pages(10, edit=4))
+    assert 0 < edited["diff"]["changed"] <= 3
+    assert edited["chunks"] == edited["diff"]["changed"] + edited["diff"]["added"]
+
+    shorter = ingest(_pages(6))  # also reverts the page 4 edit
+    d = shorter["diff"]
+    assert d["deleted"] > 0 and shorter["chunks"] == d["changed"] + d["added"] < d["unchanged"]
+    assert len(r._ids) == d["unchanged"] + d["changed"] + d["added"]
+    assert max(md["page_end"] for md in r._meta) == 6
+
+
+def test_failed_ingest_leaves_the_manifest_untouched(tmp_path):
+    manifest = ChunkManifest(tmp_path / "chunks.sqlite")
+
+    class Failing(FakeRetriever):
+        def upsert_vectors(self, vectors, namespace=None):
+            raise RuntimeError("index unavailable")
+
+    diff = SourceDiff(manifest, "ns", "doc")
+    with pytest.raises(RuntimeError):
+        stream_ingest(Failing(), _pages(3), {"source": "doc"}, namespace="ns", chunker=_chunker(), diff=diff)
+    assert manifest.load("ns", "doc") == {}
+
+
+def test_pipeline_ingest_document_reports_the_diff(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline_mod, "settings", dataclasses.replace(
+        pipeline_mod.settings, chunk_manifest_enabled=True, chunk_manifest_path=str(tmp_path / "chunks.sqlite")))
+    pipe = RagPipeline(retriever=FakeRetriever(), llm=FakeLLM(), reranker=FakeReranker())
+    pipe._chunker = _chunker()
+    text = " ".join(t for _, t in _pages(5))
+
+    first = pipe.ingest_document(text, source="notes")
+    second = pipe.ingest_document(text[: len(text) // 2], source="notes")
+    assert first["diff"]["added"] == first["chunks"]
+    assert second["diff"]["deleted"] > 0
+    assert len(pipe.retriever._ids) == second["diff"]["unchanged"] + second["diff"]["changed"] + second["diff"]["added"]
+
+
+def test_new_store_or_model_invalidates_the_manifest(tmp_path, monkeypatch):
+    import shutil
+
+    import app.retriever_pine as rp
+    from app.fakes import hash_embed
+    from app.retriever_local import LocalVectorRetriever
+
+    class HashModel:
+        def encode(self, texts, normalize_embeddings=True):
+            return hash_embed(list(texts))
+
+    monkeypatch.setattr(rp, "SentenceTransformer", lambda name: HashModel())
+    monkeypatch.setattr(pipeline_mod, "settings", dataclasses.replace(
+        pipeline_mod.settings, chunk_manifest_enabled=True, chunk_manifest_path=str(tmp_path / "chunks.sqlite")))
+    text = " ".join(t for _, t in _pages(3))
+
+    def ingest(root):
+        pipe = RagPipeline(retriever=LocalVectorRetriever(root=root), llm=FakeLLM(), reranker=FakeReranker())
+        pipe._chunker = _chunker()
+        return pipe.ingest_document(text, source="notes", namespace="ns")
+
+    first = ingest(tmp_path / "store")
+    assert ingest(tmp_path / "store")["chunks"] == 0  # same store, same content
+    assert ingest(tmp_path / "other")["chunks"] == first["chunks"]  # another store starts empty
+    shutil.rmtree(tmp_path / "store")
+    assert ingest(tmp_path / "store")["chunks"] == first["chunks"]  # wiped store
+    monkeypatch.setattr(rp, "settings", dataclasses.replace(rp.settings, embedding_model_name="other-model"))
+    assert ingest(tmp_path / "store")["chunks"] == first["chunks"]  # vectors from another model
+
+
+def test_bulk_ingest_with_chunk_manifest(tmp_path):
+    root = tmp_path / "docs"
+    root.mkdir()
+    doc = root / "guide.txt"
+    doc.write_text(" ".join(t for _, t in _pages(8)))
+    manifest = IngestManifest(tmp_path / "files.sqlite")
+    chunks = ChunkManifest(tmp_path / "chunks.sqlite")
+    r = FakeRetriever()
+
+    def run():
+        return bulk_ingest(root, r, manifest, _chunker(), namespace="ns", workers=1, batch_chunks=8,
+                           chunk_manifest=chunks)
+
+    first = run()
+    doc.write_text(" ".join(t for _, t in _pages(8, edit=2)))
+    second = run()
+    assert first["chunk_diff"]["added"] == first["chunks"] == len(r._ids)
+    assert 0 < second["chunks"] == second["chunk_diff"]["changed"] < first["chunks"] // 3
+    assert manifest.get("ns", "guide.txt")["chunks"] == len(r._ids)
+    assert "chunk diff" in format_summary(second)
@@ -0,0 +1,67 @@
+import dataclasses
+
+import pytest
+
+from app import chunking
+from app.chunking import RegexTokenizer, StreamingChunker, chunk_text, make_chunker
+
+TEXT = " ".join(
+    f"Sentence {i} talks about pumps and valves in section {i % 7}{'!' if i % 5 == 0 else '.'}"
+    for i in range(400)
+)
+
+
+def _check_offsets(text, chunks):
+    for c in chunks:
+        md = c["metadata"]
+        assert c["text"] == text[md["start_char"]:md["end_char"]]
+        assert md["char_count"] == len(c["text"])
+    assert chunks[0]["metadata"]["start_char"] == 0
+    assert chunks[-1]["metadata"]["end_char"] == len(text)
+    # consecutive chunks overlap, so no text is skipped
+    assert all(b["metadata"]["start_char"] < a["metadata"]["end_char"] for a, b in zip(chunks, chunks[1:]))
+
+
+def test_token_windows_and_offsets():
+    tok = RegexTokenizer()
+    chunks = list(StreamingChunker(tok, max_tokens=50, overlap_tokens=5, snap_sentences=False).chunks([(None, TEXT)]))
+    _check_offsets(TEXT, chunks)
+    counts = [len(tok([c["text"]])["offset_mapping"][0]) for c in chunks]
+    assert counts[:-1] == [50] * (len(chunks) - 1) and counts[-1] <= 50
+    assert [c["metadata"]["token_count"] for c in chunks] == counts
+
+
+def test_block_size_does_not_change_chunks():
+    big = list(StreamingChunker(max_tokens=64, overlap_tokens=8).chunks([(None, TEXT)]))
+    small = list(StreamingChunker(max_tokens=64, overlap_tokens=8, block_chars=300, batch_blocks=2).chunks([(None, TEXT)]))
+    assert [c["text"] for c in big] == [c["text"] for c in small]
+
+
+def test_snaps_to_sentence_ends():
+    chunks = list(StreamingChunker(max_tokens=50, overlap_tokens=5, snap_sentences=True).chunks([(None, TEXT)]))
+    _check_offsets(TEXT, chunks)
+    assert all(c["text"][-1] in ".!" for c in chunks)
+    assert all(c["metadata"]["token_count"] >= 25 for c in chunks[:-1])
+
+
+def test_real_fast_tokenizer_sizes_chunks(tmp_path):
+    transformers = pytest.importorskip("transformers")
+    words = sorted({w.strip(".!").lower() for w in TEXT.split()} | {"!", "."})
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words + ["##s"]
+    (tmp_path / "vocab.txt").write_text("\n".join(vocab))
+    tok = transformers.BertTokenizerFast(vocab_file=str(tmp_path / "vocab.txt"))
+
+    chunker = make_chunker(tok, model_max_tokens=40)  # 38 content tokens + [CLS]/[SEP]
+    assert chunker.max_tokens == 38
+    chunks = list(chunk_text(TEXT, chunker, {"source": "manual"}))
+    _check_offsets(TEXT, chunks)
+    assert all(len(tok(c["text"])["input_ids"]) <= 40 for c in chunks)  # nothing truncated at embed time
+    assert chunks[0]["metadata"]["source"] == "manual"
+
+
+def test_make_chunker_respects_settings(monkeypatch):
+    monkeypatch.setattr(chunking, "settings", dataclasses.replace(
+        chunking.settings, chunk_size_tokens=100, chunk_overlap=0.2, chunk_snap_sentences=False))
+    c = make_chunker()
+    assert (c.max_tokens, c.overlap_tokens, c.snap_sentences) == (100, 20, False)
+    assert isinstance(c.tokenizer, RegexTokenizer)
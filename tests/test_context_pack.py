@@ -0,0 +1,85 @@
+# tests/test_context_pack.py
+import dataclasses
+import re
+
+import pytest
+
+import app.pipeline as pipeline_mod
+from app.chunking import RegexTokenizer
+from app.context_pack import ContextPacker, count_tokens, split_sentences
+from app.fakes import FakeLLM, FakeReranker, FakeRetriever
+
+FILLER = "The operator should keep the maintenance log up to date and follow the site safety rules at all times."
+
+
+def _ctx(text, source, score):
+    return {"text": text, "metadata": {"source": source, "position": 0}, "rerank_score": score}
+
+
+def test_split_sentences():
+    assert split_sentences("Check the seal. Replace PN-4471-B! Done?\n\nNext part 2.5 mm.") == [
+        "Check the seal.", "Replace PN-4471-B!", "Done?", "Next part 2.5 mm."]
+
+
+def test_pack_keeps_relevant_sentences_under_budget():
+    a = " ".join([FILLER] * 3 + ["Error E42 means the pump ran dry and the seal must be replaced."] + [FILLER] * 3)
+    b = " ".join([FILLER] * 4 + ["Order seal kit PN-4471-B for the E42 pump repair."])
+    contexts = [_ctx(a, "manual-a", 0.9), _ctx(b, "manual-b", 0.7)]
+    tok = RegexTokenizer()
+    packer = ContextPacker(tok, budget_tokens=90)
+    packed, stats = packer.pack("what does error E42 on the pump mean", contexts, "Question: what does error E42 mean")
+
+    assert [c["metadata"]["source"] for c in packed] == ["manual-a", "manual-b"]
+    assert "Error E42 means the pump ran dry" in packed[0]["prompt_text"]
+    assert "PN-4471-B" in packed[1]["prompt_text"]
+    assert packed[0]["text"] == a  # display text untouched
+    assert stats["context_tokens_after"] < stats["context_tokens_before"]
+    assert stats["context_tokens_after"] + count_tokens(tok, ["Question: what does error E42 mean"])[0] <= 90
+    assert stats["sentences_kept"] < stats["sentences_total"]
+
+
+def test_pack_leaves_small_contexts_alone():
+    contexts = [_ctx("Paris is the capital of France.", "fr", 1.0)]
+    packed, stats = ContextPacker(RegexTokenizer(), 1000).pack("capital", contexts, "Question: capital")
+    assert packed is contexts and stats["context_tokens_before"] == stats["context_tokens_after"]
+
+
+def test_count_tokens_with_a_hf_tokenizer(tmp_path):
+    transformers = pytest.importorskip("transformers")
+    (tmp_path / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "pump", "seal", "##s", "."]))
+    tok = transformers.BertTokenizerFast(vocab_file=str(tmp_path / "vocab.txt"))
+    assert count_tokens(tok, ["pump seals.", "seal"]) == [3, 1]
+
+
+class PromptLLM(FakeLLM):
+    def generate_with_meta(self, messages, temperature=0.2, max_tokens=600):
+        self.prompt = messages[-1]["content"]
+        return super().generate_with_meta(messages, temperature, max_tokens)
+
+
+PUMP_NOTES = ["The pump is mounted on the left side of the frame.",
+              "Pump maintenance should be logged in the site book every week.",
+              "The pump housing is painted grey to match the other plant equipment.",
+              "Pump spare parts ship from the central depot within two working days.",
+              "Clean the pump inlet strainer before each shift starts.",
+              "The pump error log is kept for twelve months."]
+
+
+def test_pipeline_packs_prompt_and_keeps_citations(monkeypatch):
+    monkeypatch.setattr(pipeline_mod, "settings", dataclasses.replace(pipeline_mod.settings, context_token_budget=220))
+    llm = PromptLLM()
+    pipe = pipeline_mod.RagPipeline(retriever=FakeRetriever(), llm=llm, reranker=FakeReranker())
+    pipe.answer_cache = None
+    for i, code in enumerate(["E42", "E17", "E99"]):
+        text = " ".join(PUMP_NOTES[:3] + [f"Pump error {code} means the impeller is blocked."] + PUMP_NOTES[3:])
+        pipe.ingest_document(text, source=f"manual-{i}")
+
+    out = pipe.answer("pump error impeller blocked")
+    m = out["metrics"]
+    assert m["prompt_tokens_saved"] > 0 and m["llm_latency_saved_est_s"] > 0 and m["context_pack_s"] > 0
+    context = llm.prompt.split("Context:\n", 1)[1]
+    assert context.count("impeller is blocked") == len(out["contexts"]) > 0
+    assert sum(context.count(note) for note in PUMP_NOTES) < 3 * len(PUMP_NOTES)
+    cited = sorted({int(n) for n in re.findall(r"^\[(\d+)\]", context, re.M)})
+    assert cited == [s["n"] for s in out["sources"]] == list(range(1, len(out["sources"]) + 1))
+    assert any(len(c["prompt_text"]) < len(c["text"]) for c in out["contexts"])  # display text stays whole
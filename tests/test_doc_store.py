@@ -0,0 +1,108 @@
+import dataclasses
+
+import numpy as np
+
+import app.retriever_pine as rp
+from app.doc_store import DocStore
+from app.fakes import FakeLLM, FakeReranker, hash_embed
+from app.pipeline import RagPipeline
+
+
+class MemoryIndex:
+    """Pinecone-shaped in-memory index that keeps exactly what was upserted."""
+
+    def __init__(self):
+        self.items = {}
+
+    def upsert(self, vectors, namespace):
+        for v in vectors:
+            self.items[(namespace, v["id"])] = v
+
+    def delete(self, ids, namespace):
+        for i in ids:
+            self.items.pop((namespace, i), None)
+
+    def query(self, vector, top_k, include_metadata, namespace, include_values=False):
+        q = np.asarray(vector, dtype=np.float32)
+        scored = sorted(((float(np.dot(q, v["values"])), v) for (ns, _), v in self.items.items() if ns == namespace),
+                        key=lambda sv: -sv[0])[:top_k]
+        return {"matches": [{"id": v["id"], "score": s, "metadata": v["metadata"],
+                             **({"values": list(v["values"])} if include_values else {})} for s, v in scored]}
+
+
+class DummyPC:
+    def __init__(self, index): self._index = index
+    def list_indexes(self): return {"indexes": [{"name": rp.settings.pinecone_index, "dimension": 384}]}
+    def Index(self, name): return self._index
+
+
+class HashModel:
+    def encode(self, texts, normalize_embeddings=True):
+        return hash_embed(list(texts))
+
+
+def _retriever(monkeypatch, tmp_path, index):
+    monkeypatch.setattr(rp, "settings", dataclasses.replace(
+        rp.settings, doc_store_enabled=True, doc_store_path=str(tmp_path / "docs.sqlite")))
+    monkeypatch.setattr(rp, "Pinecone", lambda api_key: DummyPC(index))
+    monkeypatch.setattr(rp, "SentenceTransformer", lambda name: HashModel())
+    return rp.PineconeRetriever()
+
+
+def test_store_roundtrip(tmp_path):
+    store = DocStore(tmp_path / "docs.sqlite")
+    store.put_many("ns", [("a:0", "alpha"), ("a:1", "beta")])
+    store.put_many("other", [("a:0", "elsewhere")])
+    assert store.get_many("ns", ["a:0", "a:1", "missing"]) == {"a:0": "alpha", "a:1": "beta"}
+    store.delete("ns", ["a:0"])
+    assert store.get_many("ns", ["a:0"]) == {} and store.get_many("other", ["a:0"]) == {"a:0": "elsewhere"}
+
+
+def test_text_stays_local_and_is_hydrated(monkeypatch, tmp_path):
+    index = MemoryIndex()
+    r = _retriever(monkeypatch, tmp_path, index)
+    chunks = [{"text": f"Pump {i} needs a new seal", "metadata": {"source": "m", "position": i, "page": 1}}
+              for i in range(5)]
+    r.upsert_chunks(chunks, namespace="ns")
+
+    assert all("text" not in v["metadata"] and v["metadata"]["page"] == 1 for v in index.items.values())
+    hits = r.retrieve("pump seal", top_k=3, namespace="ns", min_score=0.0)
+    assert len(hits) == 3 and all(h["text"] == "" for h in hits)
+    r.hydrate(hits, namespace="ns")
+    assert all(h["text"].startswith("Pump") for h in hits)
+
+    r.delete_ids(["m:0"], namespace="ns")
+    assert r.doc_store.get_many("ns", ["m:0"]) == {}
+
+
+def test_pipeline_reads_text_only_for_mmr_survivors(monkeypatch, tmp_path):
+    index = MemoryIndex()
+    r = _retriever(monkeypatch, tmp_path, index)
+    r.upsert_chunks([{"text": f"Chunk {i} about pumps and seals, variant {i}.", "metadata": {"source": "m", "position": i}}
+                     for i in range(30)], namespace=rp.settings.pinecone_namespace)
+
+    looked_up = []
+    real_get_many = r.doc_store.get_many
+    monkeypatch.setattr(r.doc_store, "get_many", lambda ns, ids: looked_up.extend(ids) or real_get_many(ns, ids))
+    pipe = RagPipeline(retriever=r, llm=FakeLLM(), reranker=FakeReranker())
+    out = pipe.answer("pumps and seals")
+
+    assert out["contexts"] and all(c["text"].startswith("Chunk") for c in out["contexts"])
+    assert 0 < len(looked_up) <= 12 < 25
+
+
+def test_hits_missing_from_the_doc_store_are_dropped(monkeypatch, tmp_path, capsys):
+    index = MemoryIndex()
+    r = _retriever(monkeypatch, tmp_path, index)
+    r.upsert_chunks([{"text": f"Pump {i} needs a new seal", "metadata": {"source": "m", "position": i}}
+                     for i in range(3)], namespace="ns")
+    r.doc_store.delete("ns", ["m:1"])  # e.g. a container that does not share the ingest host's store
+
+    hits = r.hydrate(r.retrieve("pump seal", top_k=3, namespace="ns", min_score=0.0), namespace="ns")
+    assert sorted(h["id"] for h in hits) == ["m:0", "m:2"] and all(h["text"] for h in hits)
+    assert "m:1" in capsys.readouterr().out
+
+    r.doc_store.delete("ns", ["m:0", "m:2"])
+    monkeypatch.setattr(rp, "settings", dataclasses.replace(rp.settings, pinecone_namespace="ns"))
+    out = RagPipeline(retriever=r, llm=FakeLLM(), reranker=FakeReranker()).answer("pump seal")
+    assert out["contexts"] == [] and out["sources"] == []
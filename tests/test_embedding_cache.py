@@ -0,0 +1,79 @@
+# tests/test_embedding_cache.py
+import multiprocessing as mp
+import numpy as np
+from app.embedding_cache import EmbeddingCache
+
+def _vec(seed, dim=8):
+    v = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+def test_hits_after_put_and_normalized_keys(tmp_path):
+    cache = EmbeddingCache(tmp_path, model_name="m", dim=8, max_entries=16, memory_items=4)
+    cache.put_many(["hello  world", "other"], np.stack([_vec(1), _vec(2)]))
+    found, missing = cache.get_many(["hello world", "other", "new text"])
+    assert missing == [2]
+    assert np.allclose(found[0], _vec(1))
+    # A second process-local instance reads from disk, not the LRU front
+    fresh = EmbeddingCache(tmp_path, model_name="m", dim=8, max_entries=16, memory_items=4)
+    found, missing = fresh.get_many(["other"])
+    assert missing == [] and np.allclose(found[0], _vec(2))
+    assert fresh.stats()["disk_hits"] == 1
+
+def test_model_switch_invalidates(tmp_path):
+    EmbeddingCache(tmp_path, model_name="a", dim=8, max_entries=16).put_many(["x"], _vec(3)[None])
+    other = EmbeddingCache(tmp_path, model_name="b", dim=8, max_entries=16)
+    assert other.get_many(["x"])[1] == [0]
+    assert other.stats()["entries"] == 0
+
+def test_size_based_eviction_reuses_lru_slots(tmp_path):
+    cache = EmbeddingCache(tmp_path, model_name="m", dim=8, max_entries=3, memory_items=1)
+    for i in range(5):
+        cache.put_many([f"t{i}"], _vec(i)[None])
+    s = cache.stats()
+    assert s["entries"] == 3 and s["evictions"] == 2
+    found, missing = cache.get_many(["t4", "t0"])
+    assert np.allclose(found[0], _vec(4)) and missing == [1]
+
+def _writer(path, start):
+    cache = EmbeddingCache(path, model_name="m", dim=8, max_entries=256)
+    for i in range(start, start + 40):
+        cache.put_many([f"k{i}"], _vec(i)[None])
+
+def test_concurrent_processes_share_cache(tmp_path):
+    EmbeddingCache(tmp_path, model_name="m", dim=8, max_entries=256)
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=_writer, args=(str(tmp_path), s)) for s in (0, 40, 80)]
+    for p in procs: p.start()
+    for p in procs: p.join(60)
+    assert all(p.exitcode == 0 for p in procs)
+    cache = EmbeddingCache(tmp_path, model_name="m", dim=8, max_entries=256)
+    found, missing = cache.get_many([f"k{i}" for i in range(120)])
+    assert missing == []
+    assert all(np.allclose(found[i], _vec(i)) for i in range(120))
+
+def test_retriever_embed_skips_cached_texts(monkeypatch, tmp_path):
+    import dataclasses
+    from app.config import settings
+    from app.retriever_pine import PineconeRetriever
+
+    class DummyPC:
+        def __init__(self, *a, **k): pass
+        def list_indexes(self): return {"indexes": [{"name": settings.pinecone_index}]}
+        def Index(self, name): return object()
+    class CountingEmbed:
+        seen = []
+        def encode(self, texts, normalize_embeddings=True):
+            self.seen.extend(texts)
+            return [[float(len(t))] + [0.0] * 383 for t in texts]
+
+    enc = CountingEmbed()
+    monkeypatch.setattr("app.retriever_pine.settings", dataclasses.replace(
+        settings, embedding_cache_enabled=True, embedding_cache_dir=str(tmp_path)))
+    monkeypatch.setattr("app.retriever_pine.Pinecone", lambda api_key: DummyPC())
+    monkeypatch.setattr("app.retriever_pine.SentenceTransformer", lambda name: enc)
+
+    r = PineconeRetriever()
+    first = r.embed_array(["a", "bb"])
+    second = r.embed_array(["bb", "ccc", "a"])
+    assert enc.seen == ["a", "bb", "ccc"]
+    assert np.allclose(second[0], first[1]) and np.allclose(second[2], first[0])
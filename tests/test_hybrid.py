@@ -0,0 +1,108 @@
+import dataclasses
+
+import app.retriever_pine as rp
+from app.bm25 import BM25Index, BM25Store, bm25_terms, fuse
+from app.fakes import hash_embed
+from app.retriever_local import LocalVectorRetriever
+
+DOCS = {
+    "m:0": "Error E42 means the pump ran dry; order seal kit PN-4471-B.",
+    "m:1": "Error E17 means the motor is overheating; check the fan.",
+    "m:2": "Clean the filter every month and inspect the hose clamps.",
+    "m:3": "The pump impeller must be replaced when the housing cracks.",
+}
+
+
+def test_terms_keep_codes_whole_and_split():
+    tf = bm25_terms("Order PN-4471-B for the E42 pump, the pump.")
+    assert tf["pn-4471-b"] == 1 and tf["4471"] == 1 and tf["e42"] == 1 and tf["pump"] == 2
+    assert "the" not in tf and "for" not in tf
+
+
+def test_index_scores_survive_merge_and_removal():
+    idx = BM25Index()
+    for doc_id, text in DOCS.items():
+        idx.add(doc_id, bm25_terms(text))
+    before = idx.search(bm25_terms("pump E42"), 3)
+    assert before[0][0] == "m:0"
+    idx.merge()
+    assert idx.search(bm25_terms("pump E42"), 3) == before
+
+    idx.remove("m:0")
+    idx.add("m:1", bm25_terms("Error E42 is now documented here."))  # overwrite
+    hits = idx.search(bm25_terms("E42"), 3)
+    assert [h for h, _ in hits] == ["m:1"] and len(idx) == 3
+    idx.merge()
+    assert idx.search(bm25_terms("E42"), 3) == hits
+
+
+def test_store_persists_and_replays_across_instances(tmp_path):
+    a = BM25Store(tmp_path)
+    a.upsert(DOCS.items())
+    b = BM25Store(tmp_path)  # another process: snapshot (none yet) + log replay
+    assert b.search("PN-4471-B", 2)[0][0] == "m:0"
+
+    with a._lock:
+        a._compact()
+    a.delete(["m:0"])
+    c = BM25Store(tmp_path)
+    assert c.count() == 3 and not c.search("4471", 2)
+    assert b.search("4471", 2) == []  # b catches up on its next query
+
+
+def test_reader_reloads_after_another_instance_compacts(monkeypatch, tmp_path):
+    monkeypatch.setattr(BM25Store, "COMPACT_MIN_ENTRIES", 2)
+    reader, writer = BM25Store(tmp_path), BM25Store(tmp_path)
+    writer.upsert([("a:0", "alpha pump"), ("a:1", "beta valve")])
+    assert reader.search("alpha", 2)[0][0] == "a:0"
+
+    writer.upsert([(f"g:{i}", f"gamma seal {i}") for i in range(4)])  # compacts: the log is left empty
+    assert writer.db.execute("SELECT COUNT(*) FROM log").fetchone()[0] == 0
+    assert len(reader.search("gamma", 10)) == 4 and reader.count() == 6
+
+
+def test_reingesting_the_same_docs_does_not_grow_the_index(tmp_path):
+    store = BM25Store(tmp_path)
+    for _ in range(30):
+        store.upsert(DOCS.items())
+    with store._lock:
+        store._compact()
+    assert len(store.index.ids) == len(store.index.doc_len) == len(DOCS)
+    reopened = BM25Store(tmp_path)
+    assert len(reopened.index.ids) == len(DOCS) and reopened.search("PN-4471-B", 2)[0][0] == "m:0"
+    reopened.upsert([("m:4", "New seal kit for the E42 pump.")])  # slots keep working after renumbering
+    assert {h for h, _ in reopened.search("E42", 5)} == {"m:0", "m:4"}
+    assert reopened.search("E17", 5)[0][0] == "m:1"
+
+
+def test_fuse_rrf_and_weighted():
+    dense = [{"id": "a", "score": 0.9}, {"id": "b", "score": 0.5}]
+    sparse = [("c", 12.0), ("b", 3.0)]
+    rrf = fuse(dense, sparse, 3)
+    assert rrf[0][0] == "b" and {i for i, _ in rrf} == {"a", "b", "c"}
+    weighted = fuse(dense, sparse, 2, method="weighted", sparse_weight=3.0)
+    assert [i for i, _ in weighted] == ["c", "a"]  # min-max: each list's weakest hit scores 0
+
+
+class HashModel:
+    def encode(self, texts, normalize_embeddings=True):
+        return hash_embed(list(texts))
+
+
+def test_local_retriever_hybrid(monkeypatch, tmp_path):
+    monkeypatch.setattr(rp, "SentenceTransformer", lambda name: HashModel())
+    monkeypatch.setattr(rp, "settings", dataclasses.replace(rp.settings, hybrid_search_enabled=True))
+    r = LocalVectorRetriever(root=tmp_path)
+    r.upsert_chunks([{"text": t, "metadata": {"source": i.split(":")[0], "position": int(i.split(":")[1])}}
+                     for i, t in DOCS.items()], namespace="ns")
+
+    query = "part 4471"  # dense has nothing to match: "pn-4471-b" is one opaque word to the embedding
+    dense = r.retrieve_by_vector(r.embed_array([query])[0], top_k=2, namespace="ns", min_score=0.2)
+    assert "m:0" not in {h["id"] for h in dense}
+
+    hits = r.retrieve(query, top_k=2, namespace="ns", min_score=0.2, include_values=True)
+    assert hits[0]["id"] == "m:0" and hits[0]["text"].startswith("Error E42") and "bm25_score" in hits[0]
+    assert len(hits[0]["values"]) == 384 and hits[0]["query_values"]
+
+    r.delete_ids(["m:0"], namespace="ns")
+    assert "m:0" not in {h["id"] for h in r.retrieve(query, top_k=2, namespace="ns", min_score=0.2)}
@@ -0,0 +1,98 @@
+import pytest
+
+from app.chunking import StreamingChunker
+from app.fakes import FakeRetriever
+from app.ingest import extract_pdf_pages, open_pdf, stream_ingest
+
+pytest.importorskip("PyPDF2")
+
+
+def make_pdf(pages):
+    """Minimal uncompressed PDF with one line of Helvetica text per page."""
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objs)} 0 R "
+                    f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = b"%PDF-1.4\n", []
+    for i, o in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{o}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{off:010d} 00000 n \n" for off in offsets).encode()
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def _page_texts(n, words=40):
+    return [" ".join(f"p{p}w{i}" for i in range(words)) for p in range(1, n + 1)]
+
+
+def test_chunks_across_pages_keep_page_numbers():
+    texts = _page_texts(9, words=37)
+    chunks = list(StreamingChunker(max_tokens=60, overlap_tokens=6).chunks(enumerate(texts, start=1), {"source": "s"}))
+    joined = "\n\n".join(texts)
+    for c in chunks:
+        md = c["metadata"]
+        assert c["text"] == joined[md["start_char"]:md["end_char"]]
+        assert md["page"] == int(c["text"].split()[0][1:].split("w")[0])
+        assert md["page_end"] == int(c["text"].split()[-1][1:].split("w")[0])
+
+
+def test_extract_pdf_pages_in_order_with_process_pool(tmp_path):
+    texts = _page_texts(11, words=5)
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf(texts))
+    pages = list(extract_pdf_pages(path, workers=2, pages_per_task=3))
+    assert [p for p, _ in pages] == list(range(1, 12))
+    assert [t.split() for _, t in pages] == [t.split() for t in texts]
+
+
+def test_open_pdf_parses_once_without_a_pool(tmp_path, monkeypatch):
+    import PyPDF2
+    texts = _page_texts(4, words=5)
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf(texts))
+    opened = []
+    real_reader = PyPDF2.PdfReader
+    monkeypatch.setattr(PyPDF2, "PdfReader", lambda p: opened.append(p) or real_reader(p))
+    n_pages, pages = open_pdf(path, workers=1)
+    assert n_pages == 4 and [t.split() for _, t in pages] == [t.split() for t in texts]
+    assert len(opened) == 1
+
+
+def test_stream_ingest_overlaps_stages_and_reports_progress():
+    r = FakeRetriever()
+    events, upserted = [], []
+
+    def on_progress(e):
+        events.append(e)
+        upserted.append(len(r._ids))
+
+    texts = _page_texts(30)
+    stats = stream_ingest(r, enumerate(texts, start=1), {"source": "book.pdf"}, total_pages=30,
+                          on_progress=on_progress, batch_chunks=4, queue_depth=2,
+                          chunker=StreamingChunker(max_tokens=60))
+    expected = list(StreamingChunker(max_tokens=60).chunks(enumerate(texts, start=1)))
+    assert stats["pages"] == 30 and stats["chunks"] == len(expected) == len(r._ids)
+    assert [e["page"] for e in events if e["stage"] == "page"] == list(range(1, 31))
+    for e, n in zip(events, upserted):
+        if e["stage"] == "page":  # reported only once every chunk starting on or before it is upserted
+            assert n >= sum(1 for c in expected if c["metadata"]["page"] <= e["page"])
+    batches = [e for e in events if e["stage"] == "batch"]
+    assert [e["chunks"] for e in batches] == [4] * (len(expected) // 4) + ([len(expected) % 4] if len(expected) % 4 else [])
+    assert all("page" in md and "page_end" in md for md in r._meta)
+
+
+def test_stream_ingest_surfaces_upsert_errors():
+    class Failing(FakeRetriever):
+        def upsert_vectors(self, vectors, namespace=None):
+            raise RuntimeError("index unavailable")
+
+    with pytest.raises(RuntimeError, match="index unavailable"):
+        stream_ingest(Failing(), enumerate(_page_texts(50), start=1), {"source": "x"}, batch_chunks=1, queue_depth=1)
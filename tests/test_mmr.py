@@ -0,0 +1,37 @@
+# tests/test_mmr.py
+import numpy as np
+from app.utils import mmr
+
+def _reference_mmr(E, q, top_k, lam):
+    # Straightforward loop version of MMR used as ground truth
+    E = E / np.linalg.norm(E, axis=1, keepdims=True)
+    q = q / np.linalg.norm(q)
+    rel = E @ q
+    selected = [int(np.argmax(rel))]
+    while len(selected) < min(top_k, len(E)):
+        best, best_j = -1e9, None
+        for j in range(len(E)):
+            if j in selected:
+                continue
+            score = lam * rel[j] - (1 - lam) * max(E[j] @ E[s] for s in selected)
+            if score > best:
+                best, best_j = score, j
+        selected.append(best_j)
+    return selected
+
+def test_mmr_matches_reference():
+    rng = np.random.default_rng(0)
+    E = rng.normal(size=(60, 16)).astype(np.float32)
+    q = rng.normal(size=16).astype(np.float32)
+    assert mmr(E, top_k=10, lambda_mult=0.55, query_embedding=q) == _reference_mmr(E, q, 10, 0.55)
+
+def test_mmr_prefers_diverse_docs_and_accepts_lists():
+    q = [1.0, 0.0]
+    docs = [[1.0, 0.0], [0.99, 0.01], [0.7, 0.7]]
+    picked = mmr(docs, top_k=2, lambda_mult=0.3, query_embedding=q)
+    assert picked == [0, 2]  # near-duplicate of doc 0 is skipped
+
+def test_mmr_edge_cases():
+    assert mmr(np.zeros((0, 4), dtype=np.float32), top_k=3) == []
+    E = np.eye(3, dtype=np.float32)
+    assert sorted(mmr(E, top_k=10)) == [0, 1, 2]  # never selects more than n
@@ -0,0 +1,77 @@
+import dataclasses
+
+import numpy as np
+import pytest
+
+import app.retriever_pine as rp
+from app.onnx_embedder import length_buckets
+
+# int8 weights may move vectors a little; retrieval quality holds well above this
+PARITY_MIN_COSINE = 0.99
+
+WORDS = "paris is the capital of france berlin germany pump error code seal valve replace and a".split()
+TEXTS = ["paris is the capital of france", "pump error code", "replace the seal and the valve", "berlin",
+         "error code error code pump seal valve france germany paris berlin capital", "a"]
+
+
+def test_length_buckets_cap_items_and_padded_tokens():
+    lengths = [3, 40, 5, 4, 38, 6, 39]
+    batches = list(length_buckets(lengths, batch_size=3, max_batch_tokens=80))
+    assert sorted(int(i) for b in batches for i in b) == list(range(7))
+    for b in batches:
+        assert len(b) <= 3
+        assert len(b) == 1 or len(b) * max(lengths[i] for i in b) <= 80
+    # sorted by length: short texts are never padded up to the long ones
+    assert [sorted(lengths[i] for i in b) for b in batches][0] == [3, 4, 5]
+
+
+@pytest.fixture(scope="module")
+def tiny_st(tmp_path_factory):
+    """Randomly initialised 2-layer BERT saved as a plain HF model (sentence-transformers adds mean pooling)."""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("sentence_transformers")
+    path = tmp_path_factory.mktemp("tiny-embedder")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS
+    (path / "vocab.txt").write_text("\n".join(vocab))
+    tok = transformers.BertTokenizerFast(vocab_file=str(path / "vocab.txt"))
+    torch.manual_seed(0)
+    cfg = transformers.BertConfig(vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+                                  intermediate_size=128, max_position_embeddings=64)
+    transformers.BertModel(cfg).save_pretrained(path)
+    tok.save_pretrained(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_onnx_matches_pytorch(tiny_st, tmp_path, quantize):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    from sentence_transformers import SentenceTransformer
+    from app.onnx_embedder import OnnxEmbedder
+
+    ref = SentenceTransformer(tiny_st, device="cpu").encode(TEXTS, normalize_embeddings=True)
+    emb = OnnxEmbedder(tiny_st, cache_dir=tmp_path, quantize=quantize, threads=1, max_batch_tokens=24)
+    got = emb.encode(TEXTS, batch_size=4, normalize_embeddings=True)
+    assert got.shape == ref.shape and got.dtype == np.float32
+    assert (got * ref).sum(axis=1).min() >= PARITY_MIN_COSINE
+    # input order is restored after length bucketing; a single string gives one vector
+    # (int8 activations are quantized per batch, so batch-mates shift it very slightly)
+    assert float(emb.encode(TEXTS[1], normalize_embeddings=True) @ got[1]) > 0.999
+    # the export is cached: a second embedder reuses it
+    assert OnnxEmbedder(tiny_st, cache_dir=tmp_path, quantize=quantize).dim == ref.shape[1]
+
+
+def test_backend_selection(monkeypatch, tiny_st, tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    monkeypatch.setattr(rp, "settings", dataclasses.replace(
+        rp.settings, embedding_backend="onnx", onnx_cache_dir=str(tmp_path), embedding_model_name=tiny_st))
+    import app.onnx_embedder as oe
+    monkeypatch.setattr(oe, "settings", rp.settings)
+    from app.retriever_local import LocalVectorRetriever
+    r = LocalVectorRetriever(root=tmp_path / "vectors")
+    assert type(r.embedder).__name__ == "OnnxEmbedder"
+    tok, max_len = r.tokenizer()
+    assert tok.is_fast and max_len == 64
+    assert r.embed_array(["pump error code"]).shape == (1, 64)
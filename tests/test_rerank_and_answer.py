@@ -26,9 +26,39 @@ def test_answer_monkeypatch(monkeypatch):
     class DummyCohere:
         def rerank(self, model, query, documents, top_n):
             return DummyCohereRes()
-    monkeypatch.setattr("app.pipeline.cohere.Client", lambda api_key: DummyCohere())
+    monkeypatch.setattr("app.pipeline.cohere.Client", lambda api_key, **kw: DummyCohere())
 
     pipe = RagPipeline()
     out = pipe.answer("What is France's capital?")
     assert "Paris" in out["answer"]
     assert any(s["n"] == 1 for s in out["sources"])
+
+def test_mmr_uses_stored_vectors(monkeypatch):
+    # Retriever that returns stored vectors; embed() must not be called for hits
+    class VectorRetriever:
+        supports_values = True
+        def embed(self, texts): raise AssertionError("hits should not be re-embedded")
+        def retrieve(self, query, top_k, include_values=False):
+            assert include_values
+            q = [1.0, 0.0, 0.0]
+            return [
+                {"text": "Paris is the capital of France.", "metadata": {"source": "doc1", "position": 0},
+                 "values": [1.0, 0.0, 0.0], "query_values": q},
+                {"text": "The Eiffel Tower is in Paris.", "metadata": {"source": "doc2", "position": 1},
+                 "values": [0.0, 1.0, 0.0], "query_values": q},
+            ]
+    class DummyLLM:
+        def generate(self, messages, temperature=0.2, max_tokens=600):
+            return "Paris [1]."
+    class DummyCohere:
+        def rerank(self, model, query, documents, top_n):
+            return DummyCohereRes()
+
+    monkeypatch.setattr("app.pipeline.PineconeRetriever", lambda: VectorRetriever())
+    monkeypatch.setattr("app.pipeline.GroqLLM", lambda: DummyLLM())
+    monkeypatch.setattr("app.pipeline.cohere.Client", lambda api_key, **kw: DummyCohere())
+
+    out = RagPipeline().answer("What is France's capital?")
+    assert out["metrics"]["rerank_used"] is True
+    assert out["metrics"]["mmr_s"] >= 0.0
+    assert len(out["sources"]) == 2
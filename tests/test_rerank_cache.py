@@ -0,0 +1,56 @@
+# tests/test_rerank_cache.py
+from app.pipeline import RagPipeline
+from app.rerank_cache import RerankCache, doc_key
+
+class Res:
+    class R:
+        def __init__(self, idx, score): self.index, self.relevance_score = idx, score
+    def __init__(self, pairs): self.results = [self.R(i, s) for i, s in pairs]
+
+SCORES = {"alpha": 0.9, "beta": 0.5, "gamma": 0.7, "delta": 0.1}
+
+class ScoringCohere:
+    def __init__(self): self.sent = []
+    def rerank(self, model, query, documents, top_n):
+        self.sent.append(list(documents))
+        ranked = sorted(range(len(documents)), key=lambda i: SCORES[documents[i]], reverse=True)
+        return Res([(i, SCORES[documents[i]]) for i in ranked[:top_n]])
+
+def _pipe(monkeypatch, cohere_client):
+    monkeypatch.setattr("app.pipeline.PineconeRetriever", lambda: object())
+    monkeypatch.setattr("app.pipeline.GroqLLM", lambda: object())
+    monkeypatch.setattr("app.pipeline.cohere.Client", lambda api_key, **kw: cohere_client)
+    return RagPipeline()
+
+def _docs(*names):
+    return [{"id": f"{n}:0", "text": n, "metadata": {"source": n}} for n in names]
+
+def test_partial_overlap_sends_only_uncached(monkeypatch):
+    co = ScoringCohere()
+    pipe = _pipe(monkeypatch, co)
+
+    t1 = {}
+    first = pipe._rerank("q", _docs("alpha", "beta", "gamma"), t1)
+    assert [d["text"] for d in first] == ["alpha", "gamma", "beta"]
+    assert t1["rerank_cache_hit_rate"] == 0.0
+
+    t2 = {}
+    second = pipe._rerank("Q ", _docs("gamma", "delta", "alpha"), t2)
+    assert co.sent[-1] == ["delta"]
+    assert [d["text"] for d in second] == ["alpha", "gamma", "delta"]
+    assert abs(t2["rerank_cache_hit_rate"] - 2 / 3) < 1e-9
+
+    t3 = {}
+    pipe._rerank("q", _docs("beta", "alpha"), t3)
+    assert len(co.sent) == 2  # full hit: no provider call
+    assert t3["rerank_cache_hit_rate"] == 1.0 and t3["rerank_saved_s"] >= 0.0
+
+def test_keys_change_with_text_and_entries_expire():
+    a = {"id": "doc:0", "text": "old"}
+    b = {"id": "doc:0", "text": "new"}
+    assert doc_key(a) != doc_key(b)
+
+    cache = RerankCache(max_items=2, ttl_s=3600)
+    cache.put_many("m", "q", [("k1", 0.1), ("k2", 0.2), ("k3", 0.3)])
+    assert cache.get_many("m", "q", ["k1", "k2", "k3"]) == {1: 0.2, 2: 0.3}
+    assert cache.get_many("other-model", "q", ["k2"]) == {}
@@ -0,0 +1,49 @@
+# tests/test_reranker.py
+import dataclasses
+import pytest
+from app.config import settings
+from app import reranker as rr_mod
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+WORDS = ["paris", "is", "the", "capital", "of", "france", "berlin", "germany", "pump", "error", "code"]
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """Randomly initialised 1-layer BERT cross-encoder + WordPiece vocab, built offline."""
+    path = tmp_path_factory.mktemp("tiny-cross-encoder")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS
+    (path / "vocab.txt").write_text("\n".join(vocab))
+    tok = transformers.BertTokenizerFast(vocab_file=str(path / "vocab.txt"))
+    torch.manual_seed(0)
+    cfg = transformers.BertConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=1,
+                                  num_attention_heads=2, intermediate_size=64, num_labels=1)
+    transformers.BertForSequenceClassification(cfg).save_pretrained(path)
+    tok.save_pretrained(path)
+    return str(path)
+
+DOCS = ["paris is the capital of france", "berlin is the capital of germany", "pump error code",
+        "the capital", "france"]
+
+def test_cross_encoder_batches_match_single_pass(tiny_model):
+    batched = rr_mod.CrossEncoderReranker(tiny_model, max_length=16, batch_size=2, quantize=False)
+    single = rr_mod.CrossEncoderReranker(tiny_model, max_length=16, batch_size=64, quantize=False)
+    a = batched.score("capital of france", DOCS)
+    b = single.score("capital of france", DOCS)
+    assert a.shape == (5,) and ((a >= 0) & (a <= 1)).all()
+    assert abs(a - b).max() < 1e-4
+
+    ranked = batched.rerank("capital of france", DOCS, top_n=3)
+    assert len(ranked) == 3
+    assert [s for _, s in ranked] == sorted((s for _, s in ranked), reverse=True)
+
+def test_quantized_model_scores(tiny_model):
+    q = rr_mod.CrossEncoderReranker(tiny_model, max_length=16, quantize=True)
+    assert len(q.rerank("capital", DOCS, top_n=2)) == 2
+
+def test_make_reranker_uses_settings(monkeypatch, tiny_model):
+    monkeypatch.setattr(rr_mod, "settings", dataclasses.replace(
+        settings, reranker_backend="local", local_rerank_model=tiny_model))
+    r = rr_mod.make_reranker()
+    assert isinstance(r, rr_mod.CrossEncoderReranker) and r.backend == "local"
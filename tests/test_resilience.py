@@ -0,0 +1,144 @@
+# tests/test_resilience.py
+import dataclasses
+import threading
+import time
+
+import pytest
+
+import app.pipeline as pipeline_mod
+from app.fakes import FakeLLM, FakeReranker, FakeRetriever
+from app.resilience import CallPolicy, CircuitBreaker, CircuitOpenError, DeadlineExceeded
+
+
+class HttpError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_breaker_opens_fails_fast_and_recovers():
+    br = CircuitBreaker("cohere", failure_threshold=2, reset_s=0.05)
+    br.record_failure()
+    assert br.state == "closed"
+    br.record_failure()
+    assert br.state == "open"
+    with pytest.raises(CircuitOpenError):
+        br.before_call()
+    time.sleep(0.06)
+    br.before_call()  # the trial call
+    with pytest.raises(CircuitOpenError):
+        br.before_call()  # only one while half-open
+    br.record_success()
+    assert br.snapshot() == {"state": "closed", "failures": 0, "opens": 1}
+
+
+def _half_open_breaker():
+    br = CircuitBreaker("groq", failure_threshold=1, reset_s=0.01)
+    br.record_failure()
+    time.sleep(0.02)
+    return br
+
+
+def test_client_error_during_half_open_trial_closes_the_breaker():
+    policy = CallPolicy(_half_open_breaker(), retries=2, backoff_s=0.001)
+
+    def unauthorized():
+        raise HttpError(401)
+
+    with pytest.raises(HttpError):
+        policy.call(unauthorized)
+    assert policy.breaker.state == "closed"
+    assert policy.call(lambda: "ok") == "ok"
+
+
+def test_abandoned_or_interrupted_stream_releases_the_trial():
+    policy = CallPolicy(_half_open_breaker())
+
+    def stream():
+        with policy.guard():
+            yield "token"
+            yield "token"
+
+    events = stream()
+    next(events)
+    events.close()  # GeneratorExit: neither success nor failure
+    assert policy.breaker.state == "half_open"
+
+    with pytest.raises(KeyboardInterrupt):
+        with policy.guard():
+            raise KeyboardInterrupt
+    assert policy.breaker.state == "half_open"
+    assert policy.call(lambda: "ok") == "ok" and policy.breaker.state == "closed"
+
+
+def test_retries_transient_errors_only():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise HttpError(503)
+        return "ok"
+
+    stats = {}
+    policy = CallPolicy(CircuitBreaker("groq"), retries=2, backoff_s=0.001)
+    assert policy.call(flaky, stats=stats) == "ok" and stats["attempts"] == 3
+
+    def bad_request():
+        calls.append(1)
+        raise HttpError(400)
+
+    calls.clear()
+    with pytest.raises(HttpError):
+        policy.call(bad_request)
+    assert len(calls) == 1 and policy.breaker.failures == 0  # a 400 is not the provider being down
+
+
+def test_hedge_wins_over_a_stalled_request_and_budget_is_enforced():
+    first = threading.Event()
+
+    def sometimes_stalls():
+        if not first.is_set():
+            first.set()
+            time.sleep(1.0)
+            return "slow"
+        return "fast"
+
+    stats = {}
+    t0 = time.perf_counter()
+    out = CallPolicy(CircuitBreaker("cohere"), hedge_after_s=0.02).call(sometimes_stalls, budget_s=0.5, stats=stats)
+    assert out == "fast" and stats["hedges"] == 1 and time.perf_counter() - t0 < 0.5
+
+    t0 = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        CallPolicy(CircuitBreaker("cohere"), retries=3).call(lambda: time.sleep(1.0), budget_s=0.05)
+    assert time.perf_counter() - t0 < 0.5
+
+
+def _pipe(monkeypatch, reranker, **overrides):
+    monkeypatch.setattr(pipeline_mod, "settings", dataclasses.replace(pipeline_mod.settings, **overrides))
+    pipe = pipeline_mod.RagPipeline(retriever=FakeRetriever(), llm=FakeLLM(), reranker=reranker)
+    pipe.answer_cache = None
+    pipe.rerank_cache = None
+    pipe.ingest_document("Paris is the capital of France.", source="fr")
+    pipe.ingest_document("Berlin is the capital of Germany.", source="de")
+    return pipe
+
+
+def test_slow_rerank_falls_back_to_mmr_order_within_budget(monkeypatch):
+    pipe = _pipe(monkeypatch, FakeReranker(latency_s=1.0), rerank_budget_s=0.05, rerank_hedge_s=0.0)
+    t0 = time.perf_counter()
+    out = pipe.answer("capital of France")
+    assert time.perf_counter() - t0 < 0.5
+    m = out["metrics"]
+    assert m["rerank_used"] is False and m["rerank_fallback"] == "deadline" and out["sources"]
+    assert 0.04 < m["rerank_s"] < 0.5
+
+
+def test_failing_reranker_trips_its_breaker(monkeypatch):
+    reranker = FakeReranker(failure_rate=1.0)
+    pipe = _pipe(monkeypatch, reranker, breaker_failures=2, call_retries=0)
+    first, second, third = (pipe.answer("capital of France")["metrics"] for _ in range(3))
+    assert first["rerank_fallback"] == "error" and first["breakers"] == {"rerank": "closed", "llm": "closed"}
+    assert second["breakers"]["rerank"] == "open"
+    assert third["rerank_fallback"] == "circuit_open" and third["rerank_s"] < 0.01
@@ -0,0 +1,117 @@
+# tests/test_retriever_local.py
+import dataclasses
+import hashlib
+import numpy as np
+from app.config import settings
+from app.retriever_local import IVFIndex, LocalVectorRetriever
+
+class HashEmbed:
+    """Deterministic bag-of-words embedder so tests run offline."""
+    def encode(self, texts, normalize_embeddings=True):
+        out = np.zeros((len(texts), 384), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for w in t.lower().split():
+                out[i, int(hashlib.md5(w.strip(".,?").encode()).hexdigest(), 16) % 384] += 1.0
+        return out / (np.linalg.norm(out, axis=1, keepdims=True) + 1e-12)
+
+def _retriever(monkeypatch, tmp_path):
+    monkeypatch.setattr("app.retriever_pine.SentenceTransformer", lambda name: HashEmbed())
+    return LocalVectorRetriever(root=tmp_path)
+
+CHUNKS = [
+    {"text": "Paris is the capital of France.", "metadata": {"source": "geo", "position": 0}},
+    {"text": "Berlin is the capital of Germany.", "metadata": {"source": "geo", "position": 1}},
+    {"text": "Error code E42 means the pump is dry.", "metadata": {"source": "manual", "position": 0}},
+]
+
+def test_upsert_and_retrieve_exact(monkeypatch, tmp_path):
+    r = _retriever(monkeypatch, tmp_path)
+    stats = r.upsert_chunks(CHUNKS, namespace="ns")
+    assert stats["chunks"] == 3 and stats["batches"][0]["bytes"] > 0
+
+    hits = r.retrieve("capital of France", top_k=2, namespace="ns", min_score=0.0, include_values=True)
+    assert hits[0]["id"] == "geo:0"
+    assert hits[0]["metadata"]["source"] == "geo" and hits[0]["text"].startswith("Paris")
+    assert len(hits[0]["values"]) == 384 and len(hits[0]["query_values"]) == 384
+    assert hits[0]["score"] >= hits[1]["score"]
+
+def test_namespaces_overwrite_and_persistence(monkeypatch, tmp_path):
+    r = _retriever(monkeypatch, tmp_path)
+    r.upsert_chunks(CHUNKS, namespace="a")
+    assert r.retrieve("Paris", namespace="b", min_score=0.0) == []
+    # Same id again overwrites in place instead of adding a row
+    r.upsert_chunks([{"text": "Paris has the Eiffel Tower.", "metadata": {"source": "geo", "position": 0}}], namespace="a")
+    assert r.store("a").count() == 3
+
+    reopened = _retriever(monkeypatch, tmp_path)
+    hits = reopened.retrieve("Eiffel Tower", top_k=1, namespace="a", min_score=0.0)
+    assert hits[0]["text"] == "Paris has the Eiffel Tower."
+
+def test_ivf_recall_close_to_exact():
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(20, 32))
+    V = (centers[rng.integers(0, 20, 4000)] + 0.3 * rng.normal(size=(4000, 32))).astype(np.float32)
+    V /= np.linalg.norm(V, axis=1, keepdims=True)
+    ivf = IVFIndex.build(V, nlist=32)
+    recall = []
+    for q in V[:50]:
+        exact = set(np.argsort(-(V @ q))[:10])
+        cand = ivf.candidates(q, nprobe=8)
+        approx = set(cand[np.argsort(-(V[cand] @ q))[:10]])
+        recall.append(len(exact & approx) / 10)
+    assert np.mean(recall) >= 0.9
+
+def test_pipeline_runs_offline_on_local_backend(monkeypatch, tmp_path):
+    from app.pipeline import RagPipeline
+    local = dataclasses.replace(settings, vector_backend="local", local_store_dir=str(tmp_path))
+    monkeypatch.setattr("app.pipeline.settings", local)
+    monkeypatch.setattr("app.retriever_local.settings", local)
+    monkeypatch.setattr("app.retriever_pine.SentenceTransformer", lambda name: HashEmbed())
+    class DummyLLM:
+        def generate(self, messages, temperature=0.2, max_tokens=600):
+            return "Paris [1]."
+    class NoCohere:
+        def rerank(self, **k): raise RuntimeError("offline")
+    monkeypatch.setattr("app.pipeline.GroqLLM", lambda: DummyLLM())
+    monkeypatch.setattr("app.pipeline.cohere.Client", lambda api_key, **kw: NoCohere())
+
+    pipe = RagPipeline()
+    assert isinstance(pipe.retriever, LocalVectorRetriever)
+    pipe.ingest_document("Paris is the capital of France. " * 20, source="geo")
+    out = pipe.answer("What is the capital of France?")
+    assert out["sources"][0]["source"] == "geo"
+
+def test_delete_ids(monkeypatch, tmp_path):
+    r = _retriever(monkeypatch, tmp_path)
+    r.upsert_chunks(CHUNKS, namespace="ns")
+    assert r.delete_ids(["geo:0", "missing:9"], namespace="ns") == 1
+    hits = r.retrieve("capital of France", top_k=5, namespace="ns", min_score=0.0)
+    assert "geo:0" not in {h["id"] for h in hits} and len(hits) == 2
+    assert LocalVectorRetriever(root=tmp_path).store("ns").count() == 2
+
+def test_writes_join_the_existing_ivf_until_it_drifts(monkeypatch, tmp_path):
+    import app.retriever_local as rl
+    monkeypatch.setattr(rl, "settings", dataclasses.replace(
+        settings, local_ivf_min_vectors=100, local_ivf_nprobe=32, local_ivf_rebuild_drift=0.2))
+    builds = []
+    real_build = IVFIndex.build.__func__
+    monkeypatch.setattr(IVFIndex, "build", classmethod(lambda cls, V, **kw: builds.append(len(V)) or real_build(cls, V, **kw)))
+
+    rng = np.random.default_rng(0)
+    def vectors(start, n):
+        return [{"id": f"v{i}", "values": rng.normal(size=384).tolist(), "metadata": {}} for i in range(start, start + n)]
+
+    store = rl.NamespaceStore(tmp_path / "ns")
+    store.upsert(vectors(0, 400))
+    store.search(np.ones(384), 5)
+    assert builds == [400]
+
+    new = vectors(400, 10)
+    store.upsert(new)
+    assert store.search(new[3]["values"], 1)[0][0] == "v403" and builds == [400]  # assigned, no k-means
+    other = rl.NamespaceStore(tmp_path / "ns")  # another process picks up the saved index
+    assert other.search(new[3]["values"], 1)[0][0] == "v403" and builds == [400]
+
+    store.upsert(vectors(410, 100))
+    store.search(np.ones(384), 5)
+    assert builds == [400, 510]  # past the drift threshold
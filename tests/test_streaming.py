@@ -0,0 +1,51 @@
+# tests/test_streaming.py
+from types import SimpleNamespace as NS
+from app.llm import GroqLLM
+from app.pipeline import RagPipeline
+
+def _chunk(text=None, usage=None):
+    choices = [NS(delta=NS(content=text))] if text is not None else []
+    return NS(id="resp-1", choices=choices, usage=None, x_groq={"usage": usage} if usage else None)
+
+class FakeGroq:
+    def __init__(self, api_key=None):
+        self.chat = NS(completions=NS(create=self.create))
+    def create(self, model, messages, temperature, max_tokens, stream=False):
+        assert stream
+        return iter([_chunk("Paris "), _chunk("is the capital [1]."),
+                     _chunk(usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15})])
+
+def test_groq_stream_with_meta(monkeypatch):
+    monkeypatch.setattr("app.llm.Groq", FakeGroq)
+    events = list(GroqLLM().stream_with_meta([{"role": "user", "content": "q"}]))
+    assert [e["text"] for e in events if e["type"] == "token"] == ["Paris ", "is the capital [1]."]
+    done = events[-1]
+    assert done["type"] == "done" and done["text"] == "Paris is the capital [1]."
+    assert done["usage"]["total_tokens"] == 15 and done["id"] == "resp-1"
+    assert 0.0 <= done["ttft_s"] <= done["latency_s"]
+
+def test_answer_stream_event_order(monkeypatch):
+    class DummyRetriever:
+        def embed(self, texts): return [[1.0, 0.0] for _ in texts]
+        def retrieve(self, query, top_k):
+            return [{"text": "Paris is the capital of France.", "metadata": {"source": "doc1", "position": 0}}]
+    class NoCohere:
+        def rerank(self, **k): raise RuntimeError("offline")
+    monkeypatch.setattr("app.pipeline.PineconeRetriever", lambda: DummyRetriever())
+    monkeypatch.setattr("app.llm.Groq", FakeGroq)
+    monkeypatch.setattr("app.pipeline.cohere.Client", lambda api_key, **kw: NoCohere())
+
+    pipe = RagPipeline()
+    events = list(pipe.answer_stream("What is the capital of France?"))
+    kinds = [e["type"] for e in events]
+    assert kinds[0] == "sources" and kinds[-1] == "done" and kinds.count("token") == 2
+    assert events[0]["sources"][0]["source"] == "doc1"
+    done = events[-1]
+    assert done["answer"] == "Paris is the capital [1]."
+    assert done["metrics"]["llm_ttft_s"] <= done["metrics"]["llm_latency_s"]
+    assert done["metrics"]["llm_tokens"]["total_tokens"] == 15
+
+    # Second ask is served from the answer cache, still as a stream
+    again = list(pipe.answer_stream("what is the capital of france"))
+    assert again[-1]["metrics"]["cache_hit"] == "exact"
+    assert "".join(e["text"] for e in again if e["type"] == "token") == done["answer"]
@@ -0,0 +1,76 @@
+import json
+import threading
+import time
+from datetime import date
+
+from app.token_tracker import TokenTracker
+
+
+def _tracker(tmp_path, **kw):
+    kw.setdefault("flush_every", 1000)
+    kw.setdefault("flush_interval_s", 3600)
+    return TokenTracker(tmp_path / "usage.sqlite", daily_limit=1000, legacy_file=None, **kw)
+
+
+def test_response_counted_once(tmp_path):
+    t = _tracker(tmp_path)
+    assert t.add_tokens(100, "resp-1") == (900, 100, 1000)
+    # re-rendering the same turn must not count it again, before or after a flush
+    assert t.add_tokens(100, "resp-1") == (900, 100, 1000)
+    t.flush()
+    assert t.add_tokens(100, "resp-1") == (900, 100, 1000)
+    t.flush()
+    assert t.remaining() == (900, 100, 1000)
+    t.add_tokens(50)  # no id -> a new response
+    assert t.remaining()[1] == 150
+
+
+def test_writes_are_batched_and_shared(tmp_path):
+    a = _tracker(tmp_path, flush_every=3)
+    b = _tracker(tmp_path)
+    a.add_tokens(10, "r1")
+    a.add_tokens(10, "r2")
+    assert b.remaining()[1] == 0  # still buffered in a
+    a.add_tokens(10, "r3")  # third response triggers the flush
+    assert b.remaining()[1] == 30
+    b.add_tokens(10, "r3")  # same response seen by another worker
+    b.flush()
+    assert a.remaining()[1] == 30
+
+
+def test_concurrent_adds(tmp_path):
+    t = _tracker(tmp_path, flush_every=7)
+
+    def work(w):
+        for i in range(50):
+            t.add_tokens(1, f"{w}-{i}")
+
+    threads = [threading.Thread(target=work, args=(w,)) for w in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    t.flush()
+    assert _tracker(tmp_path).remaining()[1] == 200
+
+
+def test_imports_legacy_json(tmp_path):
+    legacy = tmp_path / "old.json"
+    legacy.write_text(json.dumps({"day": str(date.today()), "used": 123}))
+    t = TokenTracker(tmp_path / "usage.sqlite", daily_limit=1000, legacy_file=legacy)
+    assert t.remaining() == (877, 123, 1000)
+    # only seeds an empty day, so reopening doesn't double it
+    t.add_tokens(7, "x")
+    t.flush()
+    assert TokenTracker(tmp_path / "usage.sqlite", daily_limit=1000, legacy_file=legacy).remaining()[1] == 130
+
+
+def test_quiet_process_flushes_on_a_timer(tmp_path):
+    a = _tracker(tmp_path, flush_interval_s=0.05)
+    b = _tracker(tmp_path)
+    a.add_tokens(10, "r1")
+    assert b.remaining()[1] == 0
+    deadline = time.monotonic() + 5
+    while b.remaining()[1] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert b.remaining()[1] == 10 and a._timer is None  # no further add_tokens call needed
@@ -0,0 +1,109 @@
+# tests/test_tracing.py
+import dataclasses
+import socket
+import urllib.request
+
+import pytest
+
+import app.tracing as tracing
+from app.fakes import FakeLLM, FakeReranker, FakeRetriever
+from app.pipeline import RagPipeline
+
+
+@pytest.fixture
+def spans():
+    finished = []
+    tracing.reset()
+    tracing.enable(True)
+    tracing.add_exporter(finished.append)
+    yield finished
+    tracing.remove_exporter(finished.append)
+    tracing.enable(False)
+    tracing.reset()
+
+
+def _pipe():
+    pipe = RagPipeline(retriever=FakeRetriever(), llm=FakeLLM(), reranker=FakeReranker())
+    pipe.answer_cache = None
+    pipe.ingest_document("Paris is the capital of France.", source="fr")
+    pipe.ingest_document("Berlin is the capital of Germany.", source="de")
+    return pipe
+
+
+def test_off_by_default_is_a_shared_noop():
+    assert not tracing.enabled()
+    assert tracing.span("a") is tracing.span("b")
+    timings = {}
+    with tracing.timed("stage", timings, "stage_s"):
+        pass
+    assert timings["stage_s"] >= 0.0 and tracing.histogram("stage") is None
+
+
+def test_answer_spans_nest_and_metrics_split_embedding(spans):
+    out = _pipe().answer("capital of France")
+    by_name = {s.name: s for s in spans}
+    for name in ("query_embed", "vector_query", "mmr", "hydrate", "rerank", "context_build", "llm", "answer"):
+        assert name in by_name, name
+    assert by_name["vector_query"].parent is by_name["answer"]
+    assert by_name["vector_query"].attrs["hits"] >= 1 and by_name["llm"].attrs["completion_tokens"] == 20
+    assert by_name["context_build"].attrs["prompt_chars"] > 0
+    assert by_name["ingest"].attrs["chunks"] == 1
+
+    m = out["metrics"]
+    assert m["embed_s"] > 0 and m["context_s"] > 0
+    assert m["retrieve_s"] == by_name["vector_query"].duration  # same perf_counter measurement
+
+
+def test_upsert_batch_sizes_and_prometheus_endpoint(spans, monkeypatch, tmp_path):
+    import app.retriever_pine as rp
+    from app.fakes import hash_embed
+    from app.retriever_local import LocalVectorRetriever
+
+    class HashModel:
+        def encode(self, texts, normalize_embeddings=True):
+            return hash_embed(list(texts))
+
+    monkeypatch.setattr(rp, "SentenceTransformer", lambda name: HashModel())
+    r = LocalVectorRetriever(root=tmp_path)
+    r.upsert_chunks([{"text": f"chunk {i}", "metadata": {"source": "s", "position": i}} for i in range(3)], "ns")
+    upsert = [s for s in spans if s.name == "upsert_batch"][0]
+    assert upsert.attrs["vectors"] == 3 and upsert.attrs["bytes"] > 3 * 384 * 4
+    assert tracing.histogram("embed")["attrs"]["texts"] == 3
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(tracing, "settings", dataclasses.replace(tracing.settings, metrics_port=port))
+    server = tracing.start_metrics_server(host="127.0.0.1")
+    try:
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+        monkeypatch.setattr(tracing, "_server", None)
+    assert 'rag_span_duration_seconds_count{span="upsert_batch"} 1' in body
+    assert 'rag_span_duration_seconds_bucket{span="upsert_batch",le="+Inf"} 1' in body
+    assert 'rag_span_attr_total{span="upsert_batch",attr="vectors"} 3' in body
+
+
+def test_errors_are_counted(spans):
+    with pytest.raises(ValueError):
+        with tracing.span("boom"):
+            raise ValueError("x")
+    assert spans[-1].error == "ValueError" and tracing.histogram("boom")["errors"] == 1
+
+
+def test_opentelemetry_bridge(spans, monkeypatch):
+    sdk_trace = pytest.importorskip("opentelemetry.sdk.trace")
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    provider = sdk_trace.TracerProvider()
+    exporter = InMemorySpanExporter()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(tracing, "_otel_tracer", provider.get_tracer("test"))
+
+    _pipe().answer("capital of Germany")
+    otel = {s.name: s for s in exporter.get_finished_spans()}
+    assert otel["vector_query"].parent.span_id == otel["answer"].context.span_id
+    assert otel["llm"].attributes["completion_tokens"] == 20